@@ -0,0 +1,109 @@
+"""Adaptive V-channel threshold module"""
+
+import cv2
+import numpy as np
+
+# H/S 初筛时用于统计 V 均值的亮度范围，排除过暗和过曝的像素
+V_STATS_LOWER = 40
+V_STATS_UPPER = 230
+DEFAULT_V_MEAN = 128
+
+
+class AdaptiveVThreshold:
+    """
+    单次遍历的 V 通道自适应阈值。
+
+    每帧只做一次 H/S 初筛（V 取全范围），由初筛掩码下 V 通道的直方图
+    直接得到 [V_STATS_LOWER, V_STATS_UPPER] 内像素的 V 均值，
+    再用单通道的 V 窗口与 H/S 掩码求交得到最终掩码。
+    V 均值在帧间做指数滑动平均，阈值不会逐帧跳动；
+    某一帧没有候选像素时沿用上一次的均值。
+
+    alpha=1 时与 create_color_mask 中原有的自适应算法逐像素一致。
+    """
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.v_mean = None
+        self._bounds_key = None
+        self._hs_bounds = []
+        self._shape = None
+        self._buffers = None
+        self._hs_mask = None
+        self._hs_tmp = None
+        self._v = None
+        self._v_mask = None
+        self._levels = np.arange(256, dtype=np.float64)
+
+    def _update_bounds(self, bounds, tolerance):
+        key = tuple(
+            (tuple(int(x) for x in lower), tuple(int(x) for x in upper))
+            for lower, upper in bounds if lower is not None and upper is not None
+        ) + (tolerance,)
+        if key == self._bounds_key:
+            return
+        # H/S 范围的上下界只在阈值改变时构造一次，V 取全范围
+        self._hs_bounds = [
+            (np.array([lower[0], lower[1], 0], np.uint8),
+             np.array([upper[0], upper[1], 255], np.uint8))
+            for lower, upper in key[:-1]
+        ]
+        self._bounds_key = key
+
+    def _ensure_buffers(self, shape):
+        # 缓冲区只增不减，较小的图像（如 ROI 窗口）使用左上角的视图，避免尺寸变化时反复分配
+        if self._shape is None or shape[0] > self._shape[0] or shape[1] > self._shape[1]:
+            self._shape = shape if self._shape is None else (
+                max(shape[0], self._shape[0]), max(shape[1], self._shape[1]))
+            self._buffers = [np.empty(self._shape, np.uint8) for _ in range(4)]
+        h, w = shape
+        self._hs_mask, self._hs_tmp, self._v, self._v_mask = (b[:h, :w] for b in self._buffers)
+
+    def reset(self):
+        """丢弃平滑后的 V 均值，下一帧重新开始统计。"""
+        self.v_mean = None
+
+    def window(self, tolerance):
+        """当前的 V 阈值窗口 (v_lower, v_upper)。"""
+        v_mean = DEFAULT_V_MEAN if self.v_mean is None else self.v_mean
+        return int(max(0, v_mean - tolerance)), int(min(255, v_mean + tolerance))
+
+    def mask(self, hsv, bounds, tolerance, out=None):
+        """
+        对一幅 HSV 图像生成掩码。
+        bounds 为 [(lower, upper), ...]，只使用其中的 H/S 分量；tolerance 为 V 窗口的半宽。
+        """
+        self._update_bounds(bounds, tolerance)
+        self._ensure_buffers(hsv.shape[:2])
+        if out is None:
+            out = np.empty(hsv.shape[:2], np.uint8)
+
+        # 1. H/S 初筛，只做一次
+        hs_mask = self._hs_mask
+        for i, (lower, upper) in enumerate(self._hs_bounds):
+            if i == 0:
+                cv2.inRange(hsv, lower, upper, dst=hs_mask)
+            else:
+                cv2.inRange(hsv, lower, upper, dst=self._hs_tmp)
+                cv2.bitwise_or(hs_mask, self._hs_tmp, dst=hs_mask)
+
+        # 2. 初筛区域内 V 通道的直方图，取 [V_STATS_LOWER, V_STATS_UPPER] 内的均值
+        cv2.extractChannel(hsv, 2, dst=self._v)
+        hist = cv2.calcHist([self._v], [0], hs_mask, [256], [0, 256]).ravel()
+        hist = hist[V_STATS_LOWER:V_STATS_UPPER + 1]
+        count = hist.sum()
+        if count > 0:
+            frame_mean = float(hist @ self._levels[V_STATS_LOWER:V_STATS_UPPER + 1]) / count
+            if self.v_mean is None:
+                self.v_mean = frame_mean
+            else:
+                self.v_mean += self.alpha * (frame_mean - self.v_mean)
+        elif self.alpha >= 1:
+            # 不做平滑时与原算法一致：没有候选像素就退回默认值
+            self.v_mean = None
+
+        # 3. V 窗口与 H/S 掩码求交
+        v_lower, v_upper = self.window(tolerance)
+        cv2.inRange(self._v, v_lower, v_upper, dst=self._v_mask)
+        cv2.bitwise_and(hs_mask, self._v_mask, dst=out)
+        return out
@@ -0,0 +1,388 @@
+"""Detection pipeline benchmark
+
+用法:
+    python benchmark.py                          # 使用合成帧
+    python benchmark.py --source match.mjpeg     # 使用录像（或图片目录）
+    python benchmark.py --json result.json       # 输出机器可读结果
+    python benchmark.py --compare baseline.json  # 与之前的结果对比
+
+中控循环、共享状态和云台控制的模拟在 control_sim.py 中，测试在 tests/ 中。
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import platform
+import time
+import cv2
+import numpy as np
+import video_processor as vp
+from video_processor import CONFIG
+from frame_source import create_frame_source, FrameSourceError
+from color_lut import ColorLutMasker
+from adaptive_threshold import AdaptiveVThreshold
+from multi_target import MultiTargetTracker, find_blobs, select_target
+from white_balance import GreyWorldWhiteBalance
+
+
+@contextlib.contextmanager
+def config_override(**overrides):
+    """临时修改 CONFIG 中的选项，退出时恢复原值。"""
+    saved = {name: getattr(CONFIG, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(CONFIG, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(CONFIG, name, value)
+
+
+def make_synthetic_frames(count, seed=0):
+    """
+    生成与摄像头原始画面尺寸一致（旋转前 320x240）的合成 JPEG 帧：
+    带噪声的背景上随机放置一个红色方块。
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        img = rng.integers(0, 120, size=(240, 320, 3), dtype=np.uint8)
+        img = cv2.GaussianBlur(img, (5, 5), 0)
+        w, h = rng.integers(12, 60, size=2)
+        x = int(rng.integers(0, 320 - w))
+        y = int(rng.integers(0, 240 - h))
+        cv2.rectangle(img, (x, y), (x + int(w), y + int(h)), (20, 20, 200), -1)
+        ok, jpg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if ok:
+            frames.append(jpg.tobytes())
+    return frames
+
+
+def make_multi_blob_frames(count, blobs, seed=0):
+    """
+    生成每帧带有 blobs 个红色方块的合成 JPEG 帧序列，方块在帧间匀速移动、碰到边缘反弹，
+    用于测试多目标提取与轨迹关联。
+    """
+    rng = np.random.default_rng(seed)
+    size = rng.integers(8, 20, size=(blobs, 2))
+    pos = rng.uniform(0, 1, size=(blobs, 2)) * ([320, 240] - size)
+    vel = rng.uniform(-3, 3, size=(blobs, 2))
+    frames = []
+    for _ in range(count):
+        img = rng.integers(0, 120, size=(240, 320, 3), dtype=np.uint8)
+        img = cv2.GaussianBlur(img, (5, 5), 0)
+        for (x, y), (w, h) in zip(pos.astype(int), size):
+            cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)), (20, 20, 200), -1)
+        ok, jpg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if ok:
+            frames.append(jpg.tobytes())
+        pos += vel
+        bounce = (pos < 0) | (pos > [320, 240] - size)
+        vel[bounce] *= -1
+        pos = np.clip(pos, 0, [320, 240] - size)
+    return frames
+
+
+def load_frames(spec, limit):
+    """从录像文件或图片目录中读取最多 limit 帧。"""
+    source = create_frame_source(spec)
+    source.open()
+    frames = []
+    try:
+        for jpg in source.iter_frames():
+            frames.append(bytes(jpg))
+            if len(frames) >= limit:
+                break
+    finally:
+        source.close()
+    return frames
+
+
+def time_stage(func, inputs, repeat):
+    """对每个输入调用 func，重复 repeat 轮，返回每次调用的耗时（秒）。"""
+    for item in inputs:  # 预热
+        func(item)
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples):
+    samples_ms = np.asarray(samples) * 1000
+    mean_ms = float(samples_ms.mean())
+    return {
+        'calls': len(samples),
+        'mean_ms': mean_ms,
+        'p50_ms': float(np.percentile(samples_ms, 50)),
+        'p95_ms': float(np.percentile(samples_ms, 95)),
+        'p99_ms': float(np.percentile(samples_ms, 99)),
+        'fps': 1000 / mean_ms if mean_ms > 0 else float('inf'),
+    }
+
+
+# 基准测试中模拟的卡尔曼预测位置标准差（全分辨率像素）
+ROI_BENCH_SIGMA = 4.0
+
+def apply_white_balance_float(img):
+    """改用查找表之前的灰色世界白平衡：整幅图像转换为 float32 后逐像素相乘，作为对照。"""
+    img_float = img.astype(np.float32)
+    avg_b = np.mean(img_float[:, :, 0])
+    avg_g = np.mean(img_float[:, :, 1])
+    avg_r = np.mean(img_float[:, :, 2])
+    if avg_b == 0 or avg_g == 0 or avg_r == 0:
+        return img
+    avg_gray = (avg_b + avg_g + avg_r) / 3
+    img_float[:, :, 0] *= avg_gray / avg_b
+    img_float[:, :, 1] *= avg_gray / avg_g
+    img_float[:, :, 2] *= avg_gray / avg_r
+    return np.clip(img_float, 0, 255).astype(np.uint8)
+
+
+def make_processor(scale):
+    """与视频线程相同配置的 FrameProcessor，只有启用 USE_COLOR_LUT 时才使用查找表。"""
+    lut_masker = None
+    if CONFIG.USE_COLOR_LUT:
+        lut_masker = ColorLutMasker(CONFIG.COLOR_LUT_BITS)
+        lut_masker.update(vp.color_bounds())
+    return vp.FrameProcessor(scale, lut_masker, AdaptiveVThreshold(CONFIG.ADAPTIVE_V_EMA_ALPHA))
+
+
+def detect_frame_allocating(jpg, scale, kernel, adaptive_v):
+    """
+    引入 FrameProcessor 之前的逐帧流程：每一步都分配新的输出数组，
+    作为 end_to_end_alloc 阶段的对照。
+    """
+    img = cv2.rotate(vp.decode_frame(jpg, scale), cv2.ROTATE_90_CLOCKWISE)
+    if CONFIG.ENABLE_WHITE_BALANCE:
+        img = apply_white_balance_float(img)
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    if CONFIG.ADAPTIVE_V_CHANNEL:
+        color_mask = adaptive_v.mask(hsv, vp.color_bounds(), CONFIG.V_TOLERANCE)
+    else:
+        color_mask = vp.create_color_mask(hsv)
+    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, kernel)
+    color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_CLOSE, kernel)
+    target = vp.find_target(color_mask, scale)
+    if target is None:
+        return None
+    return vp.to_full_resolution(*target[1], scale)
+
+
+def roi_search_inputs(jpgs, scale, sigma=ROI_BENCH_SIGMA):
+    """
+    对每帧做一次整帧检测，以检测结果为预测位置（标准差 sigma 像素）计算搜索窗口，
+    返回 (jpg, roi) 列表；没有检测到目标或窗口过大的帧不包含在内。
+    """
+    inputs = []
+    processor = make_processor(scale)
+    with config_override(ROTATION_FREE_DETECTION=False):
+        for jpg in jpgs:
+            target = vp.detect_frame(jpg, processor)
+            if target is None:
+                continue
+            shape = cv2.rotate(vp.decode_frame(jpg, scale), cv2.ROTATE_90_CLOCKWISE).shape
+            roi = vp.roi_window((target[0], target[1], sigma, sigma), shape, scale)
+            if roi is not None:
+                inputs.append((jpg, roi))
+    return inputs
+
+
+def build_stages(jpgs, scale):
+    """
+    准备各阶段的输入数据，返回 (阶段名, 函数, 输入列表, CONFIG 覆盖项) 列表。
+    每个阶段的输入都是上一阶段预先算好的结果，因此各阶段可以单独计时。
+    """
+    kernel = vp.morphology_kernel(scale)
+    decoded = [vp.decode_frame(jpg, scale) for jpg in jpgs]
+    rotated = [cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE) for img in decoded]
+    hsvs = [cv2.cvtColor(img, cv2.COLOR_BGR2HSV) for img in rotated]
+    with config_override(ADAPTIVE_V_CHANNEL=False):
+        masks = [vp.create_color_mask(hsv) for hsv in hsvs]
+    opened = [cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel) for mask in masks]
+    closed = [cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel) for mask in opened]
+    lut_masker = ColorLutMasker(CONFIG.COLOR_LUT_BITS)
+    lut_masker.update(vp.color_bounds())
+    adaptive_v = AdaptiveVThreshold(CONFIG.ADAPTIVE_V_EMA_ALPHA)
+    processor = make_processor(scale)
+    preallocated = vp.FrameProcessor(scale)
+    balanced = np.empty_like(rotated[0])
+    white_balancer = GreyWorldWhiteBalance(
+        CONFIG.WHITE_BALANCE_INTERVAL, CONFIG.WHITE_BALANCE_SAMPLE_STEP, CONFIG.WHITE_BALANCE_BRIGHTNESS_SHIFT
+    )
+
+    # 以整帧检测结果作为“预测位置”构造 ROI 搜索的输入，模拟稳定追踪时的情形
+    roi_inputs = roi_search_inputs(jpgs, scale)
+
+    largest = []
+    for mask in closed:
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if contours:
+            largest.append(max(contours, key=cv2.contourArea))
+
+    return [
+        ('imdecode', lambda jpg: vp.decode_frame(jpg, scale), jpgs, {}),
+        ('rotate', lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE), decoded, {}),
+        ('white_balance_float', apply_white_balance_float, rotated, {}),
+        ('white_balance', vp.apply_white_balance, rotated, {}),
+        ('white_balance_cached', lambda img: white_balancer.apply(img, out=balanced), rotated, {}),
+        ('cvtColor', lambda img: cv2.cvtColor(img, cv2.COLOR_BGR2HSV), rotated, {}),
+        ('inRange_fixed', vp.create_color_mask, hsvs, {'ADAPTIVE_V_CHANNEL': False}),
+        ('inRange_adaptive', vp.create_color_mask, hsvs, {'ADAPTIVE_V_CHANNEL': True}),
+        ('adaptive_engine',
+         lambda hsv: adaptive_v.mask(hsv, vp.color_bounds(), CONFIG.V_TOLERANCE),
+         hsvs, {}),
+        ('mask_opencv',
+         lambda img: vp.create_color_mask(cv2.cvtColor(img, cv2.COLOR_BGR2HSV)),
+         rotated, {'ADAPTIVE_V_CHANNEL': False}),
+        ('mask_lut', lut_masker.mask, rotated, {}),
+        ('morph_open', lambda mask: cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel), masks, {}),
+        ('morph_close', lambda mask: cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel), opened, {}),
+        ('morph_preallocated', preallocated.morphology, masks, {}),
+        ('findContours',
+         lambda mask: cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE),
+         closed, {}),
+        ('moments', cv2.moments, largest, {}),
+        ('is_box_like', vp.is_box_like, largest, {'SHAPE_ANALYSIS_ENABLED': True}),
+        ('end_to_end_alloc', lambda jpg: detect_frame_allocating(jpg, scale, kernel, adaptive_v), jpgs,
+         {'ROTATION_FREE_DETECTION': False, 'USE_COLOR_LUT': False}),
+        ('end_to_end', lambda jpg: vp.detect_frame(jpg, processor), jpgs,
+         {'ROTATION_FREE_DETECTION': False}),
+        ('end_to_end_norotate', lambda jpg: vp.detect_frame(jpg, processor), jpgs,
+         {'ROTATION_FREE_DETECTION': True}),
+        ('end_to_end_roi', lambda item: vp.detect_frame(item[0], processor, roi=item[1]),
+         roi_inputs, {'ROTATION_FREE_DETECTION': False}),
+    ]
+
+
+def run_multi_target_benchmarks(frames, repeat, scale=1, blob_counts=(1, 5, 20)):
+    """
+    分别在每帧 1、5、20 个目标的合成序列上，比较单目标的 find_target
+    与多目标的 find_blobs、轨迹关联和目标选择的耗时。返回 {目标数: 结果}。
+    """
+    kernel = vp.morphology_kernel(scale)
+    all_results = {}
+    for blobs in blob_counts:
+        masks = []
+        for jpg in make_multi_blob_frames(frames, blobs):
+            img = cv2.rotate(vp.decode_frame(jpg, scale), cv2.ROTATE_90_CLOCKWISE)
+            with config_override(ADAPTIVE_V_CHANNEL=False):
+                mask = vp.create_color_mask(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+            masks.append(cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel))
+        detections = [
+            find_blobs(mask, scale, vp.MIN_CONTOUR_AREA)
+            for mask in masks
+        ]
+        # 轨迹关联的输入按帧依次送入同一个追踪器，帧间隔 50ms
+        tracker = MultiTargetTracker(CONFIG.TRACK_MAX_DISTANCE, CONFIG.TRACK_MAX_MISSED,
+                                     CONFIG.TRACK_MIN_HITS)
+        clock = itertools.count(0, 0.05)
+
+        def track(detection):
+            centers, _, areas = detection
+            tracker.update(centers * scale + (scale - 1) / 2, areas, next(clock))
+            return select_target(tracker.confirmed(), CONFIG.TARGET_POLICY, vp.LIGHT_CENTER)
+
+        results = {
+            'find_target': summarize(time_stage(lambda mask: vp.find_target(mask, scale), masks, repeat)),
+            'find_blobs': summarize(time_stage(
+                lambda mask: find_blobs(mask, scale, vp.MIN_CONTOUR_AREA), masks, repeat)),
+            'track_select': summarize(time_stage(track, detections, repeat)),
+        }
+        all_results[blobs] = results
+        print(f"[基准测试] 每帧 {blobs} 个目标，结束时共 {len(tracker.confirmed())} 条确认的轨迹，"
+              f"最大轨迹编号 {max((t.id for t in tracker.tracks), default=0)}")
+        print_results(results)
+    return all_results
+
+
+def run_benchmarks(jpgs, repeat, scale=1, only=None):
+    results = {}
+    for name, func, inputs, overrides in build_stages(jpgs, scale):
+        if only and name not in only:
+            continue
+        if not inputs:
+            print(f"[基准测试] 跳过 {name}：没有可用的输入")
+            continue
+        with config_override(**overrides):
+            results[name] = summarize(time_stage(func, inputs, repeat))
+    return results
+
+
+def print_results(results, baseline=None):
+    header = f"{'阶段':<18}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'帧/秒':>12}"
+    if baseline:
+        header += f"{'p50变化':>10}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<18}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+                f"{r['p99_ms']:>10.3f}{r['fps']:>12.1f}")
+        if baseline and name in baseline:
+            change = r['p50_ms'] / baseline[name]['p50_ms'] - 1
+            line += f"{change:>+10.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="颜色检测流水线分阶段基准测试")
+    parser.add_argument('--source', help="录像文件或 JPEG 图片目录，不指定则使用合成帧")
+    parser.add_argument('--frames', type=int, default=50, help="使用的帧数")
+    parser.add_argument('--repeat', type=int, default=20, help="每个阶段重复的轮数")
+    parser.add_argument('--scale', type=int, default=CONFIG.DECODE_SCALE, help="解码缩放倍数")
+    parser.add_argument('--stage', action='append', help="只运行指定的阶段，可多次指定")
+    parser.add_argument('--threads', type=int, help="OpenCV 使用的线程数")
+    parser.add_argument('--json', help="把结果写入 JSON 文件")
+    parser.add_argument('--compare', help="与之前保存的 JSON 结果对比")
+    parser.add_argument('--multi-target', action='store_true',
+                        help="只运行多目标提取与轨迹关联的基准测试（每帧 1、5、20 个目标）")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    if args.multi_target:
+        run_multi_target_benchmarks(args.frames, args.repeat, args.scale)
+        return
+
+    if args.source:
+        try:
+            jpgs = load_frames(args.source, args.frames)
+        except FrameSourceError as e:
+            print(f"[基准测试] 错误：{e}")
+            return
+    else:
+        jpgs = make_synthetic_frames(args.frames)
+    print(f"[基准测试] 帧数 {len(jpgs)}，重复 {args.repeat} 轮，解码缩放 1/{args.scale}")
+
+    results = run_benchmarks(jpgs, args.repeat, args.scale, args.stage)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.json:
+        report = {
+            'source': args.source or 'synthetic',
+            'frames': len(jpgs),
+            'repeat': args.repeat,
+            'scale': args.scale,
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"[基准测试] 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
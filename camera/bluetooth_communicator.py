@@ -4,12 +4,13 @@ import time
 import serial
 import struct
 from config import SERIAL_PORT, BAUD_RATE
+from metrics import REGISTRY
 
 # 定义一个缓冲区阈值，当待发送字节超过这个数时，我们就暂停写入
 # 这个值可以根据实际情况调整，例如设置为数据包长度的几倍
 BUFFER_THRESHOLD = 27
 
-def run_bluetooth_communication(shared_state, lock):
+def run_bluetooth_communication(state):
     """
     在一个独立线程中运行，负责连接蓝牙串口，并周期性地发送更新后的指令。
     此版本为终极优化版，可防止因缓冲区满导致的卡顿和超时。
@@ -17,7 +18,12 @@ def run_bluetooth_communication(shared_state, lock):
     print("[蓝牙线程] 线程已启动。")
     ser = None
 
-    while shared_state.get("running", True):
+    packets_sent = REGISTRY.counter('bluetooth_packets_sent_total', "已发送的指令包数")
+    packets_skipped = REGISTRY.counter('bluetooth_packets_skipped_total', "因输出缓冲区拥堵而跳过的指令包数")
+    reconnects = REGISTRY.counter('bluetooth_reconnects_total', "已建立的串口连接丢失（随后重连）的次数")
+    connected = REGISTRY.gauge('bluetooth_connected', "串口是否已连接")
+
+    while state.running:
         try:
             if ser is None or not ser.is_open:
                 print(f"[蓝牙线程] 正在尝试连接到串口 {SERIAL_PORT}...")
@@ -25,14 +31,15 @@ def run_bluetooth_communication(shared_state, lock):
                     SERIAL_PORT, BAUD_RATE, timeout=1, write_timeout=0.5
                 )
                 print(f"[蓝牙线程] 串口 {SERIAL_PORT} 连接成功。")
+                connected.set(1)
                 time.sleep(2)
 
-            with lock:
-                current_firing = shared_state.get('firing')
-                current_moving = shared_state.get('moving')
-                current_random_move = shared_state.get('random_move')
-                current_ifturn = shared_state.get('ifturn')
-                pass
+            # 只读取一次引用，同一个包里的各个字段来自同一条指令
+            command = state.command
+            current_firing = command.firing
+            current_moving = command.moving
+            current_random_move = command.random_move
+            current_ifturn = command.ifturn
 
 
             # 在发送前，检查输出缓冲区是否拥堵
@@ -50,13 +57,15 @@ def run_bluetooth_communication(shared_state, lock):
                                          int(current_firing),int(current_random_move),
                                          int(current_ifturn))
                 ser.write(data_packet)
-                print(f"[蓝牙线程] 发送指令: {data_packet.hex(' ')} (缓冲区: {ser.out_waiting}字节)")
+                # 每秒 10 个包，不再逐包打印，发送数见 bluetooth_packets_sent_total
+                packets_sent.inc()
 
                 # 更新状态
                 # last_moving = current_moving
                 # last_firing = current_firing
                 pass
             else:
+                packets_skipped.inc()
                 print(
                     f"[蓝牙线程] 警告：蓝牙输出缓冲区拥堵 ({ser.out_waiting}字节)，跳过本次发送。"
                 )
@@ -65,12 +74,18 @@ def run_bluetooth_communication(shared_state, lock):
             time.sleep(0.1)
 
         except serial.SerialException:
-            if ser and ser.is_open:
-                ser.close()
-            ser = None
-            print("[蓝牙线程] 串口连接丢失，将在5秒后重试...")
+            # ser 为 None 说明这次是连接本身失败（例如串口不存在），不是已建立的连接断开
+            if ser is None:
+                print("[蓝牙线程] 串口连接失败，将在5秒后重试...")
+            else:
+                if ser.is_open:
+                    ser.close()
+                ser = None
+                connected.set(0)
+                reconnects.inc()
+                print("[蓝牙线程] 串口连接丢失，将在5秒后重试...")
             for _ in range(50):
-                if not shared_state.get("running", True):
+                if not state.running:
                     break
                 time.sleep(0.2)
         except Exception as e:  # pylint: disable=broad-exception-caught
@@ -0,0 +1,321 @@
+"""HSV threshold calibration tool
+
+用法:
+    python calibrate.py match.mjpeg --label 120 --span 300   # 在第 120 帧上框选目标，标注用于第 120~419 帧
+    python calibrate.py match.mjpeg                          # 根据标注计算阈值
+    python calibrate.py match.mjpeg --json thresholds.json   # 同时把结果写入 JSON 文件
+
+标注文件默认为 <录像路径>.labels.json，内容为
+    [{"frames": [开始帧, 结束帧), "boxes": [[x, y, w, h], ...]}, ...]
+坐标是视频窗口中（旋转后、全分辨率）的像素坐标；boxes 为空表示这些帧中没有目标，只提供背景像素。
+"""
+
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+import video_processor as vp
+from video_processor import CONFIG
+from frame_source import create_frame_source, FrameSourceError
+
+# S、V 通道每 4 个灰度级合并为一格，H 通道不合并
+H_BINS = 180
+SV_BIN_WIDTH = 4
+SV_BINS = 256 // SV_BIN_WIDTH
+HIST_SIZE = (H_BINS, SV_BINS, SV_BINS)
+
+# 每累积这么多帧的像素就做一次 bincount 并入总数，限制暂存的下标数组占用的内存
+HIST_FLUSH_FRAMES = 100
+
+
+def default_labels_path(source):
+    return os.path.normpath(source) + '.labels.json'
+
+
+def load_labels(path):
+    """读取标注文件，返回 [(开始帧, 结束帧, boxes), ...]。"""
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    return [(int(e['frames'][0]), int(e['frames'][1]), [tuple(map(int, b)) for b in e['boxes']])
+            for e in entries]
+
+
+def save_labels(path, labels):
+    entries = [{'frames': [start, stop], 'boxes': [list(b) for b in boxes]} for start, stop, boxes in labels]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+
+
+def load_frames(source, count):
+    """从录像文件或图片目录中按顺序读取前 count 帧。"""
+    frame_source = create_frame_source(source)
+    frame_source.open()
+    frames = []
+    try:
+        for jpg in frame_source.iter_frames():
+            frames.append(bytes(jpg))
+            if len(frames) >= count:
+                break
+    finally:
+        frame_source.close()
+    return frames
+
+
+def preprocess(jpg, processor):
+    """按照视频线程的流程解码、白平衡并旋转一帧，返回 (BGR 图像, HSV 图像)。"""
+    img = vp.decode_frame(jpg)
+    if img is None:
+        return None, None
+    if CONFIG.ENABLE_WHITE_BALANCE:
+        img = vp.apply_white_balance(img)
+    img = processor.rotate(img)
+    return img, processor.to_hsv(img)
+
+
+def hist_index(hsv):
+    """每个像素在 HSV 联合直方图中的一维格子下标。"""
+    h, s, v = cv2.split(hsv)
+    index = h.astype(np.int32) * (SV_BINS * SV_BINS)
+    index += (s >> 2).astype(np.int32) * SV_BINS
+    index += v >> 2
+    return index
+
+
+def label_masks(shape, boxes, shrink=0.0):
+    """
+    由标注框生成 (目标掩码, 背景掩码)。目标掩码是每条边向内收缩 shrink 比例后的框，
+    背景掩码是所有标注框以外的区域；两者之间的框边缘可能混有背景，不参与统计。
+    """
+    target = np.zeros(shape[:2], np.uint8)
+    background = np.full(shape[:2], 255, np.uint8)
+    for x, y, w, h in boxes:
+        dx, dy = int(w * shrink), int(h * shrink)
+        target[max(0, y + dy):max(0, y + h - dy), max(0, x + dx):max(0, x + w - dx)] = 255
+        background[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = 0
+    return target, background
+
+
+def accumulate_histograms(frames, labels, shrink=0.1):
+    """
+    统计标注帧中目标像素和背景像素的 HSV 联合直方图，同时统计 CONFIG 中当前阈值的像素级命中数。
+    返回 (目标直方图, 背景直方图, 当前阈值的 [TP, FP, 目标总数], 使用的帧数)。
+    """
+    processor = vp.FrameProcessor()
+    size = H_BINS * SV_BINS * SV_BINS
+    target = np.zeros(size, np.int64)
+    background = np.zeros(size, np.int64)
+    pending_target, pending_background = [], []
+    current = np.zeros(3, np.int64)
+    used = 0
+
+    def flush():
+        nonlocal target, background
+        if pending_target:
+            target += np.bincount(np.concatenate(pending_target), minlength=size)
+            background += np.bincount(np.concatenate(pending_background), minlength=size)
+        pending_target.clear()
+        pending_background.clear()
+
+    for start, stop, boxes in labels:
+        for i in range(start, min(stop, len(frames))):
+            img, hsv = preprocess(frames[i], processor)
+            if img is None:
+                continue
+            target_mask, background_mask = label_masks(img.shape, boxes, shrink)
+            index = hist_index(hsv)
+            pending_target.append(index[target_mask > 0])
+            pending_background.append(index[background_mask > 0])
+            detected = vp.create_color_mask(hsv)
+            current += (cv2.countNonZero(cv2.bitwise_and(detected, target_mask)),
+                        cv2.countNonZero(cv2.bitwise_and(detected, background_mask)),
+                        cv2.countNonZero(target_mask))
+            used += 1
+            if used % HIST_FLUSH_FRAMES == 0:
+                flush()
+    flush()
+    return target.reshape(HIST_SIZE), background.reshape(HIST_SIZE), current, used
+
+
+def hue_offset(target):
+    """目标色调的环形均值偏离 90 的量；按它平移色调后，红色这样跨越 0/180 的目标也落在连续区间内。"""
+    hist = target.sum(axis=(1, 2))
+    angles = np.arange(H_BINS) * (2 * np.pi / H_BINS)
+    mean = np.arctan2(hist @ np.sin(angles), hist @ np.cos(angles))
+    center = int(round(mean * H_BINS / (2 * np.pi))) % H_BINS
+    return (center - H_BINS // 2) % H_BINS
+
+
+def f_score(tp, fp, total, beta=1.0):
+    b2 = beta * beta
+    denominator = (1 + b2) * tp + b2 * (total - tp) + fp
+    return np.divide((1 + b2) * tp, denominator, out=np.zeros_like(denominator, dtype=np.float64),
+                     where=denominator > 0)
+
+
+def best_range(target, background, total, beta=1.0):
+    """
+    在一维直方图上枚举所有区间 [lo, hi]，返回 F 值最高的 (lo, hi, F 值)。
+    total 为全部目标像素数，区间外的目标像素都计为漏检。
+    """
+    t = np.concatenate(([0.0], np.cumsum(target)))
+    b = np.concatenate(([0.0], np.cumsum(background)))
+    # tp[lo, hi] = 区间 [lo, hi] 内的目标像素数，lo > hi 的无效区间记为 0
+    tp = np.triu(t[None, 1:] - t[:-1, None])
+    fp = np.triu(b[None, 1:] - b[:-1, None])
+    score = f_score(tp, fp, total, beta)
+    # F 值相同的区间中取最窄的，没有背景像素的色调不会被无谓地纳入阈值
+    candidates = np.argwhere(score >= score.max() - 1e-12)
+    lo, hi = candidates[np.argmin(candidates[:, 1] - candidates[:, 0])]
+    return int(lo), int(hi), float(score[lo, hi])
+
+
+def optimise_bounds(target, background, beta=1.0, max_iterations=20):
+    """
+    在（色调已平移的）三维直方图上搜索使 F 值最高的长方体 [h0, h1] x [s0, s1] x [v0, v1]。
+    以目标像素的 1%~99% 分位数为初值，轮流固定两个通道、对第三个通道求最优区间，直到不再变化。
+    返回 ((h0, h1), (s0, s1), (v0, v1)) 直方图格子下标、精确率和召回率。
+    """
+    total = target.sum()
+    bounds = []
+    for axis in range(3):
+        other = tuple(a for a in range(3) if a != axis)
+        cdf = np.cumsum(target.sum(axis=other)) / total
+        bounds.append((int(np.searchsorted(cdf, 0.01)), int(np.searchsorted(cdf, 0.99))))
+
+    for _ in range(max_iterations):
+        previous = list(bounds)
+        for axis in range(3):
+            window = tuple(slice(lo, hi + 1) if a != axis else slice(None) for a, (lo, hi) in enumerate(bounds))
+            other = tuple(a for a in range(3) if a != axis)
+            lo, hi, _ = best_range(target[window].sum(axis=other), background[window].sum(axis=other),
+                                   total, beta)
+            bounds[axis] = (lo, hi)
+        if bounds == previous:
+            break
+
+    window = tuple(slice(lo, hi + 1) for lo, hi in bounds)
+    tp, fp = target[window].sum(), background[window].sum()
+    precision = tp / (tp + fp) if tp + fp > 0 else 0.0
+    return tuple(bounds), float(precision), float(tp / total)
+
+
+def to_color_bounds(bounds, offset):
+    """
+    把直方图格子下标的长方体换算成 cv2.inRange 使用的 HSV 上下界（均为闭区间）。
+    平移回原来的色调后区间跨越 180 时拆成两个范围，对应 CONFIG 中的 BOUND_1 和 BOUND_2。
+    """
+    (h0, h1), (s0, s1), (v0, v1) = bounds
+    s_range = (s0 * SV_BIN_WIDTH, s1 * SV_BIN_WIDTH + SV_BIN_WIDTH - 1)
+    v_range = (v0 * SV_BIN_WIDTH, v1 * SV_BIN_WIDTH + SV_BIN_WIDTH - 1)
+    h_lower, h_upper = (h0 + offset) % H_BINS, (h1 + offset) % H_BINS
+    h_ranges = [(h_lower, h_upper)] if h_lower <= h_upper else [(0, h_upper), (h_lower, H_BINS - 1)]
+    return [((h_lo, s_range[0], v_range[0]), (h_hi, s_range[1], v_range[1])) for h_lo, h_hi in h_ranges]
+
+
+def calibrate(frames, labels, shrink=0.1, beta=1.0):
+    """根据标注计算阈值，返回结果字典。"""
+    target, background, current, used = accumulate_histograms(frames, labels, shrink)
+    if target.sum() == 0:
+        raise ValueError("标注框内没有目标像素，请先用 --label 标注目标")
+    offset = hue_offset(target)
+    shifted_target = np.roll(target, -offset, axis=0)
+    shifted_background = np.roll(background, -offset, axis=0)
+    bounds, precision, recall = optimise_bounds(shifted_target, shifted_background, beta)
+    current_tp, current_fp, total = (int(x) for x in current)
+    return {
+        'frames': used,
+        'target_pixels': int(target.sum()),
+        'background_pixels': int(background.sum()),
+        'bounds': [[list(map(int, lower)), list(map(int, upper))]
+                   for lower, upper in to_color_bounds(bounds, offset)],
+        'precision': precision,
+        'recall': recall,
+        'current_precision': current_tp / (current_tp + current_fp) if current_tp + current_fp else 0.0,
+        'current_recall': current_tp / total if total else 0.0,
+    }
+
+
+def label_frame(frames, index, span, labels_path):
+    """在第 index 帧上用鼠标框选目标（回车确认每个框，Esc 结束），标注追加到标注文件中。"""
+    img, _ = preprocess(frames[index], vp.FrameProcessor())
+    if img is None:
+        print(f"[阈值标定] 错误：第 {index} 帧解码失败")
+        return
+    boxes = cv2.selectROIs(f'Label frame {index}', img, showCrosshair=True)
+    cv2.destroyAllWindows()
+    labels = load_labels(labels_path) if os.path.exists(labels_path) else []
+    labels.append((index, index + span, [tuple(int(v) for v in b) for b in boxes]))
+    save_labels(labels_path, labels)
+    print(f"[阈值标定] 已为第 {index}~{index + span - 1} 帧保存 {len(boxes)} 个标注框到 {labels_path}")
+
+
+def print_config(result):
+    """以可以直接粘贴到 CONFIG 中的形式输出阈值。"""
+    for i in (1, 2):
+        if i <= len(result['bounds']):
+            lower, upper = result['bounds'][i - 1]
+            print(f"    LOWER_COLOR_BOUND_{i} = np.array({lower})")
+            print(f"    UPPER_COLOR_BOUND_{i} = np.array({upper})")
+        else:
+            print(f"    LOWER_COLOR_BOUND_{i} = None")
+            print(f"    UPPER_COLOR_BOUND_{i} = None")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据录像和标注框自动标定 HSV 颜色阈值")
+    parser.add_argument('source', help="录像文件或 JPEG 图片目录")
+    parser.add_argument('--labels', help="标注文件，默认为 <source>.labels.json")
+    parser.add_argument('--label', type=int, metavar='FRAME', help="在指定帧上框选目标并保存标注")
+    parser.add_argument('--span', type=int, default=1, help="--label 的标注框适用的帧数（目标静止时可以设大）")
+    parser.add_argument('--shrink', type=float, default=0.1, help="标注框每条边向内收缩的比例")
+    parser.add_argument('--beta', type=float, default=1.0, help="F 值中召回率相对精确率的权重")
+    parser.add_argument('--json', help="把标定结果写入 JSON 文件")
+    args = parser.parse_args()
+    labels_path = args.labels or default_labels_path(args.source)
+
+    labels = []
+    if args.label is None:
+        try:
+            labels = load_labels(labels_path)
+        except FileNotFoundError:
+            print(f"[阈值标定] 错误：找不到标注文件 {labels_path}，请先用 --label 标注目标")
+            return
+        if not labels:
+            print(f"[阈值标定] 错误：标注文件 {labels_path} 中没有标注")
+            return
+    needed = args.label + 1 if args.label is not None else max(stop for _, stop, _ in labels)
+
+    start = time.perf_counter()
+    try:
+        frames = load_frames(args.source, needed)
+    except FrameSourceError as e:
+        print(f"[阈值标定] 错误：{e}")
+        return
+    if args.label is not None:
+        if args.label >= len(frames):
+            print(f"[阈值标定] 错误：帧源只有 {len(frames)} 帧")
+            return
+        label_frame(frames, args.label, args.span, labels_path)
+        return
+
+    try:
+        result = calibrate(frames, labels, args.shrink, args.beta)
+    except ValueError as e:
+        print(f"[阈值标定] 错误：{e}")
+        return
+    elapsed = time.perf_counter() - start
+    print(f"[阈值标定] 使用 {result['frames']} 帧，目标像素 {result['target_pixels']}，"
+          f"背景像素 {result['background_pixels']}，耗时 {elapsed:.2f} 秒")
+    print(f"[阈值标定] 当前阈值：精确率 {result['current_precision']:.3f}，召回率 {result['current_recall']:.3f}")
+    print(f"[阈值标定] 标定阈值：精确率 {result['precision']:.3f}，召回率 {result['recall']:.3f}（按像素统计）")
+    print("[阈值标定] 把下面的阈值复制到 video_processor.py 的 CONFIG 中：")
+    print_config(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,77 +10,110 @@ from config import (
     SERVO_X_MAX,
     SERVO_Y_MIN,
     SERVO_Y_MAX,
-    AVG_CAPTURE_LATENCY,
     CONTROL_LOOP_DT,
+    CONTROL_EVENT_DRIVEN,
+    GIMBAL_CONTROLLER,
+    GIMBAL_ACTUATION_DELAY,
+    TRACK_HISTORY_SIZE,
 )
-import numpy as np
-import copy
-from filterpy.kalman import KalmanFilter
+from gimbal_controller import GimbalController, ServoHistory
+from track_history import StateHistoryTracker
+from state import Command
+from metrics import REGISTRY
 
 
 
-def create_kalman_filter(dt):
-    """创建一个配置好的卡尔曼滤波器对象。"""
-    kf = KalmanFilter(dim_x=4, dim_z=2)
-    kf.F = np.array([[1, 0, dt, 0], [0, 1, 0, dt],
-                       [0, 0, 1, 0], [0, 0, 0, 1]])
-    kf.H = np.array([[1, 0, 0, 0], [0, 1, 0, 0]])
-    kf.R *= 0.02
-    kf.Q[2:,2:] *= 0.02
-    kf.P *= 100
-    return kf
-
-
-def run_center_control(shared_state, lock):
+def run_center_control(state, measurements, event_driven=CONTROL_EVENT_DRIVEN, controller=GIMBAL_CONTROLLER):
     """
     在一个独立线程中运行，使用卡尔曼滤波器，并对巨大的采集延迟进行补偿，
     以平滑和预测目标位置，并据此控制云台及激光发射。
+    measurements 为视频线程写入的 MeasurementQueue，每个测量为 (估计的曝光时刻, 坐标)，
+    时刻使用 time.monotonic() 时钟。每次循环的结果以 Command 快照整体发布到 state.command。
+
+    event_driven 为 True 时，新的测量一到就立即开始下一次循环，
+    没有新测量时仍按 CONTROL_LOOP_DT 定时只做预测；为 False 时每次循环固定等待 CONTROL_LOOP_DT。
+
+    controller 为 'step' 时目标偏离中心就每次循环移动一个舵机单位；为 'pid' 时用按 config 参数创建的
+    GimbalController 把误差换算成舵机单位直接移动，也可以直接传入一个 GimbalController。
+    PID 模式下云台一次会移动很多个单位，目标在画面中的移动大部分来自云台自身，
+    因此滤波器改在“云台不动时的画面坐标”中运行：每个测量先减去曝光时舵机位置对应的像素偏移。
     """
     print("[中控线程] 线程已启动。")
     
-    kf = create_kalman_filter(CONTROL_LOOP_DT)
+    if controller == 'pid':
+        # y 轴比舵机限位多留一格，目标在限位之外时与步进控制一样越过限位，由下面的转向逻辑处理
+        gimbal = GimbalController(limits=((SERVO_X_MIN, SERVO_X_MAX), (SERVO_Y_MIN - 1, SERVO_Y_MAX + 1)))
+    elif controller == 'step':
+        gimbal = None
+    else:
+        gimbal = controller
+    # 最近下达的舵机位置，用于换算每一帧曝光时云台所处的位置
+    servo_history = ServoHistory()
+
+    def servo_offset(t):
+        """t 时刻舵机位置对应的画面偏移（像素）；步进模式下为 0，滤波器直接在画面坐标中运行。"""
+        if gimbal is None:
+            return 0.0, 0.0
+        position = servo_history.at(t - GIMBAL_ACTUATION_DELAY)
+        return gimbal.to_pixels(position if position is not None else state.command.moving)
+
+    # 每个测量都在它的曝光时刻更新滤波器，晚到的测量插入历史后重新处理其后的测量
+    tracker = StateHistoryTracker(TRACK_HISTORY_SIZE)
+    kf = tracker.kf
     kf_initialized = False
-    last_update_time = time.time()
+    # 滤波器状态对应的时刻，即已用于更新的最新测量的曝光时刻
+    filter_time = 0.0
+    # 最近一次检测到目标（最新测量的曝光时刻）
+    last_detection_time = None
+    scan_direction_x = 1  # 巡航方向，1 表示向右, -1 表示向左
     hasscanned = False
     random_move = False
 
+    ticks = REGISTRY.counter('center_control_ticks_total', "中控循环执行次数")
+    firing_ticks = REGISTRY.counter('center_control_firing_ticks_total', "激光处于开启状态的循环次数，与 ticks 之比即为开火占空比")
+    loop_jitter = REGISTRY.histogram('center_control_loop_jitter_seconds', "实际循环周期与 CONTROL_LOOP_DT 之差的绝对值（秒）")
+    loop_busy = REGISTRY.histogram('center_control_loop_busy_seconds', "每次循环中实际计算所花的时间（秒）")
+    since_detection = REGISTRY.gauge('center_control_seconds_since_detection', "距离最近一次检测到目标的时间（秒）")
+    tracking = REGISTRY.gauge('center_control_tracking', "是否处于追踪模式（1 为追踪，0 为巡航）")
+    horizon = REGISTRY.histogram('center_control_prediction_horizon_seconds', "延迟补偿向前外推的时长（秒）")
+    batch_size = REGISTRY.histogram('center_control_measurements_per_tick', "每次循环用于更新滤波器的测量数",
+                                    buckets=(0, 1, 2, 3, 4, 6, 8, 16, 32))
+    out_of_sequence = REGISTRY.counter('center_control_out_of_sequence_total', "晚于滤波器时刻到达、插入历史后重新处理的测量数")
+    too_old = REGISTRY.counter('center_control_measurements_too_old_total', "早于整个状态历史而被丢弃的测量数")
+    replayed = REGISTRY.counter('center_control_replayed_measurements_total', "因晚到的测量而重新处理的历史测量数")
+    timer_wakeups = REGISTRY.counter('center_control_wakeups_total', "中控循环被唤醒的次数", {'reason': 'timer'})
+    detection_wakeups = REGISTRY.counter('center_control_wakeups_total', "中控循环被唤醒的次数", {'reason': 'detection'})
+    last_tick_time = None
+    last_control_time = None
+    woken_by_detection = False
 
-    while shared_state.get("running", True):
-        current_time = time.time()
-        
-        # --- 1. 从共享状态获取数据 ---
-        with lock:
-            detection_data = shared_state.get("detection_data")
-            shared_state["detection_data"] = None 
-            moving = shared_state.get("moving")
-
-        # --- 2. 预测到当前时刻 ---
-        # 无论有无新数据，我们都需要让滤波器的内部时间前进
-        time_since_last_update = current_time - last_update_time
-        # 为了防止系统暂停过久导致预测跑飞，可以加一个上限
-        time_since_last_update = min(time_since_last_update, 1) 
-        
-        if kf_initialized:
-            # 动态调整状态转移矩阵F以匹配真实的时间间隔
-            kf.F[0, 2] = time_since_last_update
-            kf.F[1, 3] = time_since_last_update
-            kf.predict()
+
+    while state.running:
+        current_time = time.monotonic()
+        if last_tick_time is not None and not woken_by_detection:
+            loop_jitter.observe(abs(current_time - last_tick_time - CONTROL_LOOP_DT))
+        last_tick_time = current_time
         
-        last_update_time = current_time
+        # --- 1. 取走上次循环以来的所有测量 ---
+        pending = measurements.drain()
+        moving = state.command.moving
+        batch_size.observe(len(pending))
 
-        # --- 3. 用新数据更新滤波器 (如果存在) ---
-        if detection_data is not None:
-            coords, data_arrival_time = detection_data
-            measurement = np.array([[coords[0]], [coords[1]]])
-            
-            if not kf_initialized:
-                kf.x[:2] = measurement
-                kf_initialized = True
-            else:
-                # 核心：这里我们不直接更新，因为数据是陈旧的。
-                # 但更新步骤本身有助于校正滤波器的状态。
-                # 这一步可以看作是用一个过去的数据来校准现在对过去的估计。
-                kf.update(measurement)
+        # --- 2. 按曝光时刻依次预测到每个测量的时刻并更新 ---
+        # 滤波器的时间轴是曝光时刻而不是循环时刻，每个测量都用它与上一个测量实际相隔的时间预测；
+        # 曝光时刻早于滤波器时刻的测量（上一批已经处理了更新的测量）由 tracker 插入历史重新处理。
+        # 没有新测量时滤波器本身不动，只在决策时外推到当前时刻
+        for capture_time, coords in pending:
+            offset_x, offset_y = servo_offset(capture_time)
+            result = tracker.add(capture_time, coords[0] - offset_x, coords[1] - offset_y)
+            if result is None:
+                too_old.inc()
+            elif result:
+                out_of_sequence.inc()
+                replayed.inc(result)
+            kf_initialized = True
+        if pending:
+            filter_time = tracker.time
         
         # --- 4. 决策逻辑 ---
         firing = False
@@ -88,44 +121,43 @@ def run_center_control(shared_state, lock):
             # --- A. 追踪模式 ---
             
             # --- 核心延迟补偿 ---
-            # 我们需要预测到未来的哪个时间点？
-            # 1. 图像的真实拍摄时间约等于 (数据到达时间 - 平均采集延迟)
-            # 2. 我们需要预测的时间 = (当前时间 - 真实拍摄时间)
-            # 3. 简化后，总预测时长 = (当前时间 - 数据到达时间) + 平均采集延迟
-            
-            total_prediction_time = AVG_CAPTURE_LATENCY
-            if detection_data is not None:
-                # 如果有新数据，就加上处理延迟
-                processing_latency = current_time - data_arrival_time
-                total_prediction_time += processing_latency
-
-            # 创建一个临时的滤波器副本用于预测，不污染主滤波器的状态
-            kf_future = copy.deepcopy(kf) 
-            kf_future.F[0, 2] = total_prediction_time
-            kf_future.F[1, 3] = total_prediction_time
-            
-            kf_future.predict()
+            # 滤波器的状态对应最近一个测量的曝光时刻，由视频线程根据每帧的到达时刻在线估计，
+            # 从那一刻外推到现在即可补偿全部采集和处理延迟；没有新数据时外推的时长随之增长。
+            total_prediction_time = min(max(current_time - filter_time, 0.0), 1.0)
+            horizon.observe(total_prediction_time)
 
-            predicted_state = kf_future.x
-
-            predicted_coords = (predicted_state[0, 0], predicted_state[1, 0])
+            # 闭式外推到“未来”，不复制也不修改主滤波器的状态
+            predicted_coords, _ = kf.predict_ahead(total_prediction_time)
             
             # (丢失目标的逻辑可以简化或保留，这里先用简化版)
-            if detection_data is None and (current_time - shared_state.get('last_detection_time', 0) > 1.0):
+            if not pending and (last_detection_time is None or current_time - last_detection_time > 1.0):
                  kf_initialized = False # 丢失超过1秒，放弃追踪
+                 tracker.reset()
+                 last_control_time = None
+                 if gimbal is not None:
+                     gimbal.reset()
             else:
-                if detection_data is not None:
-                    shared_state['last_detection_time'] = data_arrival_time
+                if pending:
+                    last_detection_time = filter_time
                 
                 # 使用这个“未来”的坐标进行控制
-                error_x = predicted_coords[0] - LIGHT_CENTER[0]
-                error_y = predicted_coords[1] - LIGHT_CENTER[1]
+                offset_x, offset_y = servo_offset(current_time)
+                error_x = predicted_coords[0] + offset_x - LIGHT_CENTER[0]
+                error_y = predicted_coords[1] + offset_y - LIGHT_CENTER[1]
                 
-                move_x, move_y = moving
-                if abs(error_x) > CENTER_TOLERANCE:
-                    move_x += -1 if error_x > 0 else +1
-                if abs(error_y) > CENTER_TOLERANCE:
-                    move_y += -1 if error_y > 0 else +1
+                if gimbal is None:
+                    move_x, move_y = moving
+                    if abs(error_x) > CENTER_TOLERANCE:
+                        move_x += -1 if error_x > 0 else +1
+                    if abs(error_y) > CENTER_TOLERANCE:
+                        move_y += -1 if error_y > 0 else +1
+                else:
+                    # 指令要过 GIMBAL_ACTUATION_DELAY 才生效，按那时目标的位置计算舵机应到的位置
+                    (target_x, target_y), _ = kf.predict_ahead(total_prediction_time + GIMBAL_ACTUATION_DELAY)
+                    goal_x, goal_y = gimbal.to_units((LIGHT_CENTER[0] - target_x, LIGHT_CENTER[1] - target_y))
+                    dt = CONTROL_LOOP_DT if last_control_time is None else current_time - last_control_time
+                    move_x, move_y = gimbal.update((goal_x - moving[0], goal_y - moving[1]), moving, dt)
+                    last_control_time = current_time
 
                 if abs(error_x) <= CENTER_TOLERANCE and abs(error_y) <= CENTER_TOLERANCE:
                     firing = True
@@ -182,19 +214,15 @@ def run_center_control(shared_state, lock):
                 ifturn = 0
                 hasscanned = False
             else:
-                # 定义巡航方向
-                if "scan_direction_x" not in shared_state:
-                    shared_state["scan_direction_x"] = 1  # 1 表示向右, -1 表示向左
-
                 move_x, move_y = moving
 
                 # 左右扫描
-                if shared_state["scan_direction_x"] == 1:
+                if scan_direction_x == 1:
                     if move_x < SERVO_X_MAX:
                         move_x += 3
                         ifturn = 0
                     else:
-                        shared_state["scan_direction_x"] = -1
+                        scan_direction_x = -1
                         move_y += 30
                         ifturn = 0
                 else:
@@ -203,7 +231,7 @@ def run_center_control(shared_state, lock):
                         ifturn = 0
                     else:
 
-                        shared_state["scan_direction_x"] = 1
+                        scan_direction_x = 1
                         move_y += 30
                         ifturn = 0
 
@@ -218,18 +246,45 @@ def run_center_control(shared_state, lock):
         # --- 5. 更新最终状态 ---
         move_x = clamp(move_x, SERVO_X_MIN, SERVO_X_MAX)
         move_y = clamp(move_y, SERVO_Y_MIN, SERVO_Y_MAX)
+
+        # 把滤波器当前的位置估计及其标准差发布给视频线程，用于缩小检测的搜索范围
+        track_prediction = None
+        if kf_initialized:
+            # 视频线程下一帧的曝光时刻约为现在，PID 模式下换算回那一帧的画面坐标
+            offset_x, offset_y = servo_offset(current_time)
+            track_prediction = (kf.x + offset_x, kf.y + offset_y) + kf.position_std
         
-        with lock:
-            shared_state["moving"] = (move_x, move_y)
-            shared_state["firing"] = firing
-            shared_state["ifturn"] = ifturn
-            shared_state["random_move"] = random_move
+        servo_history.record(current_time, (move_x, move_y))
+        # 整条指令一次发布，蓝牙线程不会读到只更新了一半的指令
+        state.command = Command(
+            moving=(move_x, move_y),
+            firing=firing,
+            ifturn=ifturn,
+            random_move=random_move,
+            track_prediction=track_prediction,
+            measurement_time=last_detection_time,
+        )
         
+        ticks.inc()
+        if firing:
+            firing_ticks.inc()
+        tracking.set(1 if kf_initialized else 0)
+        since_detection.set(0.0 if last_detection_time is None else current_time - last_detection_time)
+
         # 稳定循环周期
-        elapsed_time = time.time() - current_time
+        elapsed_time = time.monotonic() - current_time
+        loop_busy.observe(elapsed_time)
         sleep_time = CONTROL_LOOP_DT - elapsed_time
-        if sleep_time > 0:
-            time.sleep(sleep_time)
+        if not event_driven:
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+        else:
+            # 等待新的测量或下一个定时周期，先到者为准
+            woken_by_detection = measurements.wait(max(sleep_time, 0))
+            if woken_by_detection:
+                detection_wakeups.inc()
+            else:
+                timer_wakeups.inc()
 
     print("[中控线程] 正在关闭...")
 
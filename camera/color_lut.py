@@ -0,0 +1,133 @@
+"""BGR colour lookup table module"""
+
+import hashlib
+import os
+import cv2
+import numpy as np
+
+# 查找表的磁盘缓存目录
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lut_cache')
+
+
+def threshold_key(bounds, bits):
+    """
+    由阈值和量化位数生成查找表的缓存键。
+    bounds 为 [(lower, upper), ...]，其中 None 的范围会被忽略。
+    """
+    parts = [f'bits={bits}', f'opencv={cv2.__version__}']
+    for lower, upper in bounds:
+        if lower is None or upper is None:
+            continue
+        parts.append(','.join(str(int(v)) for v in lower))
+        parts.append(','.join(str(int(v)) for v in upper))
+    return hashlib.sha1(';'.join(parts).encode('ascii')).hexdigest()[:16]
+
+
+def build_lut(bounds, bits=8):
+    """
+    对所有量化后的 BGR 颜色计算其是否落在 HSV 阈值范围内。
+
+    使用与检测流水线完全相同的 cv2.cvtColor 和 cv2.inRange 计算，
+    bits=8 时与逐帧计算的掩码逐像素一致；bits 更小时取每个量化格子的中心颜色。
+    返回长度为 2^(3*bits) 的 uint8 数组（0 或 255），
+    下标为 b | g << bits | r << (2 * bits)。
+    """
+    levels = 1 << bits
+    shift = 8 - bits
+    values = (np.arange(levels, dtype=np.uint16) << shift) + ((1 << shift) >> 1)
+    values = values.astype(np.uint8)
+    # 按照 r, g, b 的顺序展开，使得 b 变化最快，与下标的位布局一致
+    r, g, b = np.meshgrid(values, values, values, indexing='ij')
+    colors = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1).reshape(-1, 1, 3)
+    hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+
+    lut = np.zeros((len(colors), 1), np.uint8)
+    for lower, upper in bounds:
+        if lower is None or upper is None:
+            continue
+        lut = cv2.bitwise_or(lut, cv2.inRange(hsv, lower, upper))
+    return lut.ravel()
+
+
+def load_or_build_lut(bounds, bits=8, cache_dir=CACHE_DIR):
+    """
+    优先从磁盘缓存中加载查找表，没有缓存时计算并以按位压缩的形式保存。
+    """
+    path = os.path.join(cache_dir, f'color_lut_{threshold_key(bounds, bits)}.npy')
+    if os.path.exists(path):
+        packed = np.load(path)
+        return np.unpackbits(packed)[:1 << (3 * bits)] * np.uint8(255)
+
+    lut = build_lut(bounds, bits)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, np.packbits(lut > 0))
+    except OSError as e:
+        print(f"[颜色查找表] 警告：无法写入缓存 {path}: {e}")
+    return lut
+
+
+class ColorLutMasker:
+    """
+    用预先计算好的 BGR -> 掩码查找表代替每帧的 cvtColor + inRange + bitwise_or。
+
+    查找表在磁盘上按位压缩保存（bits=8 时为 2MB），加载后展开成每个颜色一个字节，
+    这样每帧只需要一次向量化的查表。阈值改变时自动重建。
+    """
+
+    def __init__(self, bits=8, cache_dir=CACHE_DIR):
+        if not 1 <= bits <= 8:
+            raise ValueError(f"量化位数必须在 1 到 8 之间: {bits}")
+        self.bits = bits
+        self.cache_dir = cache_dir
+        self._key = None
+        self._lut = None
+        self._shape = None
+        self._bgra_buffer = None
+        self._index_buffer = None
+        self._bgra = None
+        self._index = None
+
+    def update(self, bounds):
+        """阈值变化时重新加载或计算查找表。"""
+        key = threshold_key(bounds, self.bits)
+        if key != self._key:
+            self._lut = load_or_build_lut(bounds, self.bits, self.cache_dir)
+            self._key = key
+
+    def _index_of(self, img):
+        # 缓冲区只增不减，较小的图像（如 ROI 窗口）使用左上角的视图
+        h, w = img.shape[:2]
+        if self._shape is None or h > self._shape[0] or w > self._shape[1]:
+            self._shape = (h, w) if self._shape is None else (
+                max(h, self._shape[0]), max(w, self._shape[1]))
+            self._bgra_buffer = np.empty(self._shape + (4,), np.uint8)
+            # 下标直接使用 np.take 需要的 intp 类型，查表时不会再转换出一份整帧的下标
+            self._index_buffer = np.empty(self._shape, np.intp)
+        self._bgra = self._bgra_buffer[:h, :w]
+        self._index = self._index_buffer[:h, :w]
+
+        if self.bits == 8:
+            # 补一个 alpha 通道后按 uint32 解释，小端序下即为 b | g << 8 | r << 16 | a << 24，
+            # 再去掉 alpha 即得到下标，全程只有两次整帧操作
+            cv2.cvtColor(img, cv2.COLOR_BGR2BGRA, dst=self._bgra)
+            np.bitwise_and(self._bgra.view(np.uint32)[..., 0], 0xFFFFFF, out=self._index)
+            return self._index
+
+        shift = 8 - self.bits
+        index = self._index
+        np.right_shift(img[..., 2], shift, out=index, casting='unsafe')
+        np.left_shift(index, self.bits, out=index)
+        index |= img[..., 1] >> shift
+        np.left_shift(index, self.bits, out=index)
+        index |= img[..., 0] >> shift
+        return index
+
+    def mask(self, img, out=None):
+        """对一幅 BGR 图像查表得到二值化掩码（0 或 255）。"""
+        index = self._index_of(img)
+        if out is None:
+            out = np.empty(img.shape[:2], np.uint8)
+        # 下标不会越界；mode='raise' 时 np.take 会把结果先写进一份临时拷贝
+        np.take(self._lut, index, out=out, mode='clip')
+        return out
@@ -2,6 +2,27 @@
 
 # --- 视频流配置 ---
 VIDEO_STREAM_URL = "http://192.168.188.16:81/stream"
+STREAM_CHUNK_SIZE = 16384         # 每次从视频流读取的字节数
+MAX_JPEG_FRAME_SIZE = 512 * 1024  # 单帧JPEG的最大字节数，超出则丢弃缓冲区重新同步
+
+# 帧源：http(s) 地址为实时视频流；也可以填写 .mjpeg 录像文件或 JPEG 图片目录的路径，
+# 用于在没有摄像头的电脑上回放调试
+FRAME_SOURCE = VIDEO_STREAM_URL
+REPLAY_FPS = None    # 本地回放的帧率，None 表示以最快速度回放；带 .idx 索引的录像按录制时的时间戳回放
+REPLAY_LOOP = False  # 本地回放结束后是否从头循环
+
+# 录像：设置为文件路径（如 "match.mjpeg"）即在检测的同时录制原始帧，None 表示不录制
+RECORD_PATH = None
+RECORD_QUEUE_SIZE = 64  # 录像写盘队列长度，写盘跟不上时丢弃新帧而不是阻塞视频线程
+
+# 无界面模式：不创建窗口、不做任何绘制，检测线程只做检测
+HEADLESS = False
+DEBUG_STREAM_PORT = 8090  # 无界面模式下在 http://<本机>:8090/stream 上输出带标注的调试画面，None 表示不启动
+DEBUG_STREAM_FPS = 5      # 调试画面的最高帧率，只有在有客户端连接时才会渲染
+
+# 多进程检测：大于 0 时解码和检测在这么多个工作进程中完成（没有图形界面），
+# 中控和蓝牙线程留在主进程，不再与检测争抢 GIL；0 表示在视频线程中检测
+DETECTION_WORKERS = 0
 
 # --- 蓝牙串口配置 ---
 SERIAL_PORT = "COM3"  # 请根据你的设备管理器修改
@@ -24,6 +45,26 @@ SERVO_X_MAX = 300
 SERVO_Y_MIN = 0
 SERVO_Y_MAX = 90
 
+# 云台控制方式：'step' 为原来的每个循环移动一个舵机单位；
+# 'pid' 按标定的像素-舵机单位换算关系用 PID 直接移动到目标，先用 gimbal_controller.py 标定再启用
+GIMBAL_CONTROLLER = 'step'
+GIMBAL_PIXELS_PER_UNIT = (2.0, 2.0)  # 舵机每移动一个单位目标在画面中移动的像素数 (x, y)，由 gimbal_controller.py 测得
+GIMBAL_KP = 8.0                # 比例增益（1/秒），每个循环最多消除全部误差
+GIMBAL_KI = 0.5                # 积分增益（1/秒^2）
+GIMBAL_KD = 0.0                # 微分增益（无量纲）
+GIMBAL_INTEGRAL_LIMIT = 20.0   # 积分项限幅（舵机单位·秒）
+GIMBAL_MAX_RATE = 300.0        # 舵机速度上限（单位/秒）
+GIMBAL_ACTUATION_DELAY = 0.1   # (秒) 指令发出到舵机转到位的时间，用于换算某一帧曝光时舵机所处的位置
+
+
+# 采集延迟由 latency.py 根据每帧 SOI/EOI 的到达时刻和处理耗时在线估计
+CAPTURE_DELAY_FRAMES = 1.0  # 曝光到第一个字节到达相隔的帧间隔数（摄像头先采集、压缩完整一帧再发送）
+LATENCY_EMA_ALPHA = 0.1     # 延迟估计的指数滑动平均系数
+CONTROL_LOOP_DT = 0.15     # (秒) 中控线程的目标循环周期，没有新检测结果时按此周期只做预测
+CONTROL_EVENT_DRIVEN = True  # 新的检测结果发布后立即唤醒中控线程，而不是等到下一个周期
+MEASUREMENT_QUEUE_SIZE = 32  # 视频线程到中控线程的测量队列长度，中控线程来不及取走时丢弃最旧的测量
+TRACK_HISTORY_SIZE = 64      # 中控线程保留的测量及滤波器状态历史条数，晚到的测量只要不早于整个历史就能插入重新处理
+
 
-AVG_CAPTURE_LATENCY = 0.3  # (秒) 你手动估算出的平均采集延迟
-CONTROL_LOOP_DT = 0.15     # (秒) 中控线程的目标循环周期
+# --- 监控指标 ---
+METRICS_PORT = 9100  # 在 http://<本机>:9100/metrics 上导出 Prometheus 格式的指标，None 表示不启动
@@ -0,0 +1,482 @@
+"""Control loop simulations
+
+用法:
+    python control_sim.py --control --ticks 2000  # 中控循环每一拍的滤波器耗时、乱序测量的处理精度、检测结果到下达指令的延迟
+    python control_sim.py --state                 # 所有线程同时读写时，共享字典加锁与不可变快照两种共享状态的每次操作耗时
+    python control_sim.py --gimbal                # 模拟的云台上标定，并比较步进控制与 PID 控制收敛所需的帧数
+
+中控线程、共享状态和云台都在进程内模拟，不需要摄像头和蓝牙。
+"""
+
+import argparse
+import bisect
+import contextlib
+import copy
+import threading
+import time
+import numpy as np
+from benchmark import time_stage, summarize, print_results
+from config import LIGHT_CENTER, CONTROL_LOOP_DT, CENTER_TOLERANCE, GIMBAL_ACTUATION_DELAY
+from center_control import run_center_control
+from gimbal_controller import GimbalController, ServoHistory, calibrate
+from kalman import ConstantVelocityKalman, create_kalman_filter
+from measurement_queue import MeasurementQueue
+from state import SharedState, Command, Detection
+from track_history import StateHistoryTracker
+
+
+def make_control_ticks(count, seed=0, detection_rate=0.7):
+    """
+    生成中控循环的输入序列：每一拍为 (距上一拍的时间, 测量值或 None, 外推时长)。
+    目标做带噪声的匀速运动，循环周期在 CONTROL_LOOP_DT 附近抖动。
+    """
+    rng = np.random.default_rng(seed)
+    ticks = []
+    position = np.array([320.0, 240.0])
+    velocity = rng.uniform(-100, 100, 2)
+    for _ in range(count):
+        dt = float(rng.uniform(0.8, 1.2) * CONTROL_LOOP_DT)
+        position += velocity * dt
+        measurement = None
+        if rng.random() < detection_rate:
+            measurement = tuple(float(v) for v in position + rng.normal(0, 2, 2))
+        ticks.append((dt, measurement, float(rng.uniform(0.02, 0.2))))
+    return ticks
+
+
+def filterpy_tick(kf, tick):
+    """原来中控循环中每一拍的滤波器操作：修改 F 后预测、更新，再深拷贝一份外推。"""
+    dt, measurement, horizon = tick
+    kf.F[0, 2] = dt
+    kf.F[1, 3] = dt
+    kf.predict()
+    if measurement is not None:
+        kf.update(np.array([[measurement[0]], [measurement[1]]]))
+    kf_future = copy.deepcopy(kf)
+    kf_future.F[0, 2] = horizon
+    kf_future.F[1, 3] = horizon
+    kf_future.predict()
+    return (kf_future.x[0, 0], kf_future.x[1, 0]), (kf_future.P[0, 0], kf_future.P[1, 1])
+
+
+def compact_tick(kf, tick):
+    """现在中控循环中每一拍的滤波器操作。"""
+    dt, measurement, horizon = tick
+    kf.predict(dt)
+    if measurement is not None:
+        kf.update(measurement[0], measurement[1])
+    return kf.predict_ahead(horizon)
+
+
+def make_out_of_sequence_measurements(count, fps=25, latency=0.3, jitter_frames=3, seed=0):
+    """
+    生成目标做匀速运动时的测量序列：每个测量为 (曝光时刻, x, y)，带 2 像素噪声。
+    每个测量在曝光 latency 秒后再加上最多 jitter_frames 帧的随机处理时间到达，
+    模拟多进程检测时结果乱序到达。返回 (按曝光时刻排序的测量, 按到达顺序排序的测量, 真实轨迹函数)。
+    """
+    rng = np.random.default_rng(seed)
+    start = np.array([320.0, 240.0])
+    velocity = rng.uniform(-100, 100, 2)
+
+    def truth(t):
+        return start + velocity * t
+
+    ordered = []
+    arrivals = []
+    for i in range(count):
+        t = i / fps
+        x, y = truth(t) + rng.normal(0, 2, 2)
+        ordered.append((t, float(x), float(y)))
+        arrivals.append(t + latency + rng.uniform(0, jitter_frames) / fps)
+    arrival_order = [ordered[i] for i in np.argsort(arrivals, kind='stable')]
+    return ordered, arrival_order, truth, velocity
+
+
+def clamped_update(kf, filter_time, measurement):
+    """原来中控循环对晚到测量的处理：曝光时刻早于滤波器时刻时按同一时刻更新。返回新的滤波器时刻。"""
+    t, x, y = measurement
+    kf.predict(min(max(t - filter_time, 0.0), 1.0))
+    kf.update(x, y)
+    return max(filter_time, t)
+
+
+def compare_out_of_sequence(count=2000):
+    """
+    比较三种处理方式在同一组乱序到达的测量上的精度：按曝光时刻顺序处理（理想情况）、
+    原来的按同一时刻更新、StateHistoryTracker 插入历史后重新处理。
+    返回 ({方式: (位置 RMSE, 速度 RMSE)}, tracker)。
+    误差在每个测量处理后、以滤波器时刻的真实轨迹为准计算。
+    """
+    ordered, arrival_order, truth, velocity = make_out_of_sequence_measurements(count)
+    errors = {'ordered': [], 'clamped': [], 'history': []}
+
+    def record(name, kf, t):
+        errors[name].append((*(np.subtract(kf.position, truth(t))), kf.vx - velocity[0], kf.vy - velocity[1]))
+
+    ideal = StateHistoryTracker()
+    for measurement in ordered:
+        ideal.add(*measurement)
+        record('ordered', ideal.kf, ideal.time)
+    clamped = ConstantVelocityKalman()
+    filter_time = None
+    for measurement in arrival_order:
+        if filter_time is None:
+            clamped.set_position(measurement[1], measurement[2])
+            filter_time = measurement[0]
+        else:
+            filter_time = clamped_update(clamped, filter_time, measurement)
+        record('clamped', clamped, filter_time)
+    tracker = StateHistoryTracker()
+    for measurement in arrival_order:
+        tracker.add(*measurement)
+        record('history', tracker.kf, tracker.time)
+
+    rmse = {}
+    for name, samples in errors.items():
+        samples = np.asarray(samples[len(samples) // 10:])  # 去掉初始收敛阶段
+        rmse[name] = (float(np.sqrt(np.mean(samples[:, :2] ** 2))), float(np.sqrt(np.mean(samples[:, 2:] ** 2))))
+    return rmse, tracker
+
+
+def time_history_replay(seconds=1.0, fps=25, repeat=2000):
+    """一个测量晚到 seconds 秒、需要重新处理其后 seconds * fps 个测量时，StateHistoryTracker.add 的耗时。"""
+    ordered, _, _, _ = make_out_of_sequence_measurements(int(seconds * fps) + 2, fps)
+    late = (ordered[0][0] + 0.5 / fps, ordered[0][1], ordered[0][2])
+    samples = []
+    for _ in range(repeat):
+        tracker = StateHistoryTracker()
+        for measurement in ordered:
+            tracker.add(*measurement)
+        start = time.perf_counter()
+        tracker.add(*late)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class _CommandWatcher(SharedState):
+    """
+    记录中控线程下达指令的共享状态：每次发布指令时，若其中的 measurement_time 比上一条更新，
+    就记下 (该测量的发布时刻, 下达指令的时刻)。
+    """
+
+    __slots__ = ('commands',)
+
+    def __init__(self, *args, **kwargs):
+        self.commands = []
+        super().__init__(*args, **kwargs)
+
+    @property
+    def command(self):
+        return SharedState.command.__get__(self)
+
+    @command.setter
+    def command(self, value):
+        SharedState.command.__set__(self, value)
+        consumed = value.measurement_time
+        if consumed is not None and (not self.commands or consumed > self.commands[-1][0]):
+            self.commands.append((consumed, time.monotonic()))
+
+
+def measure_time_to_command(event_driven, seconds, fps=25, seed=0):
+    """
+    在后台运行 run_center_control，以 fps 的帧率发布检测结果（相位随机）。
+    每个检测结果的指令延迟定义为：从它发布到中控线程第一次根据包含它的一批测量下达指令的时间。
+    返回 (指令延迟列表, 根据新测量下达指令的次数)。
+    """
+    rng = np.random.default_rng(seed)
+    state = _CommandWatcher(command=Command(moving=(150, 45)))
+    measurements = MeasurementQueue()
+    control = threading.Thread(target=run_center_control, args=(state, measurements, event_driven))
+    published = []
+    with contextlib.redirect_stdout(None):
+        control.start()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            time.sleep(float(rng.uniform(0.5, 1.5)) / fps)
+            coords = tuple(int(v) for v in np.add(LIGHT_CENTER, rng.integers(-20, 21, 2)))
+            # 发布时刻同时作为曝光时刻，用来识别每个检测结果
+            now = time.monotonic()
+            measurements.put(now, coords)
+            published.append(now)
+        state.stop()
+        control.join()
+
+    consumed = [c for c, _ in state.commands]
+    latencies = []
+    for t in published:
+        i = bisect.bisect_left(consumed, t)
+        if i < len(consumed):
+            latencies.append(state.commands[i][1] - t)
+    return latencies, len(consumed)
+
+
+def run_control_simulations(count, repeat, latency_seconds=5.0):
+    """
+    比较中控循环每一拍滤波器操作的耗时（filterpy 加深拷贝与闭式的 ConstantVelocityKalman），
+    乱序测量的处理精度和回放 1 秒历史的耗时，以及轮询与事件驱动两种模式下检测结果到下达指令的耗时。
+    """
+    ticks = make_control_ticks(count)
+    try:
+        reference = create_kalman_filter(CONTROL_LOOP_DT)
+    except ImportError:
+        print("[模拟] 未安装 filterpy，跳过与 filterpy 的耗时对比")
+        reference = None
+    compact = ConstantVelocityKalman()
+    results = {}
+    if reference is not None:
+        results['kalman_filterpy'] = summarize(
+            time_stage(lambda tick: filterpy_tick(reference, tick), ticks, repeat))
+    results['kalman_compact'] = summarize(
+        time_stage(lambda tick: compact_tick(compact, tick), ticks, repeat))
+
+    # 乱序到达的测量
+    rmse, tracker = compare_out_of_sequence()
+    print(f"[模拟] 乱序测量：{tracker.out_of_sequence_count} 个晚到，{tracker.too_old_count} 个早于历史被丢弃")
+    for name, (position_rmse, velocity_rmse) in rmse.items():
+        print(f"[模拟] 乱序测量 {name}: 位置 RMSE {position_rmse:.2f}px，速度 RMSE {velocity_rmse:.2f}px/s")
+    results['history_replay_1s'] = summarize(time_history_replay())
+
+    # 检测结果发布到中控线程据此下达指令的耗时
+    for name, event_driven in (('command_polled', False), ('command_event', True)):
+        latencies, consumed = measure_time_to_command(event_driven, latency_seconds)
+        print(f"[模拟] {name}: {len(latencies)} 个检测结果，中控线程根据新测量下达了 {consumed} 次指令")
+        if latencies:
+            results[name] = summarize(latencies)
+    print_results(results)
+    return results
+
+
+def legacy_state_roles():
+    """原来的共享字典加一把锁：每个线程在锁内逐个读写字段，与各线程中的读写方式相同。"""
+    shared_state = {
+        'moving': (0, 0), 'firing': False, 'ifturn': 0, 'random_move': False,
+        'track_prediction': None, 'tracks': (), 'watching_up': 0, 'watching_down': 0,
+        'isfiring': 0, 'nofiring': 1,
+    }
+    lock = threading.Lock()
+
+    def video(i):
+        with lock:
+            prediction = shared_state.get('track_prediction')
+        with lock:
+            shared_state['tracks'] = ((1, (i, i), 20.0, 0.5),)
+        return prediction
+
+    def control(i):
+        with lock:
+            move_x, move_y = shared_state.get('moving')
+        with lock:
+            shared_state['moving'] = (move_x, move_y)
+            shared_state['track_prediction'] = (float(i), float(i), 2.0, 2.0)
+            shared_state['firing'] = bool(i & 1)
+            shared_state['ifturn'] = 0
+            shared_state['random_move'] = False
+
+    def bluetooth(_):
+        with lock:
+            return (shared_state.get('firing'), shared_state.get('moving'),
+                    shared_state.get('random_move'), shared_state.get('ifturn'))
+
+    def web(i):
+        with lock:
+            if i & 1:
+                shared_state['watching_up'] = 1
+                shared_state['watching_down'] = 0
+            else:
+                shared_state['isfiring'] = 0
+                shared_state['nofiring'] = 1
+
+    return {'video': video, 'control': control, 'bluetooth': bluetooth, 'web': web}
+
+
+def snapshot_state_roles():
+    """SharedState：每个生产者发布不可变快照，读者只读一次引用。"""
+    state = SharedState()
+
+    def video(i):
+        prediction = state.command.track_prediction
+        state.detection = Detection(tracks=((1, (i, i), 20.0, 0.5),))
+        return prediction
+
+    def control(i):
+        move_x, move_y = state.command.moving
+        state.command = Command(
+            moving=(move_x, move_y), firing=bool(i & 1), ifturn=0, random_move=False,
+            track_prediction=(float(i), float(i), 2.0, 2.0),
+        )
+
+    def bluetooth(_):
+        command = state.command
+        return command.firing, command.moving, command.random_move, command.ifturn
+
+    def web(i):
+        if i & 1:
+            state.update('input', lambda user_input: user_input.replace(watching_move=(1, 0, 0, 0)))
+        else:
+            state.update('input', lambda user_input: user_input.replace(iffiring=(0, 1)))
+
+    return {'video': video, 'control': control, 'bluetooth': bluetooth, 'web': web}
+
+
+def measure_state_contention(roles, seconds, web_threads=2):
+    """
+    所有角色各占一个线程（网页请求 web_threads 个）同时不停地读写共享状态，
+    返回 {角色: 每次读写的耗时列表}。
+    """
+    names = list(roles) + ['web'] * (web_threads - 1)
+    samples = [[] for _ in names]
+    start = threading.Barrier(len(names))
+    deadline = []
+
+    def run(func, out):
+        start.wait()
+        end = deadline[0]
+        perf_counter = time.perf_counter
+        i = 0
+        while True:
+            t = perf_counter()
+            if t >= end:
+                break
+            func(i)
+            out.append(perf_counter() - t)
+            i += 1
+
+    deadline.append(time.perf_counter() + seconds)
+    threads = [threading.Thread(target=run, args=(roles[name], out)) for name, out in zip(names, samples)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = {}
+    for name, out in zip(names, samples):
+        results.setdefault(name, []).extend(out)
+    return results
+
+
+def run_state_simulations(seconds=2.0):
+    """比较共享字典加锁与不可变快照两种共享状态在所有线程同时读写时的每次操作耗时。"""
+    results = {}
+    for mode, make_roles in (('dict_lock', legacy_state_roles), ('snapshot', snapshot_state_roles)):
+        for role, samples in measure_state_contention(make_roles(), seconds).items():
+            name = f'{mode}_{role}'
+            results[name] = summarize(samples)
+            # 超过 1ms 的操作基本都是持有锁或正在读写时被切换出 GIL 造成的停顿
+            results[name]['stalls'] = int(np.count_nonzero(np.asarray(samples) > 0.001))
+            print(f"[模拟] {name}: {seconds:g} 秒内 {len(samples)} 次操作，"
+                  f"{results[name]['stalls']} 次超过 1ms，最长 {max(samples) * 1000:.1f}ms")
+    print_results(results)
+    return results
+
+
+class _SimulatedGimbal(SharedState):
+    """记录中控线程下达的每一个舵机位置的共享状态，供模拟的云台查询任一时刻舵机所处的位置。"""
+
+    __slots__ = ('servo',)
+
+    def __init__(self, *args, **kwargs):
+        self.servo = ServoHistory(maxlen=4096)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def command(self):
+        return SharedState.command.__get__(self)
+
+    @command.setter
+    def command(self, value):
+        SharedState.command.__set__(self, value)
+        self.servo.record(time.monotonic(), value.moving)
+
+
+def simulate_gimbal_convergence(controller, offset, pixels_per_unit, seconds=3.0, fps=25,
+                                latency=0.06, noise=0.5, seed=0):
+    """
+    用模拟的云台和摄像头闭环运行 run_center_control：静止目标开始时偏离激光中心 offset 个舵机单位，
+    每一帧中目标的坐标 = 目标位置 + pixels_per_unit * 曝光时舵机的位置（指令滞后 GIMBAL_ACTUATION_DELAY 生效），
+    检测结果在曝光 latency 秒后放入测量队列。
+    返回每一帧的 (x, y) 像素误差列表。
+    """
+    rng = np.random.default_rng(seed)
+    start = (150, 45)
+    goal = (start[0] + offset[0], start[1] + offset[1])
+    # 舵机到达 goal 时目标正好在激光中心
+    world = (LIGHT_CENTER[0] - pixels_per_unit[0] * goal[0], LIGHT_CENTER[1] - pixels_per_unit[1] * goal[1])
+    state = _SimulatedGimbal(command=Command(moving=start))
+    measurements = MeasurementQueue()
+    control = threading.Thread(target=run_center_control, args=(state, measurements, True, controller))
+    errors = []
+    with contextlib.redirect_stdout(None):
+        control.start()
+        for _ in range(int(seconds * fps)):
+            time.sleep(1.0 / fps)
+            capture_time = time.monotonic() - latency
+            servo = state.servo.at(capture_time - GIMBAL_ACTUATION_DELAY)
+            coords = [world[axis] + pixels_per_unit[axis] * servo[axis] + rng.normal(0, noise) for axis in (0, 1)]
+            errors.append((coords[0] - LIGHT_CENTER[0], coords[1] - LIGHT_CENTER[1]))
+            measurements.put(capture_time, tuple(coords))
+        state.stop()
+        control.join()
+    return errors
+
+
+def settled_frame(errors, tolerance=CENTER_TOLERANCE):
+    """误差从这一帧起始终不超过 tolerance 的帧序号（从 1 开始），始终没有稳定时返回 None。"""
+    for i in range(len(errors), 0, -1):
+        if max(abs(errors[i - 1][0]), abs(errors[i - 1][1])) > tolerance:
+            return i + 1 if i < len(errors) else None
+    return 1
+
+
+def run_gimbal_simulations(seconds=3.0, offset=(50, 15), true_ppu=(2.3, 1.8)):
+    """
+    先对模拟的云台运行 calibrate()，再比较步进控制与用标定结果的 PID 控制从偏离 offset 个舵机单位
+    到目标稳定在 CENTER_TOLERANCE 以内所需的帧数。
+    """
+    rng = np.random.default_rng(0)
+    world = (LIGHT_CENTER[0] - true_ppu[0] * 150, LIGHT_CENTER[1] - true_ppu[1] * 45)
+    servo = [150, 45]
+
+    def move_to(position):
+        servo[:] = position
+
+    def observe():
+        return tuple(world[axis] + true_ppu[axis] * servo[axis] + rng.normal(0, 0.5) for axis in (0, 1))
+
+    calibration = calibrate(move_to, observe, (150, 45))
+    ppu = calibration['pixels_per_unit']
+    print(f"[模拟] 标定：真实 {true_ppu}，测得 ({ppu[0]:.3f}, {ppu[1]:.3f})，"
+          f"拟合残差 ({calibration['residual_px'][0]:.2f}, {calibration['residual_px'][1]:.2f}) px")
+
+    results = {}
+    for name, controller in (('step', 'step'), ('pid', GimbalController(pixels_per_unit=ppu))):
+        errors = simulate_gimbal_convergence(controller, offset, true_ppu, seconds)
+        frame = settled_frame(errors)
+        overshoot = max(max(e[0] for e in errors), max(e[1] for e in errors), 0.0)
+        results[name] = {'settled_frame': frame, 'frames': len(errors), 'overshoot_px': overshoot}
+        print(f"[模拟] gimbal_{name}: 初始偏差 {offset} 个舵机单位，"
+              + (f"第 {frame} 帧起稳定在 {CENTER_TOLERANCE}px 以内" if frame else f"{len(errors)} 帧内没有稳定")
+              + f"，最大超调 {overshoot:.1f}px")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="中控循环、共享状态和云台控制的进程内模拟")
+    parser.add_argument('--control', action='store_true', help="中控循环的滤波器耗时、乱序测量精度和指令延迟")
+    parser.add_argument('--state', action='store_true', help="视频、中控、蓝牙和网页请求线程同时读写共享状态")
+    parser.add_argument('--gimbal', action='store_true', help="对模拟的云台标定，再比较步进控制与 PID 控制收敛所需的帧数")
+    parser.add_argument('--ticks', type=int, default=500, help="--control 时滤波器计时的拍数")
+    parser.add_argument('--repeat', type=int, default=20, help="--control 时滤波器计时重复的轮数")
+    parser.add_argument('--seconds', type=float, default=5.0, help="--control 时每种模式测量指令延迟的秒数")
+    args = parser.parse_args()
+    if not (args.control or args.state or args.gimbal):
+        parser.error("请至少指定 --control、--state、--gimbal 中的一项")
+
+    if args.control:
+        run_control_simulations(args.ticks, args.repeat, args.seconds)
+    if args.state:
+        run_state_simulations()
+    if args.gimbal:
+        run_gimbal_simulations()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Debug overlay stream module"""
+
+import http.server
+import threading
+import time
+
+BOUNDARY = b'frame'
+
+
+class DebugStream:
+    """
+    无界面模式下的调试画面输出。
+
+    视频线程每帧调用 wants_frame() 询问是否需要渲染调试画面：
+    只有有客户端连接、且距上一次渲染超过 1/max_fps 秒时才返回 True，
+    因此没有人观看时绘制和 JPEG 编码完全不占用检测线程的时间。
+    """
+
+    def __init__(self, hub, max_fps=5):
+        self.hub = hub
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self._next_time = 0.0
+
+    def wants_frame(self):
+        if not self.hub.viewer_count:
+            return False
+        now = time.monotonic()
+        if now < self._next_time:
+            return False
+        self._next_time = now + self.interval
+        return True
+
+    def publish(self, jpg):
+        """发布一帧编码好的调试画面（JPEG 字节串）。"""
+        self.hub.publish(jpg)
+
+
+def start_debug_stream_server(hub, port, host='0.0.0.0'):
+    """
+    在后台线程中启动一个 HTTP 服务器，在 /stream 上以 MJPEG 的形式输出广播站中的调试画面。
+    每个连接的客户端在广播站中计为一个观看者。
+    """
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/stream':
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header(
+                'Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY.decode()}'
+            )
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+
+            hub.add_viewer()
+            try:
+                version = 0
+                while True:
+                    version, jpg = hub.wait_next(version, timeout=1.0)
+                    if jpg is None:
+                        if hub.closed:
+                            break
+                        continue
+                    self.wfile.write(b'--' + BOUNDARY + b'\r\n'
+                                     b'Content-Type: image/jpeg\r\n'
+                                     b'Content-Length: ' + str(len(jpg)).encode() + b'\r\n\r\n')
+                    self.wfile.write(jpg)
+                    self.wfile.write(b'\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端断开
+            finally:
+                hub.remove_viewer()
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,172 @@
+"""Multiprocess detection worker module"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedFrameRing:
+    """
+    共享内存中预先分配的若干个定长槽位，每个槽位存放一帧 JPEG。
+
+    主进程把 JPEG 写入空闲槽位后，只需通过队列把 (槽位号, 长度) 交给工作进程，
+    工作进程直接在共享内存上解码，帧数据本身不经过 pickle 和管道。
+    空闲槽位只由主进程分配和回收。
+    """
+
+    def __init__(self, slot_count, slot_size):
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_size)
+        self._free = queue.Queue()
+        for slot in range(slot_count):
+            self._free.put(slot)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, timeout=None):
+        """取得一个空闲槽位的编号；超时返回 None。"""
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def write(self, slot, jpg):
+        """把一帧写入槽位，返回写入的长度；帧比槽位大时返回 None。"""
+        length = len(jpg)
+        if length > self.slot_size:
+            return None
+        offset = slot * self.slot_size
+        self.shm.buf[offset:offset + length] = jpg
+        return length
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _run_worker(shm_name, slot_size, config_values, task_queue, result_queue):
+    """
+    工作进程的入口。按照主进程传来的 CONFIG 取值初始化检测流水线，
+    然后循环处理任务，直到收到 None。
+    """
+    # 工作进程中才导入检测代码，避免与 video_processor 循环导入
+    import video_processor as vp
+    from color_lut import ColorLutMasker
+    from adaptive_threshold import AdaptiveVThreshold
+
+    for name, value in config_values.items():
+        setattr(vp.CONFIG, name, value)
+    processor = vp.FrameProcessor(
+        vp.CONFIG.DECODE_SCALE,
+        lut_masker=ColorLutMasker(vp.CONFIG.COLOR_LUT_BITS) if vp.CONFIG.USE_COLOR_LUT else None,
+        adaptive_v=AdaptiveVThreshold(vp.CONFIG.ADAPTIVE_V_EMA_ALPHA),
+    )
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            seq, slot, length, timestamp = task
+            start = time.perf_counter()
+            jpg = np.frombuffer(shm.buf, dtype=np.uint8, count=length, offset=slot * slot_size)
+            try:
+                target = vp.detect_frame(jpg, processor)
+                ok = True
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"[检测进程] 处理第 {seq} 帧时发生错误: {e}")
+                target, ok = None, False
+            # 释放对共享内存的引用后再通知主进程回收槽位
+            del jpg
+            # 与单进程模式发布的坐标相同，都是亚像素的浮点坐标
+            result_queue.put((seq, slot, timestamp, ok, target, time.perf_counter() - start))
+    except KeyboardInterrupt:
+        pass  # Ctrl+C 由主进程处理
+    finally:
+        shm.close()
+
+
+class DetectionWorkerPool:
+    """
+    在若干个工作进程中并行完成解码和检测，绕开 GIL。
+
+    submit() 把帧写入共享内存环并分发给工作进程，results() 依次产出
+    (序号, 采集时间戳, 是否成功, 检测结果, 处理耗时)。多个工作进程时结果可能乱序到达，
+    调用方应根据序号丢弃比已发布结果更旧的帧。
+    """
+
+    def __init__(self, worker_count, slot_size, config_values, slot_count=None):
+        self.worker_count = worker_count
+        # 每个工作进程一个正在处理的槽位加一个排队的槽位，保证工作进程不空等
+        self.ring = SharedFrameRing(slot_count or 2 * worker_count, slot_size)
+        ctx = multiprocessing.get_context('spawn')
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._processes = [
+            ctx.Process(
+                target=_run_worker,
+                args=(self.ring.name, slot_size, config_values, self._tasks, self._results),
+                daemon=True,
+            )
+            for _ in range(worker_count)
+        ]
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+
+    @property
+    def alive(self):
+        """是否还有工作进程在运行。"""
+        return any(process.is_alive() for process in self._processes)
+
+    def acquire_slot(self, timeout=None):
+        """等待一个空闲槽位，所有槽位都在处理中时阻塞。"""
+        return self.ring.acquire(timeout)
+
+    def release_slot(self, slot):
+        """归还一个取得后没有使用的槽位。"""
+        self.ring.release(slot)
+
+    def submit(self, slot, seq, jpg, timestamp):
+        """
+        把一帧写入已取得的槽位并交给工作进程。
+        帧比槽位大时归还槽位并返回 False。
+        """
+        length = self.ring.write(slot, jpg)
+        if length is None:
+            self.ring.release(slot)
+            return False
+        self._tasks.put((seq, slot, length, timestamp))
+        return True
+
+    def results(self, timeout=None):
+        """
+        产出已完成的检测结果并回收对应的槽位，超时没有新结果时结束。
+        """
+        while True:
+            try:
+                seq, slot, timestamp, ok, detection, elapsed = self._results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            self.ring.release(slot)
+            yield seq, timestamp, ok, detection, elapsed
+
+    def close(self):
+        """通知所有工作进程退出并释放共享内存。"""
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
@@ -0,0 +1,79 @@
+"""Frame capture module"""
+
+import threading
+from metrics import REGISTRY
+
+
+class LatestFrameMailbox:
+    """
+    只有一个槽位的“最新帧”信箱。
+
+    采集线程每收到一帧完整的 JPEG 就覆盖槽位中的旧帧，
+    处理线程每次取走的总是最新的一帧。处理跟不上时，
+    旧帧直接被丢弃并计数，而不是在 TCP 缓冲区里越积越多。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._closed = False
+        self.received_count = 0  # 采集到的总帧数
+        self.dropped_count = 0   # 未被处理就被覆盖的帧数
+
+    def put(self, frame):
+        """放入一帧，覆盖尚未被取走的旧帧。有旧帧被覆盖时返回 True。"""
+        with self._cond:
+            dropped = self._frame is not None
+            if dropped:
+                self.dropped_count += 1
+            self._frame = frame
+            self.received_count += 1
+            self._cond.notify()
+            return dropped
+
+    def take(self, timeout=None):
+        """取走最新的一帧；超时或信箱已关闭且为空时返回 None。"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._frame is not None or self._closed, timeout
+            )
+            frame = self._frame
+            self._frame = None
+            return frame
+
+    def close(self):
+        """关闭信箱，唤醒正在等待的处理线程。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+def run_frame_capture(source, mailbox, state, latency=None):
+    """
+    在一个独立线程中运行，只负责从已打开的帧源中读取完整的 JPEG 帧，
+    连同 SOI、EOI 的到达时刻以 (帧, SOI 时刻, EOI 时刻) 的形式放入信箱。
+    不做任何解码或检测，因此总能跟上网络的速度。
+    latency 为 LatencyEstimator 时，每一帧的到达时刻都会交给它统计帧间隔和传输延迟。
+    """
+    frames_in = REGISTRY.counter('camera_frames_received_total', "从帧源收到的完整JPEG帧数")
+    frames_dropped = REGISTRY.counter('camera_frames_dropped_total', "未被处理就被新帧覆盖的帧数")
+    try:
+        for jpg, soi_time, eoi_time in source.iter_timed_frames():
+            if not state.running:
+                break
+            frames_in.inc()
+            if latency is not None:
+                latency.on_frame(soi_time, eoi_time)
+            # 帧源产出的 memoryview 在取下一帧后失效，放入信箱前需要拷贝一份
+            if mailbox.put((bytes(jpg), soi_time, eoi_time)):
+                frames_dropped.inc()
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        print(f"[采集线程] 读取帧源时发生错误: {e}")
+    finally:
+        source.close()
+        mailbox.close()
+    print("[采集线程] 正在关闭...")
@@ -0,0 +1,266 @@
+"""Gimbal controller module
+
+用法（标定舵机单位与像素的换算关系，画面中需要有一个静止的目标）:
+    python gimbal_controller.py                       # 在舵机中位附近沿 x、y 轴各走几步
+    python gimbal_controller.py --base 150 45 --step 10 --json gimbal.json
+
+标定结果 GIMBAL_PIXELS_PER_UNIT 复制到 config.py 后，把 GIMBAL_CONTROLLER 设置为 'pid' 即可启用。
+"""
+
+import argparse
+import collections
+import json
+import threading
+import time
+import numpy as np
+from config import (
+    SERVO_X_MIN,
+    SERVO_X_MAX,
+    SERVO_Y_MIN,
+    SERVO_Y_MAX,
+    GIMBAL_PIXELS_PER_UNIT,
+    GIMBAL_KP,
+    GIMBAL_KI,
+    GIMBAL_KD,
+    GIMBAL_INTEGRAL_LIMIT,
+    GIMBAL_MAX_RATE,
+)
+
+SERVO_LIMITS = ((SERVO_X_MIN, SERVO_X_MAX), (SERVO_Y_MIN, SERVO_Y_MAX))
+# 每个舵机单位至少要对应的像素数（绝对值）；换算关系接近 0 时，很小的像素误差换算成舵机单位后
+# 会变得极大，舵机会直接被推到限位
+MIN_PIXELS_PER_UNIT = 0.1
+
+
+def clamp(value, min_value, max_value):
+    return max(min_value, min(value, max_value))
+
+
+class ServoHistory:
+    """最近下达过的舵机位置及其时刻，用于查询某一时刻舵机所处的位置。"""
+
+    def __init__(self, maxlen=256):
+        self._times = collections.deque(maxlen=maxlen)
+        self._positions = collections.deque(maxlen=maxlen)
+
+    def record(self, t, position):
+        """记录 t 时刻下达的舵机位置，t 应单调不减。"""
+        self._times.append(t)
+        self._positions.append(position)
+
+    def at(self, t):
+        """t 时刻舵机所处的位置，即 t 之前最近一次下达的位置；早于所有记录时返回最早的一条，没有记录时返回 None。"""
+        if not self._times:
+            return None
+        # 查询的几乎总是最近几拍，从新往旧找
+        for i in range(len(self._times) - 1, -1, -1):
+            if self._times[i] <= t:
+                return self._positions[i]
+        return self._positions[0]
+
+
+class GimbalController:
+    """
+    把目标与激光中心的误差换算成舵机位置的 PID 控制器。
+
+    pixels_per_unit 为舵机每移动一个单位，目标在画面中移动的像素数 (x, y)，由 calibrate() 测得；
+    符号约定与原来的步进控制相同，即舵机位置增大时目标在画面中的坐标也增大。
+    误差先按它换算成舵机单位，PID 的输出是舵机速度（单位/秒），限制在 max_rate 以内，
+    乘以循环间隔后累加到舵机位置上，因此事件驱动下循环间隔变化时控制效果保持一致。
+    比例项在一个周期内最多消除全部误差，循环间隔较长时也不会越过目标。
+    积分项限幅为 integral_limit（单位·秒），并且在输出饱和（速度或舵机限位）且误差会加剧饱和时停止累积。
+    pixels_per_unit 的绝对值小于 MIN_PIXELS_PER_UNIT 时抛出 ValueError。
+    """
+
+    def __init__(self, pixels_per_unit=GIMBAL_PIXELS_PER_UNIT, kp=GIMBAL_KP, ki=GIMBAL_KI, kd=GIMBAL_KD,
+                 integral_limit=GIMBAL_INTEGRAL_LIMIT, max_rate=GIMBAL_MAX_RATE, limits=SERVO_LIMITS):
+        self.pixels_per_unit = tuple(float(p) for p in pixels_per_unit)
+        for axis, p in zip('xy', self.pixels_per_unit):
+            if not abs(p) >= MIN_PIXELS_PER_UNIT:
+                raise ValueError(f"{axis} 轴的换算关系 {p} 像素/单位过小，请重新标定 GIMBAL_PIXELS_PER_UNIT")
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.integral_limit = integral_limit
+        self.max_rate = max_rate
+        self.limits = limits
+        self.reset()
+
+    def reset(self):
+        """清除积分、微分和舵机位置的小数部分，例如在丢失目标之后。"""
+        self._integral = [0.0, 0.0]
+        self._last_error = [None, None]
+        self._position = None
+
+    def to_units(self, error_px):
+        """把像素误差 (x, y) 换算成舵机单位。"""
+        return error_px[0] / self.pixels_per_unit[0], error_px[1] / self.pixels_per_unit[1]
+
+    def to_pixels(self, units):
+        """把舵机单位 (x, y) 换算成画面中的像素。"""
+        return units[0] * self.pixels_per_unit[0], units[1] * self.pixels_per_unit[1]
+
+    def update(self, error, position, dt):
+        """
+        error 为舵机还需要移动的单位数 (x, y)，position 为当前下达的舵机位置，dt 为距上次调用的秒数。
+        返回新的舵机位置（整数）。
+        """
+        # 小数部分保存在控制器内部，低速时不会因为每拍取整而停住；
+        # 舵机位置被其他逻辑（巡航、限位转向）改过时以传入的位置为准
+        if self._position is None or tuple(round(p) for p in self._position) != tuple(position):
+            self._position = [float(position[0]), float(position[1])]
+        if dt > 0:
+            for axis in (0, 1):
+                self._update_axis(axis, error[axis], dt)
+        return int(round(self._position[0])), int(round(self._position[1]))
+
+    def _update_axis(self, axis, error, dt):
+        last_error = self._last_error[axis]
+        self._last_error[axis] = error
+        derivative = 0.0 if last_error is None else self.kd * (error - last_error) / dt
+        integral = clamp(self._integral[axis] + error * dt, -self.integral_limit, self.integral_limit)
+        rate = min(self.kp, 1.0 / dt) * error + self.ki * integral + derivative
+        limited = clamp(rate, -self.max_rate, self.max_rate)
+        target = self._position[axis] + limited * dt
+        lo, hi = self.limits[axis]
+        bounded = clamp(target, lo, hi)
+        saturated = limited != rate or bounded != target
+        if not saturated or error * rate < 0:
+            self._integral[axis] = integral
+        self._position[axis] = bounded
+
+
+def calibrate(move_to, observe, base, step=10, points=2, limits=SERVO_LIMITS):
+    """
+    测量舵机单位与像素的换算关系：依次把舵机移到 base 附近 x、y 轴上
+    base - points * step 到 base + points * step 的位置，用 observe() 读取静止目标在画面中的坐标，
+    对像素坐标与舵机位置做最小二乘直线拟合，斜率即为每个舵机单位对应的像素数。
+
+    move_to(position) 下达舵机位置，observe() 等舵机稳定后返回目标坐标 (x, y)，看不到目标时返回 None，
+    这些点会被跳过。返回 {'pixels_per_unit': (x, y), 'residual_px': (x, y), 'samples': (x, y)}，
+    residual_px 为拟合残差的均方根。某个轴有效的点少于 2 个，或拟合出的斜率绝对值小于 MIN_PIXELS_PER_UNIT
+    （目标没有随舵机移动）时抛出 ValueError。
+    """
+    slopes, residuals, samples = [], [], []
+    try:
+        for axis in (0, 1):
+            lo, hi = limits[axis]
+            units, pixels = [], []
+            for k in range(-points, points + 1):
+                position = list(base)
+                position[axis] = clamp(base[axis] + k * step, lo, hi)
+                move_to(tuple(position))
+                target = observe()
+                if target is not None:
+                    units.append(position[axis])
+                    pixels.append(target[axis])
+            if len(set(units)) < 2:
+                raise ValueError(f"{'xy'[axis]} 轴只在 {len(units)} 个位置上看到了目标，无法拟合")
+            slope, intercept = np.polyfit(units, pixels, 1)
+            if abs(slope) < MIN_PIXELS_PER_UNIT:
+                raise ValueError(f"{'xy'[axis]} 轴每个舵机单位目标只移动了 {slope:.3f} 像素，目标可能没有随舵机移动")
+            fitted = slope * np.asarray(units) + intercept
+            slopes.append(float(slope))
+            residuals.append(float(np.sqrt(np.mean((np.asarray(pixels) - fitted) ** 2))))
+            samples.append(len(units))
+    finally:
+        move_to(tuple(base))
+    return {'pixels_per_unit': tuple(slopes), 'residual_px': tuple(residuals), 'samples': tuple(samples)}
+
+
+def main():
+    # 只有命令行标定需要连接摄像头和蓝牙
+    # pylint: disable=import-outside-toplevel
+    import video_processor as vp
+    from adaptive_threshold import AdaptiveVThreshold
+    from bluetooth_communicator import run_bluetooth_communication
+    from color_lut import ColorLutMasker
+    from config import FRAME_SOURCE, REPLAY_FPS, REPLAY_LOOP
+    from frame_grabber import LatestFrameMailbox, run_frame_capture
+    from frame_source import create_frame_source, FrameSourceError
+    from state import SharedState, Command
+
+    parser = argparse.ArgumentParser(description="测量舵机每移动一个单位时目标在画面中移动的像素数")
+    parser.add_argument('--base', type=int, nargs=2, metavar=('X', 'Y'),
+                        default=((SERVO_X_MIN + SERVO_X_MAX) // 2, (SERVO_Y_MIN + SERVO_Y_MAX) // 2),
+                        help="标定的中心位置，默认为舵机行程的中点")
+    parser.add_argument('--step', type=int, default=10, help="每一步移动的舵机单位数")
+    parser.add_argument('--points', type=int, default=2, help="中心位置两侧各走的步数")
+    parser.add_argument('--settle', type=float, default=1.0, help="每次移动后等待舵机稳定的秒数")
+    parser.add_argument('--samples', type=int, default=5, help="每个位置取中位数的检测次数")
+    parser.add_argument('--json', help="把标定结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    source = create_frame_source(FRAME_SOURCE, fps=REPLAY_FPS, loop=REPLAY_LOOP)
+    try:
+        source.open()
+    except FrameSourceError as e:
+        print(f"[舵机标定] 错误：{e}")
+        return
+
+    base = tuple(args.base)
+    state = SharedState(command=Command(moving=base))
+    mailbox = LatestFrameMailbox()
+    threads = [
+        threading.Thread(target=run_frame_capture, args=(source, mailbox, state), daemon=True),
+        threading.Thread(target=run_bluetooth_communication, args=(state,), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    processor = vp.FrameProcessor(
+        vp.CONFIG.DECODE_SCALE,
+        lut_masker=ColorLutMasker(vp.CONFIG.COLOR_LUT_BITS) if vp.CONFIG.USE_COLOR_LUT else None,
+        adaptive_v=AdaptiveVThreshold(vp.CONFIG.ADAPTIVE_V_EMA_ALPHA),
+    )
+
+    def move_to(position):
+        print(f"[舵机标定] 移动到 {position}")
+        state.command = Command(moving=position)
+
+    def observe():
+        time.sleep(args.settle)
+        mailbox.take(timeout=0)  # 丢弃舵机移动过程中拍到的帧
+        found = []
+        for _ in range(args.samples * 3):
+            frame = mailbox.take(timeout=1.0)
+            if frame is None:
+                break
+            try:
+                target = vp.detect_frame(frame[0], processor)
+            except ValueError:
+                continue
+            if target is not None:
+                found.append(target)
+            if len(found) >= args.samples:
+                break
+        if not found:
+            print("[舵机标定] 警告：这个位置没有检测到目标")
+            return None
+        return tuple(np.median(np.asarray(found), axis=0))
+
+    # 先回到中心位置并等待稳定，第一个点才不会受之前位置的影响
+    move_to(base)
+    time.sleep(args.settle)
+    try:
+        result = calibrate(move_to, observe, base, args.step, args.points)
+    except ValueError as e:
+        print(f"[舵机标定] 错误：{e}")
+        return
+    finally:
+        time.sleep(0.3)  # 等蓝牙线程把回到中心位置的指令发出去
+        state.stop()
+        for thread in threads:
+            thread.join(timeout=2.0)
+
+    px, py = result['pixels_per_unit']
+    print(f"[舵机标定] 有效点数 x {result['samples'][0]}，y {result['samples'][1]}；"
+          f"拟合残差 x {result['residual_px'][0]:.2f}px，y {result['residual_px'][1]:.2f}px")
+    print("[舵机标定] 把下面的结果复制到 config.py 中：")
+    print(f"GIMBAL_PIXELS_PER_UNIT = ({px:.3f}, {py:.3f})")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Constant-velocity Kalman filter module"""
+
+import math
+import numpy as np
+
+# 与原来 filterpy 版本相同的噪声参数
+PROCESS_NOISE_POSITION = 1.0
+PROCESS_NOISE_VELOCITY = 0.02
+MEASUREMENT_NOISE = 0.02
+INITIAL_COVARIANCE = 100.0
+
+
+def create_kalman_filter(dt):
+    """
+    创建一个配置好的 filterpy 卡尔曼滤波器对象。
+    运行时已改用 ConstantVelocityKalman，这里保留作为数值一致性检查的参照，filterpy 只在调用时导入。
+    """
+    from filterpy.kalman import KalmanFilter  # pylint: disable=import-outside-toplevel
+
+    kf = KalmanFilter(dim_x=4, dim_z=2)
+    kf.F = np.array([[1, 0, dt, 0], [0, 1, 0, dt],
+                       [0, 0, 1, 0], [0, 0, 0, 1]])
+    kf.H = np.array([[1, 0, 0, 0], [0, 1, 0, 0]])
+    kf.R *= MEASUREMENT_NOISE
+    kf.Q[2:, 2:] *= PROCESS_NOISE_VELOCITY
+    kf.P *= INITIAL_COVARIANCE
+    return kf
+
+
+class ConstantVelocityKalman:
+    """
+    二维匀速运动模型的卡尔曼滤波器，状态为 (x, y, vx, vy)，测量值为 (x, y)。
+
+    状态转移、测量、噪声和初始协方差都不耦合 x 与 y，协方差因此始终是按轴分块的对角形式，
+    每个轴就是一个 (位置, 速度) 的二维滤波器。所有运算都写成闭式的标量公式，
+    状态保存在 __slots__ 中，每次预测和更新都不分配数组，结果与 create_kalman_filter 的 filterpy 版本
+    （包括 Joseph 形式的协方差更新）在浮点误差范围内一致。
+    """
+
+    __slots__ = ('x', 'y', 'vx', 'vy',
+                 'pxx', 'pxv', 'pvv_x', 'pyy', 'pyv', 'pvv_y',
+                 'q_pos', 'q_vel', 'r')
+
+    def __init__(self, q_pos=PROCESS_NOISE_POSITION, q_vel=PROCESS_NOISE_VELOCITY,
+                 r=MEASUREMENT_NOISE, p0=INITIAL_COVARIANCE):
+        self.x = self.y = self.vx = self.vy = 0.0
+        # 每个轴的协方差 [[位置方差, 位置-速度协方差], [位置-速度协方差, 速度方差]]
+        self.pxx = self.pvv_x = self.pyy = self.pvv_y = float(p0)
+        self.pxv = self.pyv = 0.0
+        self.q_pos = q_pos
+        self.q_vel = q_vel
+        self.r = r
+
+    @property
+    def position(self):
+        return self.x, self.y
+
+    @property
+    def position_std(self):
+        """位置估计的标准差 (sigma_x, sigma_y)。"""
+        return math.sqrt(self.pxx), math.sqrt(self.pyy)
+
+    def get_state(self):
+        """返回状态和协方差 (x, y, vx, vy, pxx, pxv, pvv_x, pyy, pyv, pvv_y)，可用 set_state 恢复。"""
+        return (self.x, self.y, self.vx, self.vy,
+                self.pxx, self.pxv, self.pvv_x, self.pyy, self.pyv, self.pvv_y)
+
+    def set_state(self, state):
+        """恢复 get_state 保存的状态和协方差，噪声参数不变。"""
+        (self.x, self.y, self.vx, self.vy,
+         self.pxx, self.pxv, self.pvv_x, self.pyy, self.pyv, self.pvv_y) = state
+
+    def set_position(self, x, y):
+        """直接设置位置，速度和协方差保持不变。"""
+        self.x = float(x)
+        self.y = float(y)
+
+    def predict(self, dt):
+        """把状态外推 dt 秒：x = F x，P = F P F^T + Q。"""
+        q_pos, q_vel = self.q_pos, self.q_vel
+        self.x += self.vx * dt
+        self.pxx += dt * (2 * self.pxv + dt * self.pvv_x) + q_pos
+        self.pxv += dt * self.pvv_x
+        self.pvv_x += q_vel
+        self.y += self.vy * dt
+        self.pyy += dt * (2 * self.pyv + dt * self.pvv_y) + q_pos
+        self.pyv += dt * self.pvv_y
+        self.pvv_y += q_vel
+
+    def update(self, zx, zy):
+        """用测量值 (zx, zy) 更新状态。"""
+        r = self.r
+        # x 轴
+        s = self.pxx + r
+        k0, k1 = self.pxx / s, self.pxv / s
+        innovation = zx - self.x
+        self.x += k0 * innovation
+        self.vx += k1 * innovation
+        # Joseph 形式：P = (I - K H) P (I - K H)^T + K R K^T
+        a = 1 - k0
+        pxx, pxv, pvv = self.pxx, self.pxv, self.pvv_x
+        self.pxx = a * a * pxx + k0 * k0 * r
+        self.pxv = a * (pxv - k1 * pxx) + k0 * k1 * r
+        self.pvv_x = pvv - 2 * k1 * pxv + k1 * k1 * (pxx + r)
+        # y 轴
+        s = self.pyy + r
+        k0, k1 = self.pyy / s, self.pyv / s
+        innovation = zy - self.y
+        self.y += k0 * innovation
+        self.vy += k1 * innovation
+        a = 1 - k0
+        pyy, pyv, pvv = self.pyy, self.pyv, self.pvv_y
+        self.pyy = a * a * pyy + k0 * k0 * r
+        self.pyv = a * (pyv - k1 * pyy) + k0 * k1 * r
+        self.pvv_y = pvv - 2 * k1 * pyv + k1 * k1 * (pyy + r)
+
+    def predict_ahead(self, horizon):
+        """
+        返回外推 horizon 秒后的位置 (x, y) 和位置方差 (var_x, var_y)，不修改滤波器本身。
+        与复制一份滤波器再调用一次 predict(horizon) 的结果相同；x、y 之间的协方差恒为 0。
+        """
+        return (
+            (self.x + self.vx * horizon, self.y + self.vy * horizon),
+            (self.pxx + horizon * (2 * self.pxv + horizon * self.pvv_x) + self.q_pos,
+             self.pyy + horizon * (2 * self.pyv + horizon * self.pvv_y) + self.q_pos),
+        )
@@ -0,0 +1,75 @@
+"""Online latency estimation module"""
+
+import time
+from metrics import REGISTRY
+
+
+def to_wall_clock(monotonic_time):
+    """把 time.monotonic() 时钟的时刻换算成 time.time() 时钟，用于录像等需要绝对时间的地方。"""
+    return monotonic_time + (time.time() - time.monotonic())
+
+
+class LatencyEstimator:
+    """
+    在线估计一帧画面从曝光到检测结果发布所经过的各段延迟（秒，time.monotonic() 时钟）：
+
+    - 帧间隔：相邻两帧 SOI 到达时刻之差，只接受 (0, max_interval] 内的值，排除断流和重连；
+    - 传输：SOI 到达到 EOI 到达；
+    - 处理：EOI 到达到检测结果发布，包括在信箱中等待的时间；
+    - 曝光到 SOI 到达：无法直接观测。摄像头先采集并压缩完整的一帧再开始发送，
+      因此按 capture_delay_frames 个帧间隔估计。
+
+    各项用指数滑动平均平滑。on_frame() 由采集线程对每一帧调用，on_result() 由处理线程调用。
+    """
+
+    def __init__(self, alpha=0.1, capture_delay_frames=1.0, max_interval=1.0):
+        self.alpha = alpha
+        self.capture_delay_frames = capture_delay_frames
+        self.max_interval = max_interval
+        self.frame_interval = None
+        self.transport = None
+        self.pipeline = None
+        self._last_soi = None
+
+        help_text = "每帧各段延迟（秒）"
+        self._interval_hist = REGISTRY.histogram('camera_latency_seconds', help_text, {'stage': 'frame_interval'})
+        self._transport_hist = REGISTRY.histogram('camera_latency_seconds', help_text, {'stage': 'transport'})
+        self._pipeline_hist = REGISTRY.histogram('camera_latency_seconds', help_text, {'stage': 'pipeline'})
+        self._total_gauge = REGISTRY.gauge(
+            'camera_estimated_latency_seconds', "估计的曝光到检测结果发布的总延迟（秒）"
+        )
+
+    def _smooth(self, current, value):
+        return value if current is None else current + self.alpha * (value - current)
+
+    def on_frame(self, soi_time, eoi_time):
+        """记录收到的一帧（包括随后因处理不及被丢弃的帧）。"""
+        if self._last_soi is not None:
+            interval = soi_time - self._last_soi
+            if 0 < interval <= self.max_interval:
+                self.frame_interval = self._smooth(self.frame_interval, interval)
+                self._interval_hist.observe(interval)
+        self._last_soi = soi_time
+        transport = eoi_time - soi_time
+        self.transport = self._smooth(self.transport, transport)
+        self._transport_hist.observe(transport)
+
+    def on_result(self, eoi_time, done_time):
+        """记录一帧处理完成、检测结果已经发布。"""
+        pipeline = done_time - eoi_time
+        self.pipeline = self._smooth(self.pipeline, pipeline)
+        self._pipeline_hist.observe(pipeline)
+        self._total_gauge.set(self.total())
+
+    @property
+    def capture_delay(self):
+        """估计的曝光到 SOI 到达之间的时间。"""
+        return self.capture_delay_frames * (self.frame_interval or 0.0)
+
+    def capture_time(self, soi_time):
+        """由 SOI 到达时刻估计这一帧的曝光时刻。"""
+        return soi_time - self.capture_delay
+
+    def total(self):
+        """估计的曝光到检测结果发布的平均总延迟。"""
+        return self.capture_delay + (self.transport or 0.0) + (self.pipeline or 0.0)
@@ -5,31 +5,32 @@ import time
 from video_processor import run_video_processing
 from bluetooth_communicator import run_bluetooth_communication
 from center_control import run_center_control
+from metrics import start_metrics_server
+from measurement_queue import MeasurementQueue
+from state import SharedState
+from config import METRICS_PORT, MEASUREMENT_QUEUE_SIZE
 
 if __name__ == "__main__":
-    # 创建用于线程间通信的共享状态字典和锁
-    shared_state = {
-        "detection_data": None,
-        "firing": False,
-        "moving": (0, 0),
-        "scan_direction_x": 1,
-        "running": True,
-        "random_move": False,
-        'ifturn':0
-    }
-    lock = threading.Lock()
+    # 创建用于线程间通信的共享状态：每个生产者发布自己的不可变快照，读者不需要加锁
+    state = SharedState()
+    # 视频线程把每个检测结果连同曝光时刻放入队列，中控线程按时间顺序全部用于更新滤波器
+    measurements = MeasurementQueue(MEASUREMENT_QUEUE_SIZE)
 
     # 创建线程
     video_thread = threading.Thread(
-        target=run_video_processing, args=(shared_state, lock)
+        target=run_video_processing, args=(state, measurements)
     )
     bluetooth_thread = threading.Thread(
-        target=run_bluetooth_communication, args=(shared_state, lock)
+        target=run_bluetooth_communication, args=(state,)
     )
     center_control_thread = threading.Thread(
-        target=run_center_control, args=(shared_state, lock)
+        target=run_center_control, args=(state, measurements)
     )
 
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"[主程序] 监控指标已在 http://127.0.0.1:{METRICS_PORT}/metrics 上导出。")
+
     print("[主程序] 正在启动线程...")
 
     # 启动线程
@@ -42,29 +43,25 @@ if __name__ == "__main__":
     try:
         # 主线程现在在一个循环中等待，这样才能响应 KeyboardInterrupt
         # 并检查子线程是否因为其他原因（如关闭视频窗口）而退出
-        while shared_state["running"]:
+        while state.running:
             if not video_thread.is_alive():
                 print("[主程序] 视频线程已退出，正在关闭程序...")
-                with lock:
-                    shared_state["running"] = False
+                state.stop()
                 break
             if not bluetooth_thread.is_alive():
                 print("[主程序] 蓝牙线程已退出，正在关闭程序...")
-                with lock:
-                    shared_state["running"] = False
+                state.stop()
                 break
             if not center_control_thread.is_alive():
                 print("[主程序] 中心控制线程已退出，正在关闭程序...")
-                with lock:
-                    shared_state["running"] = False
+                state.stop()
                 break
             time.sleep(0.5)  # 短暂休眠以降低CPU占用
 
     except KeyboardInterrupt:
         print("\n[主程序] 检测到 Ctrl+C，正在关闭所有线程...")
         # 捕获到 Ctrl+C 后，设置 'running' 为 False，通知子线程退出
-        with lock:
-            shared_state["running"] = False
+        state.stop()
 
     finally:
         # 等待子线程完全结束
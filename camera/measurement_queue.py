@@ -0,0 +1,48 @@
+"""Measurement queue module"""
+
+import collections
+import threading
+
+
+class MeasurementQueue:
+    """
+    视频线程与中控线程之间有界的带时间戳测量队列。
+
+    视频线程每检测到一次目标就放入 (曝光时刻, 坐标)，中控线程每次循环一次性取走所有待处理的测量，
+    按曝光时刻依次更新滤波器，两次循环之间产生的检测结果因此不会丢失。
+    中控线程长时间没有取走时，队列满后丢弃最旧的测量并计数。
+    """
+
+    def __init__(self, maxlen=32):
+        self._cond = threading.Condition()
+        self._items = collections.deque(maxlen=maxlen)
+        self.put_count = 0      # 放入的总测量数
+        self.dropped_count = 0  # 因队列已满被丢弃的测量数
+
+    def put(self, capture_time, coords):
+        """放入一个测量并唤醒等待的中控线程。有旧测量因队列已满被丢弃时返回 True。"""
+        with self._cond:
+            dropped = len(self._items) == self._items.maxlen
+            if dropped:
+                self.dropped_count += 1
+            self._items.append((capture_time, coords))
+            self.put_count += 1
+            self._cond.notify()
+            return dropped
+
+    def drain(self):
+        """取走所有待处理的测量，按曝光时刻从早到晚排序后返回。"""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+        # 多进程检测时结果基本有序，曝光时刻的估计也可能略有抖动，排序几乎没有开销
+        items.sort(key=lambda item: item[0])
+        return items
+
+    def wait(self, timeout=None):
+        """等待到队列中有测量或超时，有测量时返回 True。"""
+        with self._cond:
+            return bool(self._cond.wait_for(lambda: self._items, timeout))
+
+    def __len__(self):
+        return len(self._items)
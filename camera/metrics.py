@@ -0,0 +1,213 @@
+"""Metrics module"""
+
+import bisect
+import http.server
+import threading
+import time
+
+# 默认的延迟直方图分桶（秒），覆盖 0.1ms 到 1s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Counter:
+    """只增不减的计数器。"""
+
+    kind = 'counter'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def render(self, name):
+        return [f'{name}{_format_labels(self.labels)} {self._value}']
+
+
+class Gauge:
+    """可以任意设置的瞬时值。"""
+
+    kind = 'gauge'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self._value = 0.0
+
+    def set(self, value):
+        # 单次赋值在 GIL 下是原子的，不需要加锁
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def render(self, name):
+        return [f'{name}{_format_labels(self.labels)} {self._value}']
+
+
+class Histogram:
+    """固定分桶的直方图，用于统计耗时分布。"""
+
+    kind = 'histogram'
+
+    def __init__(self, labels=(), buckets=DEFAULT_BUCKETS):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def observe_since(self, start):
+        """
+        记录从 start（time.perf_counter() 的返回值）到现在的耗时，并返回现在的时间，
+        便于在流水线中逐段计时：t = stage_a.observe_since(t); t = stage_b.observe_since(t)
+        """
+        now = time.perf_counter()
+        self.observe(now - start)
+        return now
+
+    def time(self):
+        """用作上下文管理器，统计 with 块的耗时。"""
+        return _Timer(self)
+
+    @property
+    def count(self):
+        return self._count
+
+    def render(self, name):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            labels = self.labels + (('le', repr(bound)),)
+            lines.append(f'{name}_bucket{_format_labels(labels)} {cumulative}')
+        labels = self.labels + (('le', '+Inf'),)
+        lines.append(f'{name}_bucket{_format_labels(labels)} {count}')
+        lines.append(f'{name}_sum{_format_labels(self.labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(self.labels)} {count}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_start')
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表。
+
+    同名同标签的指标只会创建一次，热路径上应在循环外取得指标对象，
+    循环内只调用 inc / set / observe。
+    """
+
+    def __init__(self):
+        self._metrics = {}  # name -> (kind, help, {labels: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        labels = tuple(sorted(labels.items())) if labels else ()
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = (cls.kind, help_text, {})
+            kind, _, series = self._metrics[name]
+            if kind != cls.kind:
+                raise ValueError(f"指标 {name} 已注册为 {kind}")
+            if labels not in series:
+                series[labels] = cls(labels=labels, **kwargs)
+            return series[labels]
+
+    def counter(self, name, help_text='', labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', labels=None):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """以 Prometheus 文本格式导出所有指标。"""
+        with self._lock:
+            items = sorted(
+                (name, kind, help_text, list(series.values()))
+                for name, (kind, help_text, series) in self._metrics.items()
+            )
+        lines = []
+        for name, kind, help_text, series in items:
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in series:
+                lines.extend(metric.render(name))
+        return '\n'.join(lines) + '\n'
+
+
+# 全局默认注册表，各线程共用
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=REGISTRY):
+    """
+    在后台线程中启动一个独立的 HTTP 服务器，在 /metrics 上导出指标。
+    """
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
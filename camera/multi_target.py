@@ -0,0 +1,201 @@
+"""Multi-target tracking module"""
+
+import itertools
+import cv2
+import numpy as np
+from kalman import ConstantVelocityKalman
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # 没有安装 scipy 时退回贪心匹配
+    linear_sum_assignment = None
+
+# 目标选择策略
+POLICY_CLOSEST = 'closest'    # 离激光中心最近
+POLICY_LONGEST = 'longest'    # 被连续追踪时间最长
+POLICY_LARGEST = 'largest'    # 面积最大
+POLICIES = (POLICY_CLOSEST, POLICY_LONGEST, POLICY_LARGEST)
+
+# 超出关联门限的代价，保证不会被选作匹配
+_GATED_COST = 1e9
+
+
+def find_blobs(color_mask, scale=1, min_area=0, aspect_range=None,
+               rotate_cw=False, frame_height=None):
+    """
+    用 connectedComponentsWithStats 一次性提取掩码中的所有连通区域，并用向量化的方式筛选。
+
+    面积（换算到全分辨率后）不大于 min_area 的区域被丢弃；aspect_range 为 (最小, 最大) 长宽比时，
+    宽/高 和 高/宽 都不在范围内的区域也被丢弃。
+    rotate_cw 为 True 时 color_mask 是未旋转的图像，结果会映射到顺时针旋转 90 度后的坐标。
+    返回 (centers, boxes, areas)：centers 为 (N, 2) 的浮点质心，boxes 为 (N, 4) 的 (x, y, w, h)，
+    均为（可能缩小的）掩码图像中的坐标；areas 为 (N,) 的全分辨率面积。
+    """
+    # 稀疏的二值掩码上 Grana (BBDT) 算法比默认算法快约 3 倍
+    _, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+        color_mask, 8, cv2.CV_32S, cv2.CCL_GRANA
+    )
+    # 第 0 个连通区域是背景
+    stats = stats[1:]
+    centers = centroids[1:]
+    areas = stats[:, cv2.CC_STAT_AREA] * (scale * scale)
+    keep = areas > min_area
+    if aspect_range is not None:
+        ratio = stats[:, cv2.CC_STAT_WIDTH] / stats[:, cv2.CC_STAT_HEIGHT]
+        low, high = aspect_range
+        keep &= ((low < ratio) & (ratio < high)) | ((low < 1 / ratio) & (1 / ratio < high))
+    stats, centers, areas = stats[keep], centers[keep], areas[keep]
+
+    boxes = stats[:, :4].copy()
+    if rotate_cw:
+        height = frame_height or color_mask.shape[0]
+        # (x, y) -> (height-1-y, x)；外接矩形的左上角来自原来的左下角，宽高互换
+        centers = np.column_stack((height - 1 - centers[:, 1], centers[:, 0]))
+        boxes = np.column_stack((
+            height - stats[:, cv2.CC_STAT_TOP] - stats[:, cv2.CC_STAT_HEIGHT],
+            stats[:, cv2.CC_STAT_LEFT],
+            stats[:, cv2.CC_STAT_HEIGHT],
+            stats[:, cv2.CC_STAT_WIDTH],
+        ))
+    return centers, boxes, areas
+
+
+def _greedy_assignment(cost):
+    """按代价从小到大贪心匹配，返回 (行下标, 列下标)。"""
+    rows, cols = [], []
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(cost, axis=None):
+        r, c = divmod(int(flat), cost.shape[1])
+        if r in used_rows or c in used_cols:
+            continue
+        if cost[r, c] >= _GATED_COST:
+            break
+        used_rows.add(r)
+        used_cols.add(c)
+        rows.append(r)
+        cols.append(c)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+
+def assign(cost):
+    """
+    求解代价矩阵的最小代价匹配，返回 (行下标, 列下标)，不包括超出门限的配对。
+    安装了 scipy 时使用匈牙利算法，否则使用贪心匹配。
+    """
+    if cost.size == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    if linear_sum_assignment is None:
+        return _greedy_assignment(cost)
+    rows, cols = linear_sum_assignment(cost)
+    valid = cost[rows, cols] < _GATED_COST
+    return rows[valid], cols[valid]
+
+
+class Track:
+    """一个被持续追踪的目标，带有独立的卡尔曼滤波器。"""
+
+    def __init__(self, track_id, position, area, timestamp):
+        self.id = track_id
+        self.kf = ConstantVelocityKalman()
+        self.kf.set_position(position[0], position[1])
+        self.measurement = tuple(position)  # 最近一次匹配到的测量值
+        self.area = area
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1      # 匹配到测量值的总帧数
+        self.missed = 0    # 连续没有匹配到测量值的帧数
+
+    @property
+    def position(self):
+        """滤波后的位置估计。"""
+        return self.kf.position
+
+    @property
+    def lifetime(self):
+        return self.last_seen - self.first_seen
+
+    def predict(self, dt):
+        self.kf.predict(dt)
+
+    def update(self, position, area, timestamp):
+        self.kf.update(float(position[0]), float(position[1]))
+        self.measurement = tuple(position)
+        self.area = area
+        self.last_seen = timestamp
+        self.hits += 1
+        self.missed = 0
+
+
+class MultiTargetTracker:
+    """
+    多目标追踪：每帧把检测到的所有目标与已有轨迹按预测位置的距离做最优匹配，
+    匹配上的轨迹用测量值更新各自的卡尔曼滤波器，没有匹配上的检测开启新轨迹，
+    连续 max_missed 帧没有匹配上的轨迹被删除。轨迹编号在整个运行期间不重复。
+    """
+
+    def __init__(self, max_distance=40.0, max_missed=5, min_hits=2, dt=0.05):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.dt = dt
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._last_time = None
+
+    def update(self, centers, areas, timestamp):
+        """
+        用一帧的检测结果更新所有轨迹。centers 为 (N, 2) 的全分辨率坐标，areas 为 (N,) 的面积。
+        返回当前存活的轨迹列表。
+        """
+        dt = self.dt if self._last_time is None else min(max(timestamp - self._last_time, 0.0), 1.0)
+        self._last_time = timestamp
+        for track in self.tracks:
+            track.predict(dt)
+
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if self.tracks and len(centers):
+            predicted = np.array([track.position for track in self.tracks])
+            cost = np.linalg.norm(predicted[:, None, :] - centers[None, :, :], axis=2)
+            cost[cost > self.max_distance] = _GATED_COST
+            rows, cols = assign(cost)
+        else:
+            rows = cols = np.empty(0, dtype=int)
+
+        matched_tracks = set(rows.tolist())
+        matched_detections = set(cols.tolist())
+        for r, c in zip(rows, cols):
+            self.tracks[r].update(centers[c], float(areas[c]), timestamp)
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        for c in range(len(centers)):
+            if c not in matched_detections:
+                self.tracks.append(
+                    Track(next(self._ids), centers[c], float(areas[c]), timestamp)
+                )
+        return self.tracks
+
+    def confirmed(self):
+        """匹配次数达到 min_hits 的轨迹，包括本帧暂时没有匹配上测量值的。"""
+        return [t for t in self.tracks if t.hits >= self.min_hits]
+
+
+def select_target(tracks, policy=POLICY_CLOSEST, center=(0, 0), previous_id=None):
+    """
+    按照策略从轨迹中选出要瞄准的目标，没有可选目标时返回 None。
+    上一次选中的轨迹仍然可选时继续选它，避免在多个目标之间来回切换。
+    """
+    if not tracks:
+        return None
+    for track in tracks:
+        if track.id == previous_id:
+            return track
+    if policy == POLICY_CLOSEST:
+        return min(tracks, key=lambda t: (t.position[0] - center[0]) ** 2
+                   + (t.position[1] - center[1]) ** 2)
+    if policy == POLICY_LONGEST:
+        return max(tracks, key=lambda t: (t.lifetime, t.hits))
+    if policy == POLICY_LARGEST:
+        return max(tracks, key=lambda t: t.area)
+    raise ValueError(f"未知的目标选择策略: {policy}，可选值为 {', '.join(POLICIES)}")
@@ -0,0 +1,158 @@
+"""Video recording module"""
+
+import mmap
+import queue
+import threading
+import cv2
+import numpy as np
+from frame_source import INDEX_RECORD, index_path_for
+
+# 索引文件的记录格式在 frame_source 中定义，回放录像时按其中的采集时间戳控制节奏
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('timestamp', '<f8'),
+    ('detected', 'u1'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+])
+assert INDEX_DTYPE.itemsize == INDEX_RECORD.size
+
+
+class MjpegRecorder:
+    """
+    把原始 JPEG 帧（不重新编码）追加写入单个录像文件，
+    同时在旁边的 .idx 文件中写入每帧的 (偏移, 长度, 采集时间戳, 检测结果)。
+
+    写盘在后台线程中完成，视频线程只做一次非阻塞的入队操作；
+    队列满时直接丢弃该帧并计数，绝不拖慢检测。
+    录像数据文件就是若干 JPEG 首尾相接，也可以直接用 MjpegFileSource 回放。
+    写盘出错（例如磁盘已满）时后台线程停止录像，之后提交的帧都计为丢弃，错误由 close() 重新抛出。
+    """
+
+    def __init__(self, path, max_queue_size=64):
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = threading.Thread(target=self._run_writer, daemon=True)
+        self.recorded_count = 0
+        self.dropped_count = 0
+        self.error = None  # 写盘线程因异常退出时的异常
+
+    def start(self):
+        self._thread.start()
+
+    def record(self, jpg, timestamp, detection=None):
+        """
+        提交一帧。jpg 必须是不会再被修改的 bytes，
+        detection 为检测到的目标坐标 (x, y)，未检测到时为 None。
+        """
+        if self.error is not None:
+            self.dropped_count += 1
+            return
+        try:
+            self._queue.put_nowait((jpg, timestamp, detection))
+        except queue.Full:
+            self.dropped_count += 1
+
+    def close(self):
+        """
+        等待队列中剩余的帧写完并关闭文件。
+        写盘线程已经出错退出时不再等待，重新抛出它的异常。
+        """
+        # 写盘线程退出后队列不会再被取空，不能阻塞地等待队列腾出位置
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run_writer(self):
+        try:
+            self._write_frames()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.error = e
+            print(f"[录像] 写入录像时发生错误，停止录像: {e}")
+
+    def _write_frames(self):
+        with open(self.path, 'ab') as data_file, \
+                open(index_path_for(self.path), 'ab') as index_file:
+            offset = data_file.tell()
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                jpg, timestamp, detection = item
+                data_file.write(jpg)
+                if detection is None:
+                    record = INDEX_RECORD.pack(offset, len(jpg), timestamp, 0, 0, 0)
+                else:
+                    # 检测结果是亚像素的浮点坐标，索引中按整数像素保存
+                    record = INDEX_RECORD.pack(
+                        offset, len(jpg), timestamp, 1, round(detection[0]), round(detection[1])
+                    )
+                index_file.write(record)
+                offset += len(jpg)
+                self.recorded_count += 1
+                # 队列空闲时再刷盘，避免每帧都触发系统调用
+                if self._queue.empty():
+                    data_file.flush()
+                    index_file.flush()
+
+
+class MjpegRecording:
+    """
+    以内存映射的方式打开一段录像，可以随机访问任意帧而无需把整个文件读入内存。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = np.fromfile(index_path_for(path), dtype=INDEX_DTYPE)
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp']
+
+    def frame(self, i):
+        """第 i 帧的原始 JPEG 数据，是指向映射内存的 memoryview，不会产生拷贝。"""
+        offset = int(self.index['offset'][i])
+        return self._view[offset:offset + int(self.index['length'][i])]
+
+    def decode(self, i, flags=cv2.IMREAD_COLOR):
+        return cv2.imdecode(np.frombuffer(self.frame(i), dtype=np.uint8), flags)
+
+    def detection(self, i):
+        """第 i 帧录制时的检测结果 (x, y)，未检测到时为 None。"""
+        record = self.index[i]
+        if not record['detected']:
+            return None
+        return int(record['x']), int(record['y'])
+
+    def seek_time(self, timestamp):
+        """返回第一帧采集时间不早于 timestamp 的帧号。"""
+        return int(np.searchsorted(self.index['timestamp'], timestamp))
+
+    def frames(self, start=0, stop=None):
+        """依次产出 [start, stop) 范围内各帧的原始 JPEG 数据。"""
+        for i in range(*slice(start, stop).indices(len(self))):
+            yield self.frame(i)
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
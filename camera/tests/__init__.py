@@ -0,0 +1 @@
+"""Tests"""
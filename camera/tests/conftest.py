@@ -0,0 +1,17 @@
+"""pytest 配置：测试与各脚本一样直接导入 camera/ 下的模块。"""
+
+import os
+import sys
+import pytest
+
+CAMERA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if CAMERA_DIR not in sys.path:
+    sys.path.insert(0, CAMERA_DIR)
+
+from benchmark import make_synthetic_frames  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture(scope='session')
+def frames():
+    """与摄像头原始画面尺寸一致的合成 JPEG 帧，每帧一个红色方块。"""
+    return make_synthetic_frames(40)
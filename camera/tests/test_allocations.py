@@ -0,0 +1,77 @@
+"""稳定运行时检测流水线不再逐帧分配内存"""
+
+import gc
+import tracemalloc
+import pytest
+import video_processor as vp
+from benchmark import config_override, make_processor
+
+WARMUP = 20
+ROUNDS = 5
+# 处理全部帧后允许的内存增长（字节）：与帧数无关的固定上限，
+# 每帧哪怕只多留下一个小对象，ROUNDS * 帧数 帧之后也会超过
+MAX_GROWTH = 4096
+
+CONFIGS = [
+    {},
+    {'ROTATION_FREE_DETECTION': True},
+    {'USE_COLOR_LUT': True},
+    {'ADAPTIVE_V_CHANNEL': True},
+    {'ENABLE_WHITE_BALANCE': True},
+]
+
+
+def traced(func):
+    """运行 func，返回 (运行前后已分配内存的增长, 运行过程中的最大瞬时分配)，单位为字节。"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before, peak - before
+
+
+@pytest.mark.parametrize('overrides', CONFIGS, ids=lambda o: ','.join(o) or 'default')
+def test_detect_frame_steady_state_growth(frames, overrides):
+    with config_override(**overrides):
+        processor = make_processor(1)
+        for jpg in frames[:WARMUP]:
+            vp.detect_frame(jpg, processor)
+
+        def run():
+            for _ in range(ROUNDS):
+                for jpg in frames:
+                    vp.detect_frame(jpg, processor)
+
+        growth, _ = traced(run)
+    assert growth < MAX_GROWTH, f"{ROUNDS * len(frames)} 帧后内存增长 {growth} 字节"
+
+
+@pytest.mark.parametrize('overrides', CONFIGS, ids=lambda o: ','.join(o) or 'default')
+def test_processing_peak_below_one_image(frames, overrides):
+    """
+    不含 JPEG 解码（必然产生一幅新图像）时，单帧处理过程中的瞬时分配远小于一幅图像，
+    即所有中间结果都写入了 FrameProcessor 的缓冲区。
+    """
+    decoded = [vp.decode_frame(jpg) for jpg in frames]
+    with config_override(**overrides):
+        processor = make_processor(1)
+
+        def process(img):
+            if vp.CONFIG.ENABLE_WHITE_BALANCE:
+                img = processor.white_balance(img)
+            if not vp.CONFIG.ROTATION_FREE_DETECTION:
+                img = processor.rotate(img)
+            hsv = None if processor.uses_lut else processor.to_hsv(img)
+            return vp.find_target(processor.morphology(processor.mask(img, hsv)),
+                                  rotate_cw=vp.CONFIG.ROTATION_FREE_DETECTION)
+
+        for img in decoded[:WARMUP]:
+            process(img)
+        peak = max(traced(lambda img=img: process(img))[1] for img in decoded)
+    # numpy 类型转换时使用的固定大小的缓冲区（约 32KB）不随图像尺寸变化，允许存在
+    assert peak < decoded[0].nbytes // 4, f"单帧最大瞬时分配 {peak} 字节"
@@ -0,0 +1,66 @@
+"""蓝牙线程的重连计数与发送计数"""
+
+import types
+import serial
+import bluetooth_communicator as bc
+from metrics import REGISTRY
+from state import SharedState
+
+
+class FakePort:
+    """模拟的串口：第 fail_at 次写入时连接断开，第 stop_at 次写入后通知线程退出。"""
+
+    def __init__(self, state, fail_at=None, stop_at=None):
+        self.state = state
+        self.fail_at = fail_at
+        self.stop_at = stop_at
+        self.writes = 0
+        self.is_open = True
+        self.out_waiting = 0
+
+    def write(self, data):
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise serial.SerialException("device disconnected")
+        if self.writes == self.stop_at:
+            self.state.stop()
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+def run(monkeypatch, state, outcomes):
+    """依次按 outcomes 打开串口（SerialException 表示打开失败）运行蓝牙线程，返回各计数器的增量。"""
+    outcomes = iter(outcomes)
+
+    def open_port(*_args, **_kwargs):
+        outcome = next(outcomes)
+        if outcome is serial.SerialException:
+            raise serial.SerialException("could not open port")
+        return outcome
+
+    monkeypatch.setattr(bc.serial, 'Serial', open_port)
+    monkeypatch.setattr(bc, 'time', types.SimpleNamespace(sleep=lambda _: None))
+    names = ('bluetooth_reconnects_total', 'bluetooth_packets_sent_total')
+    before = [REGISTRY.counter(name, '').value for name in names]
+    bc.run_bluetooth_communication(state)
+    return [REGISTRY.counter(name, '').value - b for name, b in zip(names, before)]
+
+
+def test_failed_connects_are_not_reconnects(monkeypatch):
+    state = SharedState()
+    reconnects, sent = run(monkeypatch, state, [serial.SerialException] * 3 + [FakePort(state, stop_at=2)])
+    assert reconnects == 0
+    assert sent == 2
+
+
+def test_dropped_link_counts_once(monkeypatch, capsys):
+    state = SharedState()
+    ports = [FakePort(state, fail_at=3), serial.SerialException, serial.SerialException,
+             FakePort(state, stop_at=2)]
+    reconnects, sent = run(monkeypatch, state, ports)
+    assert reconnects == 1
+    assert sent == 4
+    assert REGISTRY.gauge('bluetooth_connected', '').value == 1
+    assert "发送指令" not in capsys.readouterr().out
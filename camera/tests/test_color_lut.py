@@ -0,0 +1,54 @@
+"""颜色查找表与 cvtColor + inRange 的一致性"""
+
+import os
+import cv2
+import numpy as np
+import pytest
+import video_processor as vp
+from benchmark import config_override
+from color_lut import ColorLutMasker, build_lut, load_or_build_lut, threshold_key
+
+
+@pytest.fixture(scope='module')
+def all_colors():
+    """包含全部 2^24 种 BGR 颜色的 4096x4096 图像。"""
+    index = np.arange(1 << 24, dtype=np.uint32)
+    img = np.stack([index & 0xFF, (index >> 8) & 0xFF, index >> 16], axis=-1).astype(np.uint8)
+    return img.reshape(4096, 4096, 3)
+
+
+def opencv_mask(img):
+    with config_override(ADAPTIVE_V_CHANNEL=False):
+        return vp.create_color_mask(cv2.cvtColor(img, cv2.COLOR_BGR2HSV))
+
+
+def test_mask_matches_opencv_for_every_color(tmp_path, all_colors):
+    masker = ColorLutMasker(8, cache_dir=str(tmp_path))
+    masker.update(vp.color_bounds())
+    np.testing.assert_array_equal(masker.mask(all_colors), opencv_mask(all_colors))
+
+
+def test_mask_matches_opencv_on_frames(tmp_path, frames):
+    masker = ColorLutMasker(8, cache_dir=str(tmp_path))
+    masker.update(vp.color_bounds())
+    for jpg in frames:
+        img = cv2.rotate(vp.decode_frame(jpg), cv2.ROTATE_90_CLOCKWISE)
+        np.testing.assert_array_equal(masker.mask(img), opencv_mask(img))
+
+
+def test_cache_round_trip(tmp_path, all_colors):
+    """按位压缩写入磁盘的查找表重新加载后与直接计算的完全一致，用它得到的掩码也不变。"""
+    bounds = vp.color_bounds()
+    path = tmp_path / f'color_lut_{threshold_key(bounds, 8)}.npy'
+    built = load_or_build_lut(bounds, 8, cache_dir=str(tmp_path))
+    assert path.exists()
+    assert os.path.getsize(path) < built.size // 7  # 每个颜色一位
+
+    loaded = load_or_build_lut(bounds, 8, cache_dir=str(tmp_path))
+    assert loaded.dtype == np.uint8
+    np.testing.assert_array_equal(loaded, built)
+    np.testing.assert_array_equal(loaded, build_lut(bounds, 8))
+
+    masker = ColorLutMasker(8, cache_dir=str(tmp_path))
+    masker.update(bounds)
+    np.testing.assert_array_equal(masker.mask(all_colors), opencv_mask(all_colors))
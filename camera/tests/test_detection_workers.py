@@ -0,0 +1,46 @@
+"""多进程检测与单进程检测发布的测量一致"""
+
+import pytest
+import video_processor as vp
+from measurement_queue import MeasurementQueue
+from state import SharedState
+
+FRAMES = 20
+FPS = 10
+
+
+@pytest.fixture
+def frame_dir(tmp_path, frames):
+    for i, jpg in enumerate(frames[:FRAMES]):
+        (tmp_path / f'frame_{i:03d}.jpg').write_bytes(jpg)
+    return str(tmp_path)
+
+
+def published(monkeypatch, frame_dir, workers):
+    """按 workers 个检测进程（0 为单进程模式）运行 run_video_processing，返回它放入测量队列的坐标。"""
+    monkeypatch.setattr(vp, 'FRAME_SOURCE', frame_dir)
+    monkeypatch.setattr(vp, 'REPLAY_FPS', FPS)
+    monkeypatch.setattr(vp, 'REPLAY_LOOP', False)
+    monkeypatch.setattr(vp, 'HEADLESS', True)
+    monkeypatch.setattr(vp, 'DEBUG_STREAM_PORT', 0)
+    monkeypatch.setattr(vp, 'RECORD_PATH', None)
+    monkeypatch.setattr(vp, 'DETECTION_WORKERS', workers)
+    measurements = MeasurementQueue(maxlen=4 * FRAMES)
+    vp.run_video_processing(SharedState(), measurements)
+    return [coords for _, coords in measurements.drain()]
+
+
+def is_subsequence(items, sequence):
+    remaining = iter(sequence)
+    return all(any(item == candidate for candidate in remaining) for item in items)
+
+
+def test_pool_publishes_same_measurements_as_single_process(monkeypatch, frame_dir):
+    single = published(monkeypatch, frame_dir, 0)
+    # 按回放帧率单进程模式来得及处理每一帧
+    assert len(single) == FRAMES
+    pooled = published(monkeypatch, frame_dir, 2)
+    # 工作进程启动期间可能有帧被信箱中更新的帧覆盖，但发布的每个测量都必须与单进程模式对同一帧发布的完全相同
+    assert len(pooled) >= FRAMES // 4
+    assert is_subsequence(pooled, single), (pooled, single)
+    assert all(isinstance(v, float) for coords in single + pooled for v in coords)
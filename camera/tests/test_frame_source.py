@@ -0,0 +1,101 @@
+"""帧源产出的帧与原始帧逐字节一致，录像按录制时的节奏回放"""
+
+import gzip
+import http.server
+import threading
+import numpy as np
+import pytest
+import frame_source
+from frame_source import HttpMjpegSource, MjpegFileSource
+from recorder import MjpegRecorder
+
+
+def multipart(frames):
+    return b''.join(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n' for jpg in frames)
+
+
+@pytest.fixture
+def stream_server(frames):
+    """按请求路径返回不压缩（/plain）或 gzip 压缩（/gzip）的 MJPEG 码流，发送完全部帧后关闭连接。"""
+    body = multipart(frames)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+            payload = body
+            if self.path == '/gzip':
+                self.send_header('Content-Encoding', 'gzip')
+                payload = gzip.compress(body)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    yield f'http://{host}:{port}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('path', ['/plain', '/gzip'])
+def test_http_source_yields_every_frame(stream_server, frames, path):
+    source = HttpMjpegSource(stream_server + path)
+    source.open()
+    try:
+        received = [bytes(jpg) for jpg, _, _ in source.iter_timed_frames()]
+    finally:
+        source.close()
+    assert received == frames
+
+
+def record(path, frames, timestamps):
+    recorder = MjpegRecorder(path, max_queue_size=len(frames))
+    recorder.start()
+    for jpg, timestamp in zip(frames, timestamps):
+        recorder.record(jpg, timestamp)
+    recorder.close()
+
+
+def replay_intervals(source):
+    source.open()
+    try:
+        times = [t for _, t, _ in source.iter_timed_frames()]
+    finally:
+        source.close()
+    return np.diff(times)
+
+
+def test_file_replay_follows_recorded_timestamps(tmp_path, frames):
+    """有索引时按录制时的时间戳间隔回放，抖动和中断不会被 fps 抹平。"""
+    path = str(tmp_path / 'match.mjpeg')
+    deltas = [0.02, 0.15, 0.04, 0.0, 0.3, 0.06]
+    record(path, frames[:len(deltas) + 1], 1000.0 + np.concatenate([[0.0], np.cumsum(deltas)]))
+    intervals = replay_intervals(MjpegFileSource(path, fps=25))
+    np.testing.assert_allclose(intervals, deltas, atol=0.015)
+
+
+def test_file_replay_caps_long_gaps(tmp_path, frames, monkeypatch):
+    monkeypatch.setattr(frame_source, 'MAX_REPLAY_GAP', 0.1)
+    path = str(tmp_path / 'match.mjpeg')
+    record(path, frames[:3], [1000.0, 1000.05, 5000.0])
+    np.testing.assert_allclose(replay_intervals(MjpegFileSource(path, fps=25)), [0.05, 0.1], atol=0.015)
+
+
+def test_file_replay_without_index_uses_fps(tmp_path, frames):
+    path = tmp_path / 'match.mjpeg'
+    path.write_bytes(b''.join(frames[:5]))
+    np.testing.assert_allclose(replay_intervals(MjpegFileSource(str(path), fps=20)), [0.05] * 4, atol=0.015)
+
+
+def test_file_replay_max_speed_ignores_index(tmp_path, frames):
+    path = str(tmp_path / 'match.mjpeg')
+    record(path, frames[:4], [1000.0, 1001.0, 1002.0, 1003.0])
+    source = MjpegFileSource(path)
+    assert source.fps is None
+    assert replay_intervals(source).max() < 0.1
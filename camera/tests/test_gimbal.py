@@ -0,0 +1,150 @@
+"""云台 PID 控制器的限速、限位、抗积分饱和、防超调与标定拟合"""
+
+import numpy as np
+import pytest
+from gimbal_controller import GimbalController, ServoHistory, calibrate, MIN_PIXELS_PER_UNIT
+
+LIMITS = ((0, 300), (0, 180))
+
+
+def make_controller(**kwargs):
+    params = dict(pixels_per_unit=(2.0, 2.0), kp=8.0, ki=0.0, kd=0.0, integral_limit=20.0,
+                  max_rate=300.0, limits=LIMITS)
+    params.update(kwargs)
+    return GimbalController(**params)
+
+
+def test_rate_limited():
+    controller = make_controller()
+    # 误差 100 单位、间隔 0.1 秒时比例项要求 800 单位/秒，限速后每拍只走 30 个单位
+    position = (150, 90)
+    for _ in range(3):
+        new = controller.update((100.0, -60.0), position, 0.1)
+        assert new == (position[0] + 30, position[1] - 30)
+        position = new
+
+
+def test_clamped_to_servo_limits():
+    controller = make_controller()
+    assert controller.update((50.0, -50.0), (295, 3), 0.1) == (300, 0)
+    assert controller.update((50.0, -50.0), (300, 0), 0.1) == (300, 0)
+
+
+def test_proportional_step_never_overshoots():
+    """kp 大于 1/dt 时比例项按 1/dt 计算，一个周期内最多消除全部误差，不会越过目标。"""
+    controller = make_controller(kp=50.0, max_rate=1e6)
+    assert controller.update((10.0, -4.0), (150, 90), 0.1) == (160, 86)
+    controller = make_controller(kp=50.0, max_rate=1e6)
+    assert controller.update((10.0, -4.0), (150, 90), 0.01) == (155, 88)
+
+
+def test_integral_frozen_while_saturated():
+    controller = make_controller(ki=1.0)
+    position = (150, 90)
+    # 速度饱和且误差方向加剧饱和：积分不累积
+    for _ in range(5):
+        position = controller.update((200.0, 0.0), position, 0.1)
+    assert controller._integral[0] == 0.0  # pylint: disable=protected-access
+    # 顶在舵机限位上时同样不累积
+    for _ in range(5):
+        assert controller.update((5.0, 0.0), (300, 90), 0.1) == (300, 90)
+    assert controller._integral[0] == 0.0  # pylint: disable=protected-access
+    # 不饱和时正常累积，并限制在 integral_limit 以内
+    controller = make_controller(ki=1.0, kp=0.1, integral_limit=0.5)
+    for _ in range(3):
+        controller.update((1.0, 0.0), (150, 90), 0.1)
+    assert controller._integral[0] == pytest.approx(0.3)  # pylint: disable=protected-access
+    for _ in range(10):
+        controller.update((1.0, 0.0), (150, 90), 0.1)
+    assert controller._integral[0] == pytest.approx(0.5)  # pylint: disable=protected-access
+
+
+def test_integral_unwinds_when_error_reverses_during_saturation():
+    controller = make_controller(ki=10.0, kp=0.1, max_rate=1.0, integral_limit=100.0)
+    controller._integral = [5.0, 0.0]  # pylint: disable=protected-access
+    # 积分项使输出饱和在正方向，误差反向时积分继续累积（减小），帮助退出饱和
+    controller.update((-1.0, 0.0), (150, 90), 0.1)
+    assert controller._integral[0] == pytest.approx(4.9)  # pylint: disable=protected-access
+
+
+def test_units_round_trip():
+    controller = make_controller(pixels_per_unit=(2.5, -1.25))
+    assert controller.to_units(controller.to_pixels((4.0, -8.0))) == pytest.approx((4.0, -8.0))
+
+
+@pytest.mark.parametrize('ppu', [(0.0, 2.0), (2.0, MIN_PIXELS_PER_UNIT / 2), (float('nan'), 2.0)])
+def test_degenerate_pixels_per_unit_rejected(ppu):
+    with pytest.raises(ValueError):
+        make_controller(pixels_per_unit=ppu)
+
+
+class SimulatedGimbal:
+    """目标静止时画面中的坐标随舵机位置线性变化：pixel = world + ppu * servo (+ 噪声)。"""
+
+    def __init__(self, ppu, world=(10.0, -20.0), noise=0.0, missing=()):
+        self.ppu = ppu
+        self.world = world
+        self.noise = noise
+        self.missing = set(missing)
+        self.servo = None
+        self.moves = []
+        self.rng = np.random.default_rng(0)
+
+    def move_to(self, position):
+        self.servo = position
+        self.moves.append(position)
+
+    def observe(self):
+        if self.servo in self.missing:
+            return None
+        return tuple(self.world[a] + self.ppu[a] * self.servo[a] + self.rng.normal(0, self.noise) if self.noise
+                     else self.world[a] + self.ppu[a] * self.servo[a] for a in (0, 1))
+
+
+def test_calibrate_recovers_linear_mapping():
+    gimbal = SimulatedGimbal((2.5, -1.5))
+    result = calibrate(gimbal.move_to, gimbal.observe, (150, 90), step=10, points=2, limits=LIMITS)
+    assert result['pixels_per_unit'] == pytest.approx((2.5, -1.5))
+    assert result['residual_px'] == pytest.approx((0.0, 0.0), abs=1e-9)
+    assert result['samples'] == (5, 5)
+    assert gimbal.moves[-1] == (150, 90)
+
+
+def test_calibrate_least_squares_with_noise_and_missing_points():
+    gimbal = SimulatedGimbal((3.0, 2.0), noise=0.5, missing={(130, 90), (150, 110)})
+    result = calibrate(gimbal.move_to, gimbal.observe, (150, 90), step=10, points=3, limits=LIMITS)
+    assert result['samples'] == (6, 6)
+    assert result['pixels_per_unit'] == pytest.approx((3.0, 2.0), abs=0.05)
+    assert 0 < result['residual_px'][0] < 1.0
+
+
+def test_calibrate_clamps_to_limits():
+    gimbal = SimulatedGimbal((2.0, 2.0))
+    calibrate(gimbal.move_to, gimbal.observe, (295, 5), step=10, points=2, limits=LIMITS)
+    assert all(0 <= x <= 300 and 0 <= y <= 180 for x, y in gimbal.moves)
+
+
+def test_calibrate_rejects_too_few_points():
+    gimbal = SimulatedGimbal((2.0, 2.0), missing={(x, 90) for x in range(130, 171)} - {(150, 90)})
+    with pytest.raises(ValueError):
+        calibrate(gimbal.move_to, gimbal.observe, (150, 90), step=10, points=2, limits=LIMITS)
+    assert gimbal.moves[-1] == (150, 90)
+
+
+def test_calibrate_rejects_flat_slope():
+    """目标没有随舵机移动（例如看到的是画面中固定的反光）时不能得到接近 0 的换算关系。"""
+    gimbal = SimulatedGimbal((2.0, 0.01), noise=0.2)
+    with pytest.raises(ValueError):
+        calibrate(gimbal.move_to, gimbal.observe, (150, 90), step=10, points=2, limits=LIMITS)
+    assert gimbal.moves[-1] == (150, 90)
+
+
+def test_servo_history_lookup():
+    history = ServoHistory(maxlen=4)
+    assert history.at(1.0) is None
+    for t in range(6):
+        history.record(float(t), (t, t))
+    assert history.at(3.5) == (3, 3)
+    assert history.at(5.0) == (5, 5)
+    # 早于所有记录（最早的两条已被挤出）时返回最早的一条
+    assert history.at(0.0) == (2, 2)
@@ -0,0 +1,86 @@
+"""ConstantVelocityKalman 与原来的 filterpy 滤波器的数值一致性"""
+
+import copy
+import numpy as np
+import pytest
+from kalman import ConstantVelocityKalman, create_kalman_filter
+
+pytest.importorskip('filterpy')
+
+STEPS = 500
+RTOL = 1e-9
+ATOL = 1e-9
+
+
+def covariance(kf):
+    """把 ConstantVelocityKalman 按轴分块的协方差展开成 filterpy 使用的 4x4 矩阵。"""
+    cov = np.zeros((4, 4))
+    cov[0, 0], cov[1, 1], cov[2, 2], cov[3, 3] = kf.pxx, kf.pyy, kf.pvv_x, kf.pvv_y
+    cov[0, 2] = cov[2, 0] = kf.pxv
+    cov[1, 3] = cov[3, 1] = kf.pyv
+    return cov
+
+
+def filterpy_predict(kf, dt):
+    kf.F[0, 2] = dt
+    kf.F[1, 3] = dt
+    kf.predict()
+
+
+def filterpy_predict_ahead(kf, horizon):
+    future = copy.deepcopy(kf)
+    filterpy_predict(future, horizon)
+    return (future.x[0, 0], future.x[1, 0]), (future.P[0, 0], future.P[1, 1])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_sequence_matches_filterpy(seed):
+    """随机交替的预测（间隔不定，可能连续多次）与更新（可能连续多次、也可能长时间没有测量）。"""
+    rng = np.random.default_rng(seed)
+    reference = create_kalman_filter(0.04)
+    compact = ConstantVelocityKalman()
+    position = rng.uniform(0, 640, 2)
+    velocity = rng.uniform(-200, 200, 2)
+    for _ in range(STEPS):
+        if rng.random() < 0.6:
+            dt = float(rng.uniform(0.0, 0.2))
+            position += velocity * dt
+            filterpy_predict(reference, dt)
+            compact.predict(dt)
+        else:
+            zx, zy = (float(v) for v in position + rng.normal(0, 3, 2))
+            reference.update(np.array([[zx], [zy]]))
+            compact.update(zx, zy)
+
+        np.testing.assert_allclose(
+            (compact.x, compact.y, compact.vx, compact.vy), reference.x[:, 0], rtol=RTOL, atol=ATOL)
+        np.testing.assert_allclose(covariance(compact), reference.P, rtol=RTOL, atol=ATOL)
+        horizon = float(rng.uniform(0.0, 0.3))
+        expected_position, expected_var = filterpy_predict_ahead(reference, horizon)
+        actual_position, actual_var = compact.predict_ahead(horizon)
+        np.testing.assert_allclose(actual_position, expected_position, rtol=RTOL, atol=ATOL)
+        np.testing.assert_allclose(actual_var, expected_var, rtol=RTOL, atol=ATOL)
+
+
+def test_predict_ahead_leaves_filter_unchanged():
+    compact = ConstantVelocityKalman()
+    compact.update(10.0, 20.0)
+    compact.predict(0.04)
+    compact.update(12.0, 19.0)
+    state = compact.get_state()
+    compact.predict_ahead(0.5)
+    assert compact.get_state() == state
+
+
+def test_set_state_round_trip():
+    rng = np.random.default_rng(0)
+    compact = ConstantVelocityKalman()
+    for _ in range(20):
+        compact.predict(0.04)
+        compact.update(*rng.uniform(0, 100, 2))
+    state = compact.get_state()
+    restored = ConstantVelocityKalman()
+    restored.set_state(state)
+    compact.predict(0.1)
+    restored.predict(0.1)
+    assert restored.get_state() == compact.get_state()
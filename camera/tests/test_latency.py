@@ -0,0 +1,71 @@
+"""在线延迟估计的收敛与异常值处理"""
+
+import numpy as np
+import pytest
+from latency import LatencyEstimator
+
+
+def feed(estimator, start, count, interval=0.04, transport=0.01, pipeline=0.02, jitter=0.0, seed=0):
+    """按固定的帧间隔、传输和处理延迟（可加均匀抖动）送入 count 帧，返回下一帧的 SOI 时刻。"""
+    rng = np.random.default_rng(seed)
+    soi = start
+    for _ in range(count):
+        noise = rng.uniform(-jitter, jitter, 3)
+        eoi = soi + transport + noise[1]
+        estimator.on_frame(soi, eoi)
+        estimator.on_result(eoi, eoi + pipeline + noise[2])
+        soi += interval + noise[0]
+    return soi
+
+
+def test_converges_to_constant_delays():
+    estimator = LatencyEstimator(alpha=0.1, capture_delay_frames=1.5)
+    feed(estimator, 100.0, 10)
+    assert estimator.frame_interval == pytest.approx(0.04)
+    assert estimator.transport == pytest.approx(0.01)
+    assert estimator.pipeline == pytest.approx(0.02)
+    assert estimator.capture_delay == pytest.approx(0.06)
+    assert estimator.total() == pytest.approx(0.09)
+    assert estimator.capture_time(200.0) == pytest.approx(199.94)
+
+
+def test_converges_from_wrong_start_under_jitter():
+    estimator = LatencyEstimator(alpha=0.1)
+    # 先以完全不同的延迟预热，再切换：指数滑动平均应在几十帧内收敛到新的均值
+    soi = feed(estimator, 100.0, 20, interval=0.1, transport=0.05, pipeline=0.1)
+    feed(estimator, soi, 200, jitter=0.004)
+    assert estimator.frame_interval == pytest.approx(0.04, abs=0.002)
+    assert estimator.transport == pytest.approx(0.01, abs=0.002)
+    assert estimator.pipeline == pytest.approx(0.02, abs=0.002)
+
+
+def test_stream_gaps_do_not_affect_frame_interval():
+    """断流重连、时钟回退和重复的 SOI 时刻不计入帧间隔。"""
+    estimator = LatencyEstimator(alpha=0.5, max_interval=1.0)
+    soi = feed(estimator, 100.0, 5)
+    for gap in (5.0, -3.0, 0.0):
+        soi += gap
+        estimator.on_frame(soi, soi + 0.01)
+        assert estimator.frame_interval == pytest.approx(0.04)
+    feed(estimator, soi + 0.04, 5)
+    assert estimator.frame_interval == pytest.approx(0.04)
+
+
+def test_single_spike_is_damped_and_decays():
+    estimator = LatencyEstimator(alpha=0.1)
+    soi = feed(estimator, 100.0, 10)
+    # 一帧处理卡顿 1 秒：估计只移动 alpha 倍的偏差，随后按 (1 - alpha)^n 衰减回去
+    estimator.on_frame(soi, soi + 0.01)
+    estimator.on_result(soi + 0.01, soi + 1.01)
+    assert estimator.pipeline == pytest.approx(0.02 + 0.1 * 0.98)
+    feed(estimator, soi + 0.04, 30)
+    assert estimator.pipeline == pytest.approx(0.02 + 0.1 * 0.98 * 0.9 ** 30)
+    assert estimator.pipeline < 0.025
+
+
+def test_capture_delay_zero_before_first_interval():
+    estimator = LatencyEstimator(capture_delay_frames=1.0)
+    estimator.on_frame(100.0, 100.01)
+    assert estimator.frame_interval is None
+    assert estimator.capture_time(100.0) == 100.0
+    assert estimator.total() == pytest.approx(0.01)
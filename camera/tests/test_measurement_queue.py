@@ -0,0 +1,52 @@
+"""测量队列的唤醒、按曝光时刻取出、超时与满队列丢弃"""
+
+import threading
+import time
+from measurement_queue import MeasurementQueue
+
+
+def test_put_wakes_waiter():
+    queue = MeasurementQueue()
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append((queue.wait(timeout=5.0), time.monotonic())))
+    waiter.start()
+    time.sleep(0.1)
+    assert waiter.is_alive()
+    put_time = time.monotonic()
+    queue.put(1.0, (10.0, 20.0))
+    waiter.join(timeout=5.0)
+    assert not waiter.is_alive()
+    assert woken[0][0] is True
+    assert woken[0][1] - put_time < 0.5
+
+
+def test_wait_returns_immediately_when_not_empty():
+    queue = MeasurementQueue()
+    queue.put(1.0, (0.0, 0.0))
+    start = time.monotonic()
+    assert queue.wait(timeout=5.0) is True
+    assert time.monotonic() - start < 0.5
+
+
+def test_wait_times_out_when_empty():
+    queue = MeasurementQueue()
+    start = time.monotonic()
+    assert queue.wait(timeout=0.1) is False
+    assert 0.09 <= time.monotonic() - start < 1.0
+
+
+def test_drain_sorted_by_capture_time_and_empties():
+    queue = MeasurementQueue()
+    for capture_time in (3.0, 1.0, 2.0, 1.5):
+        queue.put(capture_time, (capture_time, -capture_time))
+    assert queue.drain() == [(1.0, (1.0, -1.0)), (1.5, (1.5, -1.5)), (2.0, (2.0, -2.0)), (3.0, (3.0, -3.0))]
+    assert len(queue) == 0
+    assert queue.drain() == []
+    assert queue.wait(timeout=0.01) is False
+
+
+def test_full_queue_drops_oldest():
+    queue = MeasurementQueue(maxlen=3)
+    assert [queue.put(float(t), (t, t)) for t in range(5)] == [False, False, False, True, True]
+    assert (queue.put_count, queue.dropped_count) == (5, 2)
+    assert [capture_time for capture_time, _ in queue.drain()] == [2.0, 3.0, 4.0]
@@ -0,0 +1,97 @@
+"""MjpegParser 按任意方式分块写入时切出的帧与原始帧逐字节一致"""
+
+import numpy as np
+import pytest
+from config import MAX_JPEG_FRAME_SIZE
+from mjpeg_parser import MjpegParser, SOI_MARKER, EOI_MARKER
+
+HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+def make_frame(size, seed=0):
+    """总长 size 字节的 JPEG 帧：SOI、不含 0xFF 的数据、EOI。"""
+    payload = np.random.default_rng(seed).integers(0, 0xFF, size - 4, dtype=np.uint8).tobytes()
+    return SOI_MARKER + payload + EOI_MARKER
+
+
+def make_stream(frames):
+    return b''.join(HEADER + frame + b'\r\n' for frame in frames)
+
+
+def split(data, sizes):
+    """按 sizes 循环给出的长度把 data 切成数据块。"""
+    chunks, offset, i = [], 0, 0
+    while offset < len(data):
+        chunks.append(data[offset:offset + sizes[i % len(sizes)]])
+        offset += sizes[i % len(sizes)]
+        i += 1
+    return chunks
+
+
+def parse(parser, chunks):
+    return [bytes(frame) for chunk in chunks for frame in parser.feed(chunk)]
+
+
+@pytest.mark.parametrize('sizes', [[1], [2, 3], [37, 1, 500], [4096], [100000]])
+def test_frames_survive_any_chunking(sizes):
+    frames = [make_frame(size, seed) for seed, size in enumerate([4, 100, 1000, 3000, 4096, 50])]
+    parser = MjpegParser(4096)
+    assert parse(parser, split(make_stream(frames), sizes)) == frames
+    assert parser.frame_count == len(frames)
+    assert parser.resync_count == 0
+
+
+def test_chunk_with_eoi_and_next_frame_does_not_resync():
+    """缓冲的半帧加上整个数据块超过上限，但当前帧本身没有超过时，不应丢弃当前帧。"""
+    frames = [make_frame(MAX_JPEG_FRAME_SIZE - 1000, 1), make_frame(MAX_JPEG_FRAME_SIZE, 2), make_frame(2000, 3)]
+    stream = make_stream(frames)
+    parser = MjpegParser(MAX_JPEG_FRAME_SIZE)
+    # 第一块停在第一帧的 EOI 之前，第二块包含它的 EOI 和第二帧的大部分数据
+    first = len(HEADER) + len(frames[0]) - 10
+    chunks = [stream[:first], stream[first:first + MAX_JPEG_FRAME_SIZE - 500], stream[first + MAX_JPEG_FRAME_SIZE - 500:]]
+    assert parse(parser, chunks) == frames
+    assert parser.resync_count == 0
+
+
+def test_oversized_frame_resyncs():
+    frames = [make_frame(1000, 1), make_frame(1025, 2), make_frame(1024, 3), make_frame(10, 4)]
+    parser = MjpegParser(1024)
+    assert parse(parser, split(make_stream(frames), [300])) == [frames[0], frames[2], frames[3]]
+    assert parser.resync_count == 1
+
+
+def test_frame_times():
+    frames = [make_frame(100, 1), make_frame(100, 2)]
+    stream = make_stream(frames)
+    parser = MjpegParser(1024)
+    middle = len(HEADER) + 50
+    assert not list(parser.feed(stream[:middle], 1.0))
+    assert [bytes(frame) for frame in parser.feed(stream[middle:], 2.0)] == frames
+    assert (parser.frame_soi_time, parser.frame_eoi_time) == (2.0, 2.0)
+    assert not list(parser.feed(stream[:middle], 3.0))
+    for _ in parser.feed(stream[middle:], 4.0):
+        break
+    assert (parser.frame_soi_time, parser.frame_eoi_time) == (3.0, 4.0)
+
+
+@pytest.mark.parametrize('sizes', [[1], [3, 7], [500], [100000]])
+def test_truncated_frame_dropped_at_next_soi(sizes):
+    """一帧没有 EOI 就出现下一个 SOI 时丢弃这段残帧，后面的帧不受影响。"""
+    frames = [make_frame(300, 1), make_frame(400, 2), make_frame(200, 3), make_frame(500, 4)]
+    truncated = frames[1][:250]
+    stream = (make_stream(frames[:1]) + HEADER + truncated + b'\r\n'
+              + make_stream(frames[2:3]) + HEADER + frames[3][:100] + make_stream(frames[3:]))
+    parser = MjpegParser(4096)
+    assert parse(parser, split(stream, sizes)) == [frames[0], frames[2], frames[3]]
+    assert parser.truncated_count == 2
+    assert parser.resync_count == 0
+
+
+def test_truncated_frame_time_restarts_at_new_soi():
+    frames = [make_frame(100, 1), make_frame(100, 2)]
+    parser = MjpegParser(1024)
+    assert not list(parser.feed(HEADER + frames[0][:50], 1.0))
+    assert not list(parser.feed(HEADER + frames[1][:50], 2.0))
+    assert [bytes(frame) for frame in parser.feed(frames[1][50:], 3.0)] == [frames[1]]
+    assert (parser.frame_soi_time, parser.frame_eoi_time) == (2.0, 3.0)
+    assert parser.truncated_count == 1
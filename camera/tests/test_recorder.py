@@ -0,0 +1,51 @@
+"""录像的写入、回放与写盘线程出错时的关闭"""
+
+import threading
+import pytest
+from recorder import MjpegRecorder, MjpegRecording
+
+
+def test_round_trip(tmp_path, frames):
+    path = str(tmp_path / 'match.mjpeg')
+    recorder = MjpegRecorder(path, max_queue_size=len(frames))
+    recorder.start()
+    detections = [None if i % 3 == 0 else (10.4 + i, 20.6 + i) for i in range(len(frames))]
+    for i, (jpg, detection) in enumerate(zip(frames, detections)):
+        recorder.record(jpg, 100.0 + i, detection)
+    recorder.close()
+    assert recorder.error is None
+    assert recorder.recorded_count == len(frames)
+
+    with MjpegRecording(path) as recording:
+        assert len(recording) == len(frames)
+        assert [bytes(jpg) for jpg in recording.frames()] == frames
+        assert list(recording.timestamps) == [100.0 + i for i in range(len(frames))]
+        for i, detection in enumerate(detections):
+            expected = None if detection is None else (round(detection[0]), round(detection[1]))
+            assert recording.detection(i) == expected
+
+
+def test_close_after_writer_failure_with_full_queue(tmp_path, frames):
+    """写盘线程出错退出、队列已满时，close() 不能一直等待队列腾出位置，而是抛出写盘线程的异常。"""
+    recorder = MjpegRecorder(str(tmp_path / 'missing' / 'match.mjpeg'), max_queue_size=2)
+    for i, jpg in enumerate(frames[:3]):
+        recorder.record(jpg, float(i))
+    assert recorder.dropped_count == 1
+    recorder.start()
+
+    raised = []
+
+    def close():
+        with pytest.raises(OSError):
+            recorder.close()
+        raised.append(True)
+
+    closer = threading.Thread(target=close, daemon=True)
+    closer.start()
+    closer.join(timeout=5.0)
+    assert not closer.is_alive(), "close() 在写盘线程退出后仍在等待"
+    assert raised
+    assert isinstance(recorder.error, OSError)
+
+    recorder.record(frames[0], 3.0)
+    assert recorder.dropped_count == 2
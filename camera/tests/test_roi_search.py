@@ -0,0 +1,21 @@
+"""预测窗口内检测与整帧检测的一致性"""
+
+import pytest
+import video_processor as vp
+from benchmark import ROI_BENCH_SIGMA, config_override, roi_search_inputs
+
+
+@pytest.mark.parametrize('rotation_free', [False, True])
+def test_roi_search_matches_full_frame(frames, rotation_free):
+    """以整帧检测结果为预测位置时，窗口内检测得到的质心与整帧检测完全一致。"""
+    inputs = roi_search_inputs(frames, 1)
+    assert inputs, "合成帧中应能检测到目标"
+    processor = vp.FrameProcessor(1)
+    with config_override(ROTATION_FREE_DETECTION=rotation_free):
+        for jpg, roi in inputs:
+            expected = vp.detect_frame(jpg, processor)
+            if rotation_free:
+                # 搜索窗口换算到未旋转图像的坐标
+                shape = vp.decode_frame(jpg, 1).shape
+                roi = vp.roi_window((*expected, ROI_BENCH_SIGMA, ROI_BENCH_SIGMA), shape, 1, rotate_cw=True)
+            assert vp.detect_frame(jpg, processor, roi=roi) == expected
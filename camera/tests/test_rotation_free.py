@@ -0,0 +1,82 @@
+"""免旋转检测与先旋转再检测的一致性"""
+
+import cv2
+import numpy as np
+import pytest
+import video_processor as vp
+from benchmark import config_override, make_processor
+
+
+def random_mask(shape, seed, blobs=4):
+    """在 shape 大小的掩码上随机画几个大小不一的椭圆和多边形。"""
+    rng = np.random.default_rng(seed)
+    h, w = shape
+    mask = np.zeros(shape, np.uint8)
+    for _ in range(blobs):
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        if rng.random() < 0.5:
+            axes = (int(rng.integers(3, max(4, w // 4))), int(rng.integers(3, max(4, h // 4))))
+            cv2.ellipse(mask, center, axes, float(rng.uniform(0, 180)), 0, 360, 255, -1)
+        else:
+            points = np.array(center) + rng.integers(-w // 4, w // 4 + 1, size=(5, 2))
+            cv2.fillPoly(mask, [points.astype(np.int32)], 255)
+    return mask
+
+
+def assert_same_target(actual, expected):
+    assert (actual is None) == (expected is None)
+    if expected is not None:
+        np.testing.assert_array_equal(actual[0], expected[0])
+        assert actual[1] == expected[1]
+
+
+# 非正方形的尺寸：把 (x, y) -> (h-1-y, x) 中的 h 错用成宽度时结果会不同
+@pytest.mark.parametrize('shape', [(240, 320), (320, 240), (57, 131), (64, 64)])
+def test_find_target_rotation_free_matches_rotated(shape):
+    found = 0
+    for seed in range(50):
+        mask = random_mask(shape, seed)
+        expected = vp.find_target(cv2.rotate(mask, cv2.ROTATE_90_CLOCKWISE))
+        assert_same_target(vp.find_target(mask, rotate_cw=True), expected)
+        found += expected is not None
+    assert found > 25
+
+
+@pytest.mark.parametrize('shape', [(240, 320), (57, 131)])
+def test_rotate_contour_cw_matches_rotated_contours(shape):
+    """每个轮廓映射后都与旋转后的掩码中对应的轮廓逐点一致（包括起点）。"""
+    for seed in range(20):
+        mask = random_mask(shape, seed)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        rotated, _ = cv2.findContours(cv2.rotate(mask, cv2.ROTATE_90_CLOCKWISE),
+                                      cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        mapped = sorted((vp.rotate_contour_cw(c, shape[0]) for c in contours), key=lambda c: c.tobytes())
+        rotated = sorted(rotated, key=lambda c: c.tobytes())
+        assert len(mapped) == len(rotated)
+        for a, b in zip(mapped, rotated):
+            np.testing.assert_array_equal(a, b)
+
+
+def test_find_target_rotation_free_in_window():
+    """在整帧的一个窗口内免旋转检测时，结果与在整帧旋转后的图像中检测同一窗口一致。"""
+    shape = (240, 320)
+    x0, y0, x1, y1 = 40, 30, 200, 170
+    for seed in range(30):
+        mask = random_mask(shape, seed)
+        window = np.zeros_like(mask)
+        window[y0:y1, x0:x1] = mask[y0:y1, x0:x1]
+        expected = vp.find_target(cv2.rotate(window, cv2.ROTATE_90_CLOCKWISE))
+        actual = vp.find_target(np.ascontiguousarray(mask[y0:y1, x0:x1]), rotate_cw=True,
+                                offset=(x0, y0), frame_height=shape[0])
+        assert_same_target(actual, expected)
+
+
+def test_detect_frame_rotation_free_matches_rotated(frames):
+    results = {}
+    for rotation_free in (False, True):
+        # 每种模式使用独立的自适应阈值状态，保证两次遍历的输入序列相同
+        processor = make_processor(1)
+        with config_override(ROTATION_FREE_DETECTION=rotation_free):
+            results[rotation_free] = [vp.detect_frame(jpg, processor) for jpg in frames]
+    assert any(r is not None for r in results[False])
+    assert results[True] == results[False]
@@ -0,0 +1,110 @@
+"""StateHistoryTracker 处理乱序测量的结果与按曝光时刻顺序处理一致"""
+
+import numpy as np
+import pytest
+from kalman import ConstantVelocityKalman
+from track_history import StateHistoryTracker, _STRIDE  # pylint: disable=protected-access
+
+FPS = 25
+TOLERANCE = 1e-9
+
+
+def make_measurements(count, seed=0):
+    """目标做匀速运动时每帧一个带噪声的测量 (曝光时刻, x, y)，按曝光时刻排序。"""
+    rng = np.random.default_rng(seed)
+    velocity = rng.uniform(-100, 100, 2)
+    return [(i / FPS, *(float(v) for v in (320, 240) + velocity * i / FPS + rng.normal(0, 2, 2)))
+            for i in range(count)]
+
+
+def shuffled(measurements, max_delay, seed=0):
+    """每个测量晚到最多 max_delay 帧后的到达顺序；第一个测量最先到达，其余的都不会早于整个历史。"""
+    rng = np.random.default_rng(seed)
+    arrivals = [i + rng.uniform(0, max_delay) for i in range(len(measurements))]
+    arrivals[0] = -1.0
+    return [measurements[i] for i in np.argsort(arrivals, kind='stable')]
+
+
+def in_order_state(measurements):
+    """不经过 StateHistoryTracker，直接按曝光时刻顺序预测、更新得到的滤波器状态。"""
+    kf = ConstantVelocityKalman()
+    t0, x, y = measurements[0]
+    kf.set_position(x, y)
+    for t, x, y in measurements[1:]:
+        kf.predict(min(max(t - t0, 0.0), 1.0))
+        kf.update(x, y)
+        t0 = t
+    return kf.get_state()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_shuffled_arrival_matches_in_order(seed):
+    measurements = make_measurements(500, seed)
+    tracker = StateHistoryTracker(capacity=64)
+    for measurement in shuffled(measurements, max_delay=8, seed=seed):
+        assert tracker.add(*measurement) is not None
+    assert tracker.out_of_sequence_count > 0
+    assert tracker.replayed_count > 0
+    assert tracker.too_old_count == 0
+    assert tracker.time == measurements[-1][0]
+    np.testing.assert_allclose(tracker.kf.get_state(), in_order_state(measurements), rtol=0, atol=TOLERANCE)
+
+
+def test_older_than_history_is_dropped():
+    measurements = make_measurements(100)
+    tracker = StateHistoryTracker(capacity=16)
+    for measurement in measurements[1:]:
+        tracker.add(*measurement)
+    state = tracker.kf.get_state()
+
+    # 第一个测量早于历史中最早的记录，历史未满时也一样
+    assert tracker.add(*measurements[0]) is None
+    # 已经移出历史的测量
+    assert tracker.add(*measurements[50]) is None
+    assert tracker.too_old_count == 2
+    assert tracker.out_of_sequence_count == 0
+    assert tracker.kf.get_state() == state
+    assert len(tracker) == 16
+
+    short = StateHistoryTracker(capacity=16)
+    for measurement in measurements[1:5]:
+        short.add(*measurement)
+    assert short.add(*measurements[0]) is None
+    assert short.too_old_count == 1
+    assert len(short) == 4
+
+
+def test_long_sequence_wraps_history():
+    """写入的记录远多于 2 * capacity，数组写到末尾时把有效部分搬回开头，晚到的测量仍然插入正确的位置。"""
+    capacity = 8
+    measurements = make_measurements(20 * capacity + 5, seed=1)
+    tracker = StateHistoryTracker(capacity=capacity)
+    compactions = 0
+    for measurement in shuffled(measurements, max_delay=4, seed=1):
+        start = tracker._start  # pylint: disable=protected-access
+        tracker.add(*measurement)
+        compactions += tracker._start < start  # pylint: disable=protected-access
+        assert len(tracker) <= capacity
+    assert compactions >= 5
+    assert tracker.too_old_count == 0
+    assert len(tracker) == capacity
+    np.testing.assert_allclose(tracker.kf.get_state(), in_order_state(measurements), rtol=0, atol=TOLERANCE)
+
+    # 每条记录的状态与按顺序处理到这条测量时的状态一致
+    for i, index in enumerate(range(len(measurements) - capacity, len(measurements))):
+        offset = (tracker._start + i) * _STRIDE  # pylint: disable=protected-access
+        record = tracker._buf[offset:offset + _STRIDE]  # pylint: disable=protected-access
+        assert tuple(record[:3]) == measurements[index]
+        np.testing.assert_allclose(record[3:], in_order_state(measurements[:index + 1]), rtol=0, atol=TOLERANCE)
+
+
+def test_reset_starts_new_track():
+    measurements = make_measurements(10)
+    tracker = StateHistoryTracker(capacity=4)
+    for measurement in measurements:
+        tracker.add(*measurement)
+    tracker.reset()
+    assert len(tracker) == 0
+    assert tracker.add(*measurements[0]) == 0
+    assert tracker.time == measurements[0][0]
+    assert tracker.kf.position == measurements[0][1:]
@@ -0,0 +1,47 @@
+"""查表白平衡与原来的浮点灰色世界白平衡的一致性"""
+
+import numpy as np
+import pytest
+import video_processor as vp
+from benchmark import apply_white_balance_float
+from white_balance import GreyWorldWhiteBalance
+
+# 抽样估计增益的白平衡与逐帧整幅图像计算的结果之间允许的最大偏差（灰度级）
+WHITE_BALANCE_TOLERANCE = 2
+
+# 合成帧本身接近中性灰，另外按通道缩放出几种明显偏色的画面，让增益明显偏离 1
+CASTS = [(1.0, 1.0, 1.0), (0.6, 0.9, 1.3), (1.4, 1.0, 0.5), (0.8, 1.2, 0.7)]
+
+
+@pytest.fixture(scope='module')
+def images(frames):
+    decoded = [vp.decode_frame(jpg) for jpg in frames[::4]]
+    return [np.clip(img * np.float32(cast), 0, 255).astype(np.uint8) for img in decoded for cast in CASTS]
+
+
+def max_error(actual, expected):
+    return int(np.abs(actual.astype(np.int16) - expected.astype(np.int16)).max())
+
+
+def test_full_image_gains_match_float(images):
+    for img in images:
+        np.testing.assert_array_equal(vp.apply_white_balance(img), apply_white_balance_float(img))
+
+
+def test_uncached_full_image_matches_float(images):
+    balancer = GreyWorldWhiteBalance(interval=1, step=1)
+    for img in images:
+        np.testing.assert_array_equal(balancer.apply(img), apply_white_balance_float(img))
+
+
+def test_sampled_gains_within_tolerance(images):
+    balancer = GreyWorldWhiteBalance(1, vp.CONFIG.WHITE_BALANCE_SAMPLE_STEP)
+    for img in images:
+        assert max_error(balancer.apply(img), apply_white_balance_float(img)) <= WHITE_BALANCE_TOLERANCE
+
+
+def test_missing_channel_left_unchanged():
+    img = np.zeros((48, 64, 3), np.uint8)
+    img[:, :, 1] = 80
+    assert GreyWorldWhiteBalance(1, 1).apply(img) is img
+    np.testing.assert_array_equal(vp.apply_white_balance(img), apply_white_balance_float(img))
@@ -1,9 +1,24 @@
 # video_processor.py
 import time
+import threading
 import cv2
-import requests
 import numpy as np
-from config import VIDEO_STREAM_URL, MIN_CONTOUR_AREA
+from config import FRAME_SOURCE, REPLAY_FPS, REPLAY_LOOP, MIN_CONTOUR_AREA, RECORD_PATH, RECORD_QUEUE_SIZE
+from config import HEADLESS, DEBUG_STREAM_PORT, DEBUG_STREAM_FPS, DETECTION_WORKERS, MAX_JPEG_FRAME_SIZE
+from config import LIGHT_CENTER, CAPTURE_DELAY_FRAMES, LATENCY_EMA_ALPHA
+from frame_source import create_frame_source, FrameSourceError
+from frame_grabber import LatestFrameMailbox, run_frame_capture
+from latency import LatencyEstimator, to_wall_clock
+from state import Detection
+from recorder import MjpegRecorder
+from metrics import REGISTRY
+from color_lut import ColorLutMasker
+from adaptive_threshold import AdaptiveVThreshold
+from white_balance import GreyWorldWhiteBalance, grey_world_gains, gain_lut
+from frame_hub import FrameHub
+from debug_stream import DebugStream, start_debug_stream_server
+from detection_workers import DetectionWorkerPool
+from multi_target import MultiTargetTracker, find_blobs, select_target
 
 class CONFIG:
     """
@@ -11,6 +26,11 @@ class CONFIG:
     """
     # ... 原有选项保持不变 ...
     ENABLE_WHITE_BALANCE = False
+    # 白平衡增益在每隔 WHITE_BALANCE_SAMPLE_STEP 个像素抽样的图像上估计，
+    # 每隔 WHITE_BALANCE_INTERVAL 帧或画面亮度变化超过 WHITE_BALANCE_BRIGHTNESS_SHIFT（相对值）时重新估计
+    WHITE_BALANCE_INTERVAL = 10
+    WHITE_BALANCE_SAMPLE_STEP = 4
+    WHITE_BALANCE_BRIGHTNESS_SHIFT = 0.1
     CALCULATE_HSV_INFO = False
     ENHANCE_CONTRAST = False
     SHAPE_ANALYSIS_ENABLED = False
@@ -21,6 +41,42 @@ class CONFIG:
     # False: 使用下面传统的 LOWER/UPPER_COLOR_BOUND_1 固定阈值。
     ADAPTIVE_V_CHANNEL = False
     V_TOLERANCE = 60  # V通道动态阈值的容差范围
+    # V通道均值的指数滑动平均系数，越小阈值越平稳；1 表示不平滑，与逐帧重新计算一致
+    ADAPTIVE_V_EMA_ALPHA = 0.3
+
+    # True: 使用预先计算的 BGR -> 掩码查找表代替每帧的 cvtColor + inRange，
+    #       仅在固定阈值（ADAPTIVE_V_CHANNEL = False）且未开启 ENHANCE_CONTRAST 时生效。
+    #       查找表按阈值缓存在 lut_cache/ 目录中，阈值改变时自动重建。
+    USE_COLOR_LUT = False
+    COLOR_LUT_BITS = 8  # 每个颜色通道的量化位数，8 表示不量化，结果与逐帧计算完全一致
+
+    # True: 在传感器原始方向的图像上做检测，只把质心和轮廓映射到旋转后的坐标，
+    #       省去每帧整幅图像的旋转拷贝；旋转后的图像只在显示时生成。
+    #       检测结果与先旋转再检测一致（白平衡、阈值、对称的形态学核都与方向无关）。
+    ROTATION_FREE_DETECTION = False
+
+    # True: 追踪目标时只在中控线程卡尔曼预测位置附近的窗口内检测，
+    #       窗口半宽 = ROI_MIN_HALF_SIZE + ROI_SIGMA_SCALE * 预测的位置标准差（全分辨率像素）。
+    #       窗口内没有找到目标时下一帧改为整帧搜索，此外每隔 ROI_FULL_FRAME_INTERVAL 帧也做一次整帧搜索。
+    ROI_SEARCH = False
+    ROI_MIN_HALF_SIZE = 48
+    ROI_SIGMA_SCALE = 3.0
+    ROI_FULL_FRAME_INTERVAL = 10
+
+    # True: 提取每帧中所有符合条件的目标，跨帧关联成带编号的轨迹（每条轨迹一个卡尔曼滤波器），
+    #       再按 TARGET_POLICY 选出瞄准的目标，画面中有多个目标时不会在它们之间来回跳。
+    #       形状判断只使用外接矩形的长宽比；此模式下不使用 ROI_SEARCH。
+    MULTI_TARGET = False
+    TARGET_POLICY = 'closest'  # 'closest' 离激光中心最近, 'longest' 追踪时间最长, 'largest' 面积最大
+    TRACK_MAX_DISTANCE = 40    # 检测与轨迹预测位置的关联门限（全分辨率像素）
+    TRACK_MAX_MISSED = 5       # 轨迹连续这么多帧没有匹配上检测就被删除
+    TRACK_MIN_HITS = 2         # 轨迹至少匹配上这么多帧才参与目标选择
+
+    # 解码缩放倍数，可选 1, 2, 4, 8。
+    # 大于 1 时利用 libjpeg 在 DCT 域直接解码出 1/2、1/4、1/8 分辨率的图像，
+    # 检测只需要质心，缩小解码可以大幅降低解码和后续处理的耗时。
+    # 输出的坐标和面积会自动换算回全分辨率，MIN_CONTOUR_AREA 与形态学核也会随之调整。
+    DECODE_SCALE = 1
 
 
     # --- 传统固定阈值 (当 ADAPTIVE_V_CHANNEL = False 时生效) ---
@@ -39,29 +95,63 @@ class CONFIG:
     # UPPER_COLOR_BOUND_2 = None
 
 
-# ... apply_white_balance 函数保持不变 ...
+# 各缩放倍数对应的 imdecode 标志
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def decode_frame(jpg, scale=1):
+    """
+    解码一帧 JPEG。scale 大于 1 时直接在 DCT 域解码出缩小的图像。
+    """
+    if scale not in DECODE_FLAGS:
+        raise ValueError(f"不支持的解码缩放倍数: {scale}，可选值为 1, 2, 4, 8")
+    return cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), DECODE_FLAGS[scale])
+
+
+def to_full_resolution(x, y, scale):
+    """
+    把缩小图像中的坐标换算回全分辨率坐标。
+    缩小图像中的一个像素对应全分辨率中 scale x scale 的一块，取这一块的中心。
+    """
+    offset = (scale - 1) / 2
+    return x * scale + offset, y * scale + offset
+
+
+def rotate_contour_cw(contour, height):
+    """
+    把未旋转图像中的轮廓映射到顺时针旋转 90 度后的图像坐标：(x, y) -> (height-1-y, x)。
+    height 为未旋转图像的高度（行数）。
+    """
+    rotated = np.empty_like(contour)
+    rotated[..., 0] = height - 1 - contour[..., 1]
+    rotated[..., 1] = contour[..., 0]
+    # findContours 总是从光栅顺序中的第一个点（最上、最左）开始跟踪，
+    # 旋转是保向的，只需把起点轮换到同一个点，就与直接在旋转后的图像上得到的轮廓逐点一致
+    start = int(np.argmin(rotated[:, 0, 1].astype(np.int64) * height + rotated[:, 0, 0]))
+    return np.roll(rotated, -start, axis=0) if start else rotated
+
+
+def morphology_kernel(scale):
+    """全分辨率下使用 5x5 的结构元素，缩小解码时按比例缩小并保持奇数尺寸。"""
+    size = max(1, 5 // scale) | 1
+    return np.ones((size, size), np.uint8)
+
+
 def apply_white_balance(img):
     """
     应用“灰色世界”假设的白平衡算法来校正图像色偏。
+    增益在整幅图像上估计，通过每个通道一张查找表完成校正；连续处理视频帧时使用
+    FrameProcessor.white_balance，增益会被缓存。
     """
-    img_float = img.astype(np.float32)
-    avg_b = np.mean(img_float[:, :, 0])
-    avg_g = np.mean(img_float[:, :, 1])
-    avg_r = np.mean(img_float[:, :, 2])
-    
-    if avg_b == 0 or avg_g == 0 or avg_r == 0:
+    gains = grey_world_gains(img)
+    if gains is None:
         return img
-        
-    avg_gray = (avg_b + avg_g + avg_r) / 3
-    scale_b = avg_gray / avg_b
-    scale_g = avg_gray / avg_g
-    scale_r = avg_gray / avg_r
-
-    img_float[:, :, 0] *= scale_b
-    img_float[:, :, 1] *= scale_g
-    img_float[:, :, 2] *= scale_r
-    
-    return np.clip(img_float, 0, 255).astype(np.uint8)
+    return cv2.LUT(img, gain_lut(gains))
 
 
 # --- [新增函数] ---
@@ -92,183 +182,670 @@ def is_box_like(contour):
     return False # 其他情况都不是箱子
 
 
-def run_video_processing(shared_state, lock):
+def color_bounds():
+    """CONFIG 中当前生效的固定阈值范围列表 [(lower, upper), ...]。"""
+    return [
+        (CONFIG.LOWER_COLOR_BOUND_1, CONFIG.UPPER_COLOR_BOUND_1),
+        (CONFIG.LOWER_COLOR_BOUND_2, CONFIG.UPPER_COLOR_BOUND_2),
+    ]
+
+
+def create_color_mask(hsv):
+    """
+    根据 CONFIG 中的颜色阈值，从 HSV 图像生成目标颜色的二值化掩码。
+    视频线程在自适应模式下使用 AdaptiveVThreshold，这里的自适应分支保留为逐帧计算的参考实现。
+    """
+    if CONFIG.ADAPTIVE_V_CHANNEL:
+        # 1. 对 BOUND_1 进行HS初筛 (更清晰的写法)
+        lower_hs1 = np.array([CONFIG.LOWER_COLOR_BOUND_1[0], CONFIG.LOWER_COLOR_BOUND_1[1], 40])
+        upper_hs1 = np.array([CONFIG.UPPER_COLOR_BOUND_1[0], CONFIG.UPPER_COLOR_BOUND_1[1], 230])
+        hs_mask1 = cv2.inRange(hsv, lower_hs1, upper_hs1)
+            
+        combined_hs_mask = hs_mask1
+            
+        # (如果存在) 对 BOUND_2 进行HS初筛并合并
+        if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
+            lower_hs2 = np.array([CONFIG.LOWER_COLOR_BOUND_2[0], CONFIG.LOWER_COLOR_BOUND_2[1], 40])
+            upper_hs2 = np.array([CONFIG.UPPER_COLOR_BOUND_2[0], CONFIG.UPPER_COLOR_BOUND_2[1], 230])
+            hs_mask2 = cv2.inRange(hsv, lower_hs2, upper_hs2)
+            combined_hs_mask = cv2.bitwise_or(hs_mask1, hs_mask2)
+
+        # 2. 在所有可能区域内计算平均V值
+        if cv2.countNonZero(combined_hs_mask) > 0:
+            avg_v = cv2.mean(hsv[:,:,2], mask=combined_hs_mask)[0]
+        else:
+            avg_v = 128
+            
+        # 3. [修复] 动态计算V阈值并强制转换为整数
+        v_lower = int(max(0, avg_v - CONFIG.V_TOLERANCE))
+        v_upper = int(min(255, avg_v + CONFIG.V_TOLERANCE))
+            
+        # 4. 使用动态V值生成最终掩码
+        final_lower1 = np.array([CONFIG.LOWER_COLOR_BOUND_1[0], CONFIG.LOWER_COLOR_BOUND_1[1], v_lower])
+        final_upper1 = np.array([CONFIG.UPPER_COLOR_BOUND_1[0], CONFIG.UPPER_COLOR_BOUND_1[1], v_upper])
+        color_mask = cv2.inRange(hsv, final_lower1, final_upper1)
+
+        if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
+            final_lower2 = np.array([CONFIG.LOWER_COLOR_BOUND_2[0], CONFIG.LOWER_COLOR_BOUND_2[1], v_lower])
+            final_upper2 = np.array([CONFIG.UPPER_COLOR_BOUND_2[0], CONFIG.UPPER_COLOR_BOUND_2[1], v_upper])
+            color_mask2 = cv2.inRange(hsv, final_lower2, final_upper2)
+            color_mask = cv2.bitwise_or(color_mask, color_mask2)
+    else:
+        # 传统的固定阈值方法
+        color_mask = cv2.inRange(hsv, CONFIG.LOWER_COLOR_BOUND_1, CONFIG.UPPER_COLOR_BOUND_1)
+        if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
+            color_mask2 = cv2.inRange(hsv, CONFIG.LOWER_COLOR_BOUND_2, CONFIG.UPPER_COLOR_BOUND_2)
+            color_mask = cv2.bitwise_or(color_mask, color_mask2)
+    return color_mask
+
+
+def find_target(color_mask, scale=1, rotate_cw=False, offset=(0, 0), frame_height=None):
+    """
+    在掩码中寻找面积最大的轮廓，并检查其面积和形状。
+    scale 为解码缩放倍数，面积会先换算回全分辨率再与 MIN_CONTOUR_AREA 比较。
+    rotate_cw 为 True 时 color_mask 是未旋转的图像，找到的轮廓会先映射到
+    顺时针旋转 90 度后的坐标再计算质心，结果与先旋转掩码再检测完全一致。
+    color_mask 只是整帧中的一个窗口时，offset 为窗口左上角在整帧中的坐标，
+    frame_height 为整帧的高度，返回的轮廓和质心都是整帧坐标。
+    返回 (轮廓, (质心x, 质心y))，质心为掩码图像中的浮点坐标；未找到目标时返回 None。
+    """
+    contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                   offset=offset)
+    if not contours:
+        return None
+
+    if rotate_cw:
+        # 只映射面积最大的轮廓的顶点，比旋转整幅图像便宜得多。
+        # findContours 按起点的光栅顺序倒序输出，max 取第一个，
+        # 面积相同时取旋转后起点最靠后的那个，与旋转后再检测的选择一致
+        areas = [cv2.contourArea(c) for c in contours]
+        largest_area = max(areas)
+        largest_contour = max(
+            (rotate_contour_cw(c, frame_height or color_mask.shape[0])
+             for c, area in zip(contours, areas) if area == largest_area),
+            key=lambda c: (c[0, 0, 1], c[0, 0, 0])
+        )
+    else:
+        largest_contour = max(contours, key=cv2.contourArea)
+
+    # --- [修改] 在处理最大轮廓前，先进行形状判断 ---
+    if cv2.contourArea(largest_contour) * scale * scale <= MIN_CONTOUR_AREA or not is_box_like(largest_contour):
+        return None
+
+    M = cv2.moments(largest_contour)
+    if M["m00"] == 0:
+        return None
+    return largest_contour, (M["m10"] / M["m00"], M["m01"] / M["m00"])
+
+
+def roi_window(prediction, shape, scale=1, rotate_cw=False):
+    """
+    由中控线程发布的预测 (x, y, sigma_x, sigma_y)（旋转后的全分辨率坐标）
+    计算检测图像中的搜索窗口 (x0, y0, x1, y1)，shape 为检测图像的尺寸。
+    rotate_cw 为 True 时检测图像是未旋转的，窗口会换算到未旋转图像的坐标。
+    预测位置在画面外或窗口超过半幅画面时返回 None，此时直接做整帧搜索更划算。
+    """
+    x, y, sigma_x, sigma_y = prediction
+    # 全分辨率坐标换算到（可能缩小的）检测图像坐标，是 to_full_resolution 的逆运算
+    offset = (scale - 1) / 2
+    cx, cy = (x - offset) / scale, (y - offset) / scale
+    half_x = (CONFIG.ROI_MIN_HALF_SIZE + CONFIG.ROI_SIGMA_SCALE * sigma_x) / scale
+    half_y = (CONFIG.ROI_MIN_HALF_SIZE + CONFIG.ROI_SIGMA_SCALE * sigma_y) / scale
+    height, width = shape[:2]
+    if rotate_cw:
+        # 旋转后的 (x', y') 对应未旋转图像中的 (y', height-1-x')
+        cx, cy = cy, height - 1 - cx
+        half_x, half_y = half_y, half_x
+
+    x0, x1 = max(0, int(cx - half_x)), min(width, int(cx + half_x) + 1)
+    y0, y1 = max(0, int(cy - half_y)), min(height, int(cy + half_y) + 1)
+    if x1 <= x0 or y1 <= y0 or 2 * (x1 - x0) * (y1 - y0) > width * height:
+        return None
+    return x0, y0, x1, y1
+
+
+class FrameProcessor:
+    """
+    持有检测流水线的全部工作缓冲区和结构元素。
+
+    缓冲区按出现过的最大尺寸分配一次，较小的图像（如 ROI 窗口）直接使用左上角的视图；
+    所有 OpenCV 调用都通过 dst= 写入这些缓冲区，稳定运行时每帧不再分配整幅图像大小的内存。
+    各方法返回的图像和掩码在下一次调用同一方法之前有效。
+    """
+
+    def __init__(self, scale=1, lut_masker=None, adaptive_v=None):
+        self.scale = scale
+        self.kernel = morphology_kernel(scale)
+        self.lut_masker = lut_masker
+        self.adaptive_v = adaptive_v
+        self.white_balancer = GreyWorldWhiteBalance(
+            CONFIG.WHITE_BALANCE_INTERVAL, CONFIG.WHITE_BALANCE_SAMPLE_STEP,
+            CONFIG.WHITE_BALANCE_BRIGHTNESS_SHIFT,
+        )
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        """名为 name、尺寸为 shape 的 uint8 缓冲区视图，容量不足时按需增长。"""
+        # 同名缓冲区的通道数固定，只需比较高和宽
+        h, w = shape[:2]
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape[0] < h or buf.shape[1] < w:
+            if buf is not None:
+                shape = (max(h, buf.shape[0]), max(w, buf.shape[1])) + tuple(shape[2:])
+            buf = self._buffers[name] = np.empty(shape, np.uint8)
+        return buf[:h, :w]
+
+    @property
+    def uses_lut(self):
+        """查找表模式直接由 BGR 得到掩码，不需要转换到 HSV。"""
+        return (self.lut_masker is not None and not CONFIG.ADAPTIVE_V_CHANNEL
+                and not CONFIG.ENHANCE_CONTRAST)
+
+    def rotate(self, img):
+        """顺时针旋转 90 度。"""
+        h, w = img.shape[:2]
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE,
+                          dst=self._buffer('rotated', (w, h) + img.shape[2:]))
+
+    def white_balance(self, img):
+        """灰色世界白平衡，使用缓存的增益。"""
+        return self.white_balancer.apply(img, out=self._buffer('balanced', img.shape))
+
+    def to_hsv(self, img):
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=self._buffer('hsv', img.shape))
+        if CONFIG.ENHANCE_CONTRAST:
+            # 仅对亮度通道V进行直方图均衡化
+            v = cv2.extractChannel(hsv, 2, dst=self._buffer('v', img.shape[:2]))
+            cv2.equalizeHist(v, dst=v)
+            cv2.insertChannel(v, hsv, 2)
+        return hsv
+
+    def mask(self, img, hsv):
+        """按 CONFIG 中的阈值生成二值化掩码；查找表模式下 hsv 可以为 None。"""
+        out = self._buffer('mask', img.shape[:2])
+        if self.uses_lut:
+            self.lut_masker.update(color_bounds())
+            return self.lut_masker.mask(img, out=out)
+        if CONFIG.ADAPTIVE_V_CHANNEL:
+            return self.adaptive_v.mask(hsv, color_bounds(), CONFIG.V_TOLERANCE, out=out)
+        first = True
+        for lower, upper in color_bounds():
+            if lower is None or upper is None:
+                continue
+            if first:
+                cv2.inRange(hsv, lower, upper, dst=out)
+                first = False
+            else:
+                tmp = cv2.inRange(hsv, lower, upper, dst=self._buffer('mask_tmp', img.shape[:2]))
+                cv2.bitwise_or(out, tmp, dst=out)
+        return out
+
+    def morphology(self, mask):
+        """开运算后闭运算，结果写入预分配的缓冲区。"""
+        opened = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel,
+                                  dst=self._buffer('opened', mask.shape))
+        return cv2.morphologyEx(opened, cv2.MORPH_CLOSE, self.kernel,
+                                dst=self._buffer('morph', mask.shape))
+
+
+def detect_frame(jpg, processor, roi=None):
+    """
+    按照 run_video_processing 的流程处理一帧（不含显示部分），
+    返回旋转后坐标系中的全分辨率质心 (x, y)，未检测到目标时返回 None。
+    roi 为 roi_window 返回的搜索窗口，None 表示整帧搜索。
+    供多进程检测和基准测试使用。
+    """
+    scale = processor.scale
+    img = decode_frame(jpg, scale)
+    if img is None:
+        raise ValueError("JPEG 解码失败")
+    # 白平衡逐通道查表，与旋转可交换；在旋转前做，免旋转模式下估计出的增益也完全相同
+    if CONFIG.ENABLE_WHITE_BALANCE:
+        img = processor.white_balance(img)
+    if not CONFIG.ROTATION_FREE_DETECTION:
+        img = processor.rotate(img)
+    frame_height = img.shape[0]
+    x0 = y0 = 0
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        img = img[y0:y1, x0:x1]
+    hsv = None if processor.uses_lut else processor.to_hsv(img)
+    color_mask = processor.morphology(processor.mask(img, hsv))
+    target = find_target(color_mask, scale, rotate_cw=CONFIG.ROTATION_FREE_DETECTION,
+                         offset=(x0, y0), frame_height=frame_height)
+    if target is None:
+        return None
+    return to_full_resolution(*target[1], scale)
+
+
+def run_pipelined_detection(mailbox, state, measurements, recorder, latency):
+    """
+    多进程模式：解码和检测在 DETECTION_WORKERS 个工作进程中完成，
+    本线程只负责把最新的帧写入共享内存环并分发，另一个线程收集结果并更新共享坐标，
+    中控和蓝牙线程因此不再与检测争抢 GIL。返回处理完成的帧数。
+    """
+    config_values = {name: value for name, value in vars(CONFIG).items() if name.isupper()}
+    pool = DetectionWorkerPool(DETECTION_WORKERS, MAX_JPEG_FRAME_SIZE, config_values)
+    pool.start()
+    print(f"[视频线程] 已启动 {DETECTION_WORKERS} 个检测进程。")
+
+    decode_failures = REGISTRY.counter('camera_decode_failures_total', "解码失败的帧数")
+    detections = REGISTRY.counter('camera_detections_total', "检测到目标的帧数")
+    stale_results = REGISTRY.counter(
+        'camera_stale_results_total', "多进程模式下晚于更新的帧到达而被丢弃的检测结果数"
+    )
+    measurements_dropped = REGISTRY.counter(
+        'camera_measurements_dropped_total', "中控线程来不及取走、因测量队列已满被丢弃的检测结果数"
+    )
+    worker_seconds = REGISTRY.histogram('camera_worker_seconds', "检测进程中单帧解码和检测的耗时（秒）")
+    frame_seconds = REGISTRY.histogram('camera_frame_seconds', "单帧从取出到处理完成的总耗时（秒）")
+
+    pending = {}  # 序号 -> (jpg, 分发时刻, EOI 到达时刻)
+    collecting = threading.Event()
+    collecting.set()
+    processed = [0]
+
+    def collect_results():
+        last_seq = -1
+        while collecting.is_set():
+            for seq, timestamp, ok, detection, elapsed in pool.results(timeout=0.2):
+                jpg, submitted, eoi_time = pending.pop(seq)
+                worker_seconds.observe(elapsed)
+                frame_seconds.observe_since(submitted)
+                processed[0] += 1
+                if not ok:
+                    decode_failures.inc()
+                    continue
+                # 多个进程的结果可能乱序到达，只发布比已发布结果更新的帧
+                if seq < last_seq:
+                    stale_results.inc()
+                    continue
+                last_seq = seq
+                if detection is not None:
+                    detections.inc()
+                # timestamp 是这一帧估计的曝光时刻，中控线程据此计算需要外推的时长
+                if detection is not None and measurements.put(timestamp, detection):
+                    measurements_dropped.inc()
+                state.detection = Detection(frame_time=timestamp)
+                latency.on_result(eoi_time, time.monotonic())
+                if recorder is not None:
+                    recorder.record(jpg, to_wall_clock(timestamp), detection)
+
+    collector = threading.Thread(target=collect_results, daemon=True)
+    collector.start()
+
+    seq = 0
+    try:
+        while state.running:
+            # 先等到有空闲槽位再取帧，保证送进工作进程的总是最新的一帧
+            slot = pool.acquire_slot(timeout=1.0)
+            if slot is None:
+                if not pool.alive:
+                    print("[视频线程] 错误：检测进程已全部退出，正在停止程序...")
+                    state.stop()
+                    break
+                continue
+            frame = mailbox.take(timeout=1.0)
+            if frame is None:
+                pool.release_slot(slot)
+                if mailbox.closed:
+                    print("[视频线程] 帧源已结束，正在停止程序...")
+                    state.stop()
+                    break
+                continue
+            jpg, soi_time, eoi_time = frame
+            pending[seq] = (jpg if recorder is not None else None, time.perf_counter(), eoi_time)
+            if pool.submit(slot, seq, jpg, latency.capture_time(soi_time)):
+                seq += 1
+            else:
+                del pending[seq]
+                decode_failures.inc()
+    finally:
+        collecting.clear()
+        collector.join()
+        pool.close()
+    return processed[0]
+
+
+def draw_detection(img, contour, center, detection):
+    """
+    在显示图像上绘制目标轮廓、质心和全分辨率坐标。
+    center 为显示图像中的浮点质心，detection 为全分辨率坐标。
+    """
+    px, py = int(center[0]), int(center[1])
+    # 用绿色绘制通过所有检查的最终轮廓
+    cv2.drawContours(img, [contour], -1, (0, 255, 0), 2)
+    cv2.circle(img, (px, py), 7, (255, 0, 0), -1)
+    cv2.putText(img, f"BOX ({detection[0]:.0f}, {detection[1]:.0f})", (px + 10, py - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+
+def close_video_pipeline(mailbox, recorder, processed_count, elapsed):
+    """打印帧统计并关闭录像。"""
+    print(f"[视频线程] 正在关闭... (共采集 {mailbox.received_count} 帧，因处理不及丢弃 {mailbox.dropped_count} 帧，"
+          f"处理 {processed_count} 帧，平均 {processed_count / elapsed:.1f} 帧/秒)")
+    if recorder is not None:
+        try:
+            recorder.close()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"[视频线程] 录像未能完整保存（已写入 {recorder.recorded_count} 帧）: {e}")
+        else:
+            print(f"[视频线程] 录像已保存，共 {recorder.recorded_count} 帧，丢弃 {recorder.dropped_count} 帧")
+
+
+def draw_tracks(img, tracks, selected, scale):
+    """在显示图像上标出所有轨迹的位置和编号，选中的目标用 draw_detection 的样式突出显示。"""
+    offset = (scale - 1) / 2
+    for track in tracks:
+        if track.missed:
+            continue
+        px = int((track.measurement[0] - offset) / scale)
+        py = int((track.measurement[1] - offset) / scale)
+        radius = max(3, int(np.sqrt(track.area) / scale / 2))
+        color = (255, 0, 0) if track is selected else (0, 255, 255)
+        cv2.circle(img, (px, py), radius, color, 2)
+        cv2.putText(img, f"#{track.id}", (px + radius + 2, py + radius + 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        if track is selected:
+            cv2.putText(img, f"BOX ({int(track.measurement[0])}, {int(track.measurement[1])})",
+                        (px + 10, py - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+
+def run_video_processing(state, measurements):
     """
     在一个独立线程中运行，负责连接视频流，检测指定颜色物体，并更新共享的坐标。
+    每个检测结果以 (估计的曝光时刻, 全分辨率坐标) 放入 measurements（MeasurementQueue）交给中控线程。
+    每帧的检测结果另以 Detection 快照发布到 state.detection。
     """
-    # ... (视频流连接部分代码保持不变) ...
-    print("[视频线程] 正在连接视频流...")
+    source = create_frame_source(FRAME_SOURCE, fps=REPLAY_FPS, loop=REPLAY_LOOP)
+    print(f"[视频线程] 正在打开帧源 {source.name}...")
     try:
-        stream = requests.get(VIDEO_STREAM_URL, stream=True, timeout=10)
-        if stream.status_code != 200:
-            print(f"[视频线程] 错误：无法连接到视频流，状态码: {stream.status_code}")
-            return
-    except requests.exceptions.RequestException as e:
-        print(f"[视频线程] 错误：连接视频流失败: {e}")
-        with lock:
-            shared_state['running'] = False
+        source.open()
+    except FrameSourceError as e:
+        print(f"[视频线程] 错误：{e}")
+        state.stop()
         return
 
-    print("[视频线程] 视频流连接成功。")
-    bytes_data = b''
+    print("[视频线程] 帧源打开成功。")
+
+    # 网络读取放到单独的采集线程中，处理线程每次只取最新的一帧，
+    # 处理跟不上时丢弃旧帧，而不是让帧堆积在 TCP 缓冲区里越来越滞后
+    mailbox = LatestFrameMailbox()
+    # 根据每帧的到达时刻和处理耗时在线估计采集延迟
+    latency = LatencyEstimator(LATENCY_EMA_ALPHA, CAPTURE_DELAY_FRAMES)
+    capture_thread = threading.Thread(
+        target=run_frame_capture, args=(source, mailbox, state, latency), daemon=True
+    )
+    capture_thread.start()
+
+    recorder = None
+    if RECORD_PATH:
+        recorder = MjpegRecorder(RECORD_PATH, RECORD_QUEUE_SIZE)
+        recorder.start()
+        print(f"[视频线程] 正在录像到 {RECORD_PATH}")
+
+    if DETECTION_WORKERS:
+        # 多进程模式下没有图形界面，检测结果只写入共享状态
+        start_time = time.monotonic()
+        processed_count = run_pipelined_detection(
+            mailbox, state, measurements, recorder, latency
+        )
+        close_video_pipeline(mailbox, recorder, processed_count, time.monotonic() - start_time)
+        return
 
 
-    # 创建一个字典来存储鼠标的当前位置和对应点的HSV值
-    mouse_data = {'hsv': None}
+    # 创建一个字典来存储鼠标的当前位置，对应点的HSV值在每帧处理时读取
+    mouse_data = {'pos': None}
 
 
     # 定义鼠标回调函数
     def get_hsv_on_mouse_move(event, x, y, flags, param):
-        # param 参数在这里就是每一帧的 hsv 图像
-        # 当鼠标在窗口上移动时 (EVENT_MOUSEMOVE)
+        # 当鼠标在窗口上移动时 (EVENT_MOUSEMOVE)，记录鼠标位置
         if event == cv2.EVENT_MOUSEMOVE:
-            # 从 hsv 图像中获取 (y, x) 坐标的像素值
-            # 注意OpenCV的坐标是 (y, x) 而不是 (x, y)
-            hsv_pixel = param[y, x]
-            mouse_data['hsv'] = tuple(hsv_pixel)
-
-
-    cv2.namedWindow('Video Feed')
-    
-    cv2.setMouseCallback('Video Feed', get_hsv_on_mouse_move, param=None)
-
-
-    while shared_state.get('running', True):
+            mouse_data['pos'] = (x, y)
+
+
+    debug_stream = debug_server = None
+    if HEADLESS:
+        # 无界面模式不创建窗口；调试画面只在有客户端连接时按限定帧率渲染
+        if DEBUG_STREAM_PORT:
+            debug_stream = DebugStream(FrameHub(), DEBUG_STREAM_FPS)
+            debug_server = start_debug_stream_server(debug_stream.hub, DEBUG_STREAM_PORT)
+            print(f"[视频线程] 调试画面已在 http://127.0.0.1:{DEBUG_STREAM_PORT}/stream 上输出。")
+    else:
+        cv2.namedWindow('Video Feed')
+
+        cv2.setMouseCallback('Video Feed', get_hsv_on_mouse_move, param=None)
+
+    # 所有工作缓冲区和结构元素只分配一次，循环内不再为每帧分配整幅图像
+    scale = CONFIG.DECODE_SCALE
+    processor = FrameProcessor(
+        scale,
+        lut_masker=ColorLutMasker(CONFIG.COLOR_LUT_BITS) if CONFIG.USE_COLOR_LUT else None,
+        adaptive_v=AdaptiveVThreshold(CONFIG.ADAPTIVE_V_EMA_ALPHA),
+    )
+
+
+    processed_count = 0
+    start_time = time.monotonic()
+
+    frames_since_full_search = 0
+    roi_missed = False
+
+    tracker = None
+    if CONFIG.MULTI_TARGET:
+        tracker = MultiTargetTracker(CONFIG.TRACK_MAX_DISTANCE, CONFIG.TRACK_MAX_MISSED,
+                                     CONFIG.TRACK_MIN_HITS)
+    tracks, selected = [], None
+
+    frames_decoded = REGISTRY.counter('camera_frames_decoded_total', "成功解码并进入检测的帧数")
+    decode_failures = REGISTRY.counter('camera_decode_failures_total', "解码失败的帧数")
+    detections = REGISTRY.counter('camera_detections_total', "检测到目标的帧数")
+    measurements_dropped = REGISTRY.counter(
+        'camera_measurements_dropped_total', "中控线程来不及取走、因测量队列已满被丢弃的检测结果数"
+    )
+    stage_help = "检测流水线各阶段耗时（秒）"
+    stage_decode = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'decode'})
+    stage_preprocess = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'preprocess'})
+    stage_mask = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'mask'})
+    stage_morphology = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'morphology'})
+    stage_contours = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'contours'})
+    stage_display = REGISTRY.histogram('camera_stage_seconds', stage_help, {'stage': 'display'})
+    debug_frames = REGISTRY.counter('camera_debug_frames_total', "无界面模式下渲染的调试画面帧数")
+    roi_frames = REGISTRY.counter('camera_roi_frames_total', "只在预测窗口内检测的帧数")
+    roi_misses = REGISTRY.counter('camera_roi_misses_total', "预测窗口内没有找到目标的帧数")
+    frame_seconds = REGISTRY.histogram('camera_frame_seconds', "单帧从取出到处理完成的总耗时（秒）")
+
+    while state.running:
         try:
-            for chunk in stream.iter_content(chunk_size=1024):
-                if not shared_state.get('running', True):
+            frame = mailbox.take(timeout=1.0)
+            if frame is None:
+                if mailbox.closed:
+                    print("[视频线程] 帧源已结束，正在停止程序...")
+                    state.stop()
                     break
-
-                bytes_data += chunk
-                a = bytes_data.find(b'\xff\xd8')
-                b = bytes_data.find(b'\xff\xd9')
-
-                if a != -1 and b != -1:
-                    jpg = bytes_data[a:b + 2]
-                    bytes_data = bytes_data[b + 2:]
-                    if jpg:
-                        img = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        if img is None:
-                            continue
-                        
+                continue
+
+            # 所有时间戳都以这一帧估计的曝光时刻为准，而不是处理完成的时刻
+            jpg, soi_time, eoi_time = frame
+            frame_time = latency.capture_time(soi_time)
+            frame_start = t = time.perf_counter()
+            img = decode_frame(jpg, scale)
+            if img is None:
+                decode_failures.inc()
+                continue
+            processed_count += 1
+            frames_decoded.inc()
+            t = stage_decode.observe_since(t)
+
+            # 白平衡逐通道查表，与旋转可交换，先做白平衡使两种模式估计出的增益相同
+            if CONFIG.ENABLE_WHITE_BALANCE:
+                img = processor.white_balance(img)
+
+            # 免旋转模式下检测直接在传感器原始方向的图像上进行，
+            # 只把检测结果映射到旋转后的坐标，旋转后的整帧图像只用于显示
+            rotation_free = CONFIG.ROTATION_FREE_DETECTION
+            if not rotation_free:
+                img = processor.rotate(img)
+
+            # 追踪时只在卡尔曼预测位置附近的窗口内检测，
+            # 窗口内丢失目标后或每隔 ROI_FULL_FRAME_INTERVAL 帧做一次整帧搜索
+            roi = None
+            if (CONFIG.ROI_SEARCH and tracker is None and not roi_missed
+                    and frames_since_full_search < CONFIG.ROI_FULL_FRAME_INTERVAL):
+                prediction = state.command.track_prediction
+                if prediction is not None:
+                    roi = roi_window(prediction, img.shape, scale, rotation_free)
+            if roi is None:
+                frames_since_full_search = 0
+                x0 = y0 = 0
+                search_img = img
+            else:
+                frames_since_full_search += 1
+                x0, y0, x1, y1 = roi
+                search_img = img[y0:y1, x0:x1]
+                roi_frames.inc()
+
+            # 查找表模式直接由 BGR 得到掩码，不需要整帧转换到 HSV
+            # RGB to HSV（开启 ENHANCE_CONTRAST 时同时对 V 通道做直方图均衡化）
+            hsv = None if processor.uses_lut else processor.to_hsv(search_img)
+            t = stage_preprocess.observe_since(t)
+
+            # --- 使用宏定义的颜色范围进行物体检测 ---
+            color_mask = processor.mask(search_img, hsv)
+            t = stage_mask.observe_since(t)
+
+            # ... (形态学操作保持不变) ...
+            color_mask = processor.morphology(color_mask)
+            t = stage_morphology.observe_since(t)
+
+            detection = None
+            if tracker is not None:
+                # 多目标模式：所有连通区域都参与轨迹关联，按策略选出瞄准的目标
+                aspect_range = None
+                if CONFIG.SHAPE_ANALYSIS_ENABLED:
+                    aspect_range = (CONFIG.MIN_ASPECT_RATIO, CONFIG.MAX_ASPECT_RATIO)
+                centers, _, areas = find_blobs(color_mask, scale, MIN_CONTOUR_AREA, aspect_range,
+                                               rotate_cw=rotation_free)
+                tracker.update(centers * scale + (scale - 1) / 2, areas, frame_time)
+                tracks = tracker.confirmed()
+                selected = select_target(tracks, CONFIG.TARGET_POLICY, LIGHT_CENTER,
+                                         selected.id if selected is not None else None)
+                # 选中的目标本帧没有匹配上检测时不发布坐标，由中控线程的滤波器外推
+                if selected is not None and not selected.missed:
+                    detection = (float(selected.measurement[0]), float(selected.measurement[1]))
+                    detections.inc()
+                target = None
+            else:
+                target = find_target(color_mask, scale, rotate_cw=rotation_free,
+                                     offset=(x0, y0), frame_height=img.shape[0])
+            roi_missed = roi is not None and target is None
+            if roi_missed:
+                roi_misses.inc()
+            if target is not None:
+                largest_contour, (x, y) = target
+                # 换算回全分辨率坐标，供 LIGHT_CENTER 和中控线程使用；
+                # 与多进程模式相同，保留亚像素的浮点坐标交给滤波器
+                detection = to_full_resolution(x, y, scale)
+                detections.inc()
+            t = stage_contours.observe_since(t)
+
+            if detection is not None and measurements.put(frame_time, detection):
+                measurements_dropped.inc()
+            published_tracks = ()
+            if tracker is not None:
+                # (编号, 全分辨率坐标, 面积, 已追踪的秒数)，只包括本帧匹配上检测的轨迹
+                published_tracks = tuple(
+                    (t.id, (int(t.measurement[0]), int(t.measurement[1])), t.area, t.lifetime)
+                    for t in tracks if not t.missed
+                )
+            state.detection = Detection(tracks=published_tracks, frame_time=frame_time)
+
+            latency.on_result(eoi_time, time.monotonic())
+
+            if recorder is not None:
+                recorder.record(jpg, to_wall_clock(frame_time), detection)
+
+            # --- 以下仅用于显示，轮廓和质心已经是旋转后的坐标 ---
+            if HEADLESS:
+                if debug_stream is not None and debug_stream.wants_frame():
+                    if roi is not None:
+                        cv2.rectangle(img, (x0, y0), (x1 - 1, y1 - 1), (0, 255, 255), 1)
+                    if rotation_free:
                         img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-
-                        if CONFIG.ENABLE_WHITE_BALANCE:
-                            img = apply_white_balance(img)
-
-                        # RGB to HSV
-                        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-                        
-                        # --- [修改] 应用对比度增强 ---
-                        if CONFIG.ENHANCE_CONTRAST:
-                            h, s, v = cv2.split(hsv)
-                            v = cv2.equalizeHist(v) # 仅对亮度通道V进行直方图均衡化
-                            hsv = cv2.merge([h, s, v])
-
-                        # ... (HSV 信息打印部分保持不变) ...
-                        # 每次循环时，都更新回调函数的 param 参数为最新的 hsv 图像
-                        cv2.setMouseCallback('Video Feed', get_hsv_on_mouse_move, param=hsv)
-                        
-                        # 如果 mouse_data 中有值，就将其绘制在图像上
-                        if mouse_data['hsv'] is not None:
-                            h, s, v = mouse_data['hsv']
-                            hsv_text = f'HSV: ({h}, {s}, {v})'
-                            # 将文字绘制在左上角
-                            cv2.putText(img, hsv_text, (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 
-                                        0.6, (255, 255, 0), 2, cv2.LINE_AA)
-                        
-                        # --- 使用宏定义的颜色范围进行物体检测 ---
-                        if CONFIG.ADAPTIVE_V_CHANNEL:
-                            # 1. 对 BOUND_1 进行HS初筛 (更清晰的写法)
-                            lower_hs1 = np.array([CONFIG.LOWER_COLOR_BOUND_1[0], CONFIG.LOWER_COLOR_BOUND_1[1], 40])
-                            upper_hs1 = np.array([CONFIG.UPPER_COLOR_BOUND_1[0], CONFIG.UPPER_COLOR_BOUND_1[1], 230])
-                            hs_mask1 = cv2.inRange(hsv, lower_hs1, upper_hs1)
-                            
-                            combined_hs_mask = hs_mask1
-                            
-                            # (如果存在) 对 BOUND_2 进行HS初筛并合并
-                            if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
-                                lower_hs2 = np.array([CONFIG.LOWER_COLOR_BOUND_2[0], CONFIG.LOWER_COLOR_BOUND_2[1], 40])
-                                upper_hs2 = np.array([CONFIG.UPPER_COLOR_BOUND_2[0], CONFIG.UPPER_COLOR_BOUND_2[1], 230])
-                                hs_mask2 = cv2.inRange(hsv, lower_hs2, upper_hs2)
-                                combined_hs_mask = cv2.bitwise_or(hs_mask1, hs_mask2)
-
-                            # 2. 在所有可能区域内计算平均V值
-                            if cv2.countNonZero(combined_hs_mask) > 0:
-                                avg_v = cv2.mean(hsv[:,:,2], mask=combined_hs_mask)[0]
-                            else:
-                                avg_v = 128
-                            
-                            # 3. [修复] 动态计算V阈值并强制转换为整数
-                            v_lower = int(max(0, avg_v - CONFIG.V_TOLERANCE))
-                            v_upper = int(min(255, avg_v + CONFIG.V_TOLERANCE))
-                            
-                            # 4. 使用动态V值生成最终掩码
-                            final_lower1 = np.array([CONFIG.LOWER_COLOR_BOUND_1[0], CONFIG.LOWER_COLOR_BOUND_1[1], v_lower])
-                            final_upper1 = np.array([CONFIG.UPPER_COLOR_BOUND_1[0], CONFIG.UPPER_COLOR_BOUND_1[1], v_upper])
-                            color_mask = cv2.inRange(hsv, final_lower1, final_upper1)
-
-                            if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
-                                final_lower2 = np.array([CONFIG.LOWER_COLOR_BOUND_2[0], CONFIG.LOWER_COLOR_BOUND_2[1], v_lower])
-                                final_upper2 = np.array([CONFIG.UPPER_COLOR_BOUND_2[0], CONFIG.UPPER_COLOR_BOUND_2[1], v_upper])
-                                color_mask2 = cv2.inRange(hsv, final_lower2, final_upper2)
-                                color_mask = cv2.bitwise_or(color_mask, color_mask2)
-                        else:
-                            # 传统的固定阈值方法
-                            color_mask = cv2.inRange(hsv, CONFIG.LOWER_COLOR_BOUND_1, CONFIG.UPPER_COLOR_BOUND_1)
-                            if CONFIG.LOWER_COLOR_BOUND_2 is not None and CONFIG.UPPER_COLOR_BOUND_2 is not None:
-                                color_mask2 = cv2.inRange(hsv, CONFIG.LOWER_COLOR_BOUND_2, CONFIG.UPPER_COLOR_BOUND_2)
-                                color_mask = cv2.bitwise_or(color_mask, color_mask2)
-                        # ... (形态学操作保持不变) ...
-                        kernel = np.ones((5, 5), np.uint8)
-                        color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_OPEN, kernel)
-                        color_mask = cv2.morphologyEx(color_mask, cv2.MORPH_CLOSE, kernel)
-                        
-                        contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                        
-                        found_object = False
-                        if contours:
-                            largest_contour = max(contours, key=cv2.contourArea)
-
-                            # --- [修改] 在处理最大轮廓前，先进行形状判断 ---
-                            if cv2.contourArea(largest_contour) > MIN_CONTOUR_AREA and is_box_like(largest_contour):
-                                M = cv2.moments(largest_contour)
-                                if M["m00"] != 0:
-                                    cX = int(M["m10"] / M["m00"])
-                                    cY = int(M["m01"] / M["m00"])
-                                    
-                                    with lock:
-                                        shared_state['detection_data'] = ((cX, cY),time.time())
-                                    found_object = True
-
-                                    # 用绿色绘制通过所有检查的最终轮廓
-                                    cv2.drawContours(img, [largest_contour], -1, (0, 255, 0), 2)
-                                    cv2.circle(img, (cX, cY), 7, (255, 0, 0), -1)
-                                    cv2.putText(img, f"BOX ({cX}, {cY})", (cX + 10, cY - 10),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-                        
-                        if not found_object:
-                            with lock:
-                                shared_state['detection_data'] = None
-
-                        cv2.imshow('Video Feed', img)
-                        cv2.imshow('Color Mask', color_mask)
-                        
-                        if cv2.waitKey(1) == 27:
-                            with lock:
-                                shared_state['running'] = False
-                            break
+                    if tracker is not None:
+                        draw_tracks(img, tracks, selected, scale)
+                    elif detection is not None:
+                        draw_detection(img, largest_contour, (x, y), detection)
+                    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])
+                    if ok:
+                        debug_stream.publish(buf.tobytes())
+                        debug_frames.inc()
+                    t = stage_display.observe_since(t)
+                frame_seconds.observe_since(frame_start)
+                continue
+
+            if roi is not None:
+                # 掩码只覆盖搜索窗口，显示时铺回整帧，并标出搜索窗口
+                full_mask = np.zeros(img.shape[:2], np.uint8)
+                full_mask[y0:y1, x0:x1] = color_mask
+                color_mask = full_mask
+                cv2.rectangle(img, (x0, y0), (x1 - 1, y1 - 1), (0, 255, 255), 1)
+                # 此时的 hsv 只是窗口内的部分，鼠标处的 HSV 值改为从图像中直接计算
+                hsv = None
+
+            native_height = img.shape[0]
+            if rotation_free:
+                img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+                color_mask = cv2.rotate(color_mask, cv2.ROTATE_90_CLOCKWISE)
+
+            # ... (HSV 信息打印部分保持不变) ...
+            # 如果鼠标在窗口内，就读取该点的HSV值并绘制在图像上
+            if mouse_data['pos'] is not None:
+                mx, my = mouse_data['pos']
+                if 0 <= mx < img.shape[1] and 0 <= my < img.shape[0]:
+                    # 注意OpenCV的坐标是 (y, x) 而不是 (x, y)
+                    if hsv is None:
+                        h, s, v = cv2.cvtColor(img[my:my + 1, mx:mx + 1], cv2.COLOR_BGR2HSV)[0, 0]
+                    elif rotation_free:
+                        # 显示坐标映射回未旋转的 HSV 图像
+                        h, s, v = hsv[native_height - 1 - mx, my]
+                    else:
+                        h, s, v = hsv[my, mx]
+                    hsv_text = f'HSV: ({h}, {s}, {v})'
+                    # 将文字绘制在左上角
+                    cv2.putText(img, hsv_text, (10, 20), cv2.FONT_HERSHEY_SIMPLEX,
+                                0.6, (255, 255, 0), 2, cv2.LINE_AA)
+
+            if tracker is not None:
+                draw_tracks(img, tracks, selected, scale)
+            elif detection is not None:
+                # (x, y) 为解码得到的（可能缩小的）图像中的质心
+                draw_detection(img, largest_contour, (x, y), detection)
+
+            cv2.imshow('Video Feed', img)
+            cv2.imshow('Color Mask', color_mask)
+            key = cv2.waitKey(1)
+            t = stage_display.observe_since(t)
+            frame_seconds.observe_since(frame_start)
+
+            if key == 27:
+                state.stop()
+                break
 
             # ... (窗口关闭处理部分保持不变) ...
             if cv2.getWindowProperty('Video Feed', cv2.WND_PROP_VISIBLE) < 1:
                 print("[视频线程] 视频窗口已关闭，正在停止程序...")
-                with lock:
-                    shared_state['running'] = False
+                state.stop()
                 break
 
         except Exception as e:
             print(f"[视频线程] 处理视频帧时发生错误: {e}")
             time.sleep(1)
 
-    print("[视频线程] 正在关闭...")
-    cv2.destroyAllWindows()
\ No newline at end of file
+    close_video_pipeline(mailbox, recorder, processed_count, time.monotonic() - start_time)
+    if debug_server is not None:
+        debug_stream.hub.close()
+        debug_server.shutdown()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
\ No newline at end of file
@@ -5,110 +5,124 @@ from flask import Flask, Response, send_from_directory, request
 import cv2
 import os
 import time
-import requests
 import threading
 import numpy as np
-from config import VIDEO_STREAM_URL, MIN_CONTOUR_AREA
+from config import FRAME_SOURCE, REPLAY_FPS, REPLAY_LOOP, MIN_CONTOUR_AREA
+from config import WHITE_BALANCE_INTERVAL, WHITE_BALANCE_SAMPLE_STEP, WHITE_BALANCE_BRIGHTNESS_SHIFT
+from frame_source import create_frame_source, FrameSourceError
+from frame_hub import FrameHub
+from metrics import REGISTRY, CONTENT_TYPE
+from white_balance import GreyWorldWhiteBalance
+from state import SharedState
 
 app = Flask(__name__)
 
-# 全局变量，用于从main.py接收共享状态和锁
-shared_state = {
-        "running": True,  # 明确设置启动状态
-        "bottom_forward": 0,
-        "bottom_backward": 0,
-        "bottom_left": 0,
-        "bottom_right": 0,
-        "watching_up": 0,
-        "watching_down": 0,
-        "watching_left": 0,
-        "watching_right": 0,
-        "isfiring": 0,
-        "nofiring": 1, # 默认停止发射
-        "moving": (150, 0), # 舵机初始位置
-        "bottom": 0,
-        "firing": 0, # 初始为布尔值或整数都可以，但要统一
-        "ifturn": 0,
-        "random_move": 0
-}
-
-lock = None
-
-def init_app(state, app_lock):
-    """初始化Flask应用，接收共享状态和锁"""
-    global shared_state, lock
-    shared_state = state
-    lock = app_lock
-
-def apply_white_balance(img):
+# 全局变量，用于从main.py接收共享状态
+state = SharedState()
+
+def init_app(app_state):
+    """初始化Flask应用，接收共享状态"""
+    global state
+    state = app_state
+
+
+# 上游视频流只由一个后台线程读取、解码和编码，再通过 FrameHub 广播给所有浏览器
+frame_hub = FrameHub()
+stream_worker = None
+stream_worker_lock = threading.Lock()
+viewers_gauge = REGISTRY.gauge('remote_video_viewers', "正在观看 /video_feed 的浏览器连接数")
+
+
+def run_stream_worker(hub):
     """
-    应用“灰色世界”假设的白平衡算法来校正图像色偏。
+    在一个独立线程中运行，负责读取帧源，完成解码、旋转、白平衡和编码，
+    并把编码好的 multipart 数据块发布到广播站。
     """
-    img_float = img.astype(np.float32)
-    avg_b = np.mean(img_float[:, :, 0])
-    avg_g = np.mean(img_float[:, :, 1])
-    avg_r = np.mean(img_float[:, :, 2])
-    
-    if avg_b == 0 or avg_g == 0 or avg_r == 0:
-        return img
-        
-    avg_gray = (avg_b + avg_g + avg_r) / 3
-    scale_b = avg_gray / avg_b
-    scale_g = avg_gray / avg_g
-    scale_r = avg_gray / avg_r
-
-    img_float[:, :, 0] *= scale_b
-    img_float[:, :, 1] *= scale_g
-    img_float[:, :, 2] *= scale_r
-    
-    return np.clip(img_float, 0, 255).astype(np.uint8)
-
-
-# 视频流生成器，现在它会使用全局的shared_state和lock
-def gen_video_stream():
-    print("[前端线程] 正在连接视频流...")
+    source = create_frame_source(FRAME_SOURCE, fps=REPLAY_FPS, loop=REPLAY_LOOP)
+    print(f"[视频流线程] 正在打开帧源 {source.name}...")
     try:
-        stream = requests.get(VIDEO_STREAM_URL, stream=True, timeout=10)
-        if stream.status_code != 200:
-            print(f"[前端线程] 错误：无法连接到视频流，状态码: {stream.status_code}")
-            return
-    except requests.exceptions.RequestException as e:
-        print(f"[前端线程] 错误：连接视频流失败: {e}")
-        with lock:
-            shared_state['running'] = False
+        source.open()
+    except FrameSourceError as e:
+        print(f"[视频流线程] 错误：{e}")
+        state.stop()
+        hub.close()
         return
 
-    print("[前端线程] 视频流连接成功。")
-    bytes_data = b''
-
-    # 这里使用全局变量
-    while shared_state.get('running', True):
-        try:
-            # 增加一个小的超时，避免在没有数据时永久阻塞
-            for chunk in stream.iter_content(chunk_size=1024):
-                if not shared_state.get('running', True):
-                    break
-
-                bytes_data += chunk
-                a = bytes_data.find(b'\xff\xd8')
-                b = bytes_data.find(b'\xff\xd9')
-
-                if a != -1 and b != -1:
-                    jpg = bytes_data[a:b + 2]
-                    bytes_data = bytes_data[b + 2:]
-                    if jpg:
-                        img = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
-                        img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-                        img = apply_white_balance(img)
-                        if img is not None:
-                             _, jpeg = cv2.imencode('.jpg', img)
-                             yield (b'--frame\r\n'
-                                    b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            if not shared_state.get('running', True):
+    print("[视频流线程] 帧源打开成功。")
+
+    frames_in = REGISTRY.counter('remote_frames_received_total', "从帧源收到的完整JPEG帧数")
+    frames_published = REGISTRY.counter('remote_frames_published_total', "编码后发布给浏览器的帧数")
+    decode_failures = REGISTRY.counter('remote_decode_failures_total', "解码失败的帧数")
+    stage_help = "浏览器视频流各阶段耗时（秒）"
+    stage_decode = REGISTRY.histogram('remote_stage_seconds', stage_help, {'stage': 'decode'})
+    stage_rotate = REGISTRY.histogram('remote_stage_seconds', stage_help, {'stage': 'rotate'})
+    stage_white_balance = REGISTRY.histogram('remote_stage_seconds', stage_help, {'stage': 'white_balance'})
+    stage_encode = REGISTRY.histogram('remote_stage_seconds', stage_help, {'stage': 'encode'})
+    # 白平衡增益在抽样图像上估计并缓存，每帧只做一次查表
+    white_balancer = GreyWorldWhiteBalance(
+        WHITE_BALANCE_INTERVAL, WHITE_BALANCE_SAMPLE_STEP, WHITE_BALANCE_BRIGHTNESS_SHIFT
+    )
+
+    try:
+        for jpg in source.iter_frames():
+            if not state.running:
                 break
-        except Exception as e:
-            print(f"[前端线程] 处理视频帧时发生错误: {e}")
-            break # 发生错误时跳出循环
+            frames_in.inc()
+
+            # 没有浏览器在看时只消费码流，不做解码和编码
+            if hub.viewer_count == 0:
+                continue
+            t = time.perf_counter()
+            img = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                decode_failures.inc()
+                continue
+            t = stage_decode.observe_since(t)
+            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+            t = stage_rotate.observe_since(t)
+            img = white_balancer.apply(img)
+            t = stage_white_balance.observe_since(t)
+            _, jpeg = cv2.imencode('.jpg', img)
+            stage_encode.observe_since(t)
+            frames_published.inc()
+            hub.publish(b'--frame\r\n'
+                        b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+    except Exception as e:
+        print(f"[视频流线程] 处理视频帧时发生错误: {e}")
+    finally:
+        source.close()
+        hub.close()
+    print("[视频流线程] 已停止。")
+
+
+def ensure_stream_worker():
+    """确保上游视频流线程正在运行，返回当前使用的广播站。"""
+    global frame_hub, stream_worker
+    with stream_worker_lock:
+        if stream_worker is None or not stream_worker.is_alive():
+            if frame_hub.closed:
+                frame_hub = FrameHub()
+            stream_worker = threading.Thread(
+                target=run_stream_worker, args=(frame_hub,), daemon=True
+            )
+            stream_worker.start()
+        return frame_hub
+
+
+# 视频流生成器：每个浏览器连接只等待广播站的下一帧，不再各自连接摄像头
+def gen_video_stream():
+    hub = ensure_stream_worker()
+    hub.add_viewer()
+    viewers_gauge.set(hub.viewer_count)
+    version = 0
+    try:
+        while state.running and not hub.closed:
+            version, frame = hub.wait_next(version, timeout=1.0)
+            if frame is not None:
+                yield frame
+    finally:
+        hub.remove_viewer()
+        viewers_gauge.set(hub.viewer_count)
     print("[前端线程] 视频流生成器已停止。")
 
 
@@ -116,58 +130,56 @@ def gen_video_stream():
 def video_feed():
 	return Response(gen_video_stream(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/display')
 def display():
 	html_dir = os.path.dirname(os.path.abspath(__file__))
 	return send_from_directory(html_dir, 'Display.html')
 
 
+def apply_action(user_input, action_type):
+    """根据前端的操作编号返回新的按键状态快照。"""
+    forward, backward, left, right = user_input.bottom_move
+    up, down, watch_left, watch_right = user_input.watching_move
+    # 底盘控制
+    if action_type == '0': # 前进
+        return user_input.replace(bottom_move=(1, 0, 0, 0))
+    elif action_type == '1': # 底盘左转
+        return user_input.replace(bottom_move=(0, 0, 1, 0))
+    elif action_type == '2': # 底盘右转
+        return user_input.replace(bottom_move=(0, 0, 0, 1))
+    elif action_type == '3': # 后退
+        return user_input.replace(bottom_move=(0, 1, 0, 0))
+    # 云台控制
+    elif action_type == '4': # 上升
+        return user_input.replace(watching_move=(1, 0, watch_left, watch_right))
+    elif action_type == '5': # 云台左转
+        return user_input.replace(watching_move=(up, down, 1, 0))
+    elif action_type == '6': # 云台右转
+        return user_input.replace(watching_move=(up, down, 0, 1))
+    elif action_type == '7': # 下降
+        return user_input.replace(watching_move=(0, 1, watch_left, watch_right))
+    # 激光控制
+    elif action_type == '8': # 发射
+        return user_input.replace(iffiring=(1, 0))
+    elif action_type == '9': # 停止
+        return user_input.replace(iffiring=(0, 1))
+    elif action_type == '10': # 停止所有动作
+        return user_input.replace(bottom_move=(0, 0, 0, 0))
+    return user_input
+
+
 @app.route('/action', methods=['POST'])
 def action():
-    global shared_state, lock
     data = request.get_json()
     action_type = data.get('action')
     print(f"收到前端操作: {action_type}")
 
-    with lock:
-        # 底盘控制
-        if action_type == '0': # 前进
-            shared_state['bottom_forward'] = 1
-            shared_state['bottom_backward'] = shared_state['bottom_left'] = shared_state['bottom_right'] = 0
-        elif action_type == '1': # 底盘左转
-            shared_state['bottom_left'] = 1
-            shared_state['bottom_forward'] = shared_state['bottom_backward'] = shared_state['bottom_right'] = 0
-        elif action_type == '2': # 底盘右转
-            shared_state['bottom_right'] = 1
-            shared_state['bottom_forward'] = shared_state['bottom_backward'] = shared_state['bottom_left'] = 0
-        elif action_type == '3': # 后退
-            shared_state['bottom_backward'] = 1
-            shared_state['bottom_forward'] = shared_state['bottom_left'] = shared_state['bottom_right'] = 0
-        # 云台控制
-        elif action_type == '4': # 上升
-            shared_state['watching_up'] = 1
-            shared_state['watching_down'] = 0
-        elif action_type == '5': # 云台左转
-            shared_state['watching_left'] = 1
-            shared_state['watching_right'] = 0
-        elif action_type == '6': # 云台右转
-            shared_state['watching_right'] = 1
-            shared_state['watching_left'] = 0
-        elif action_type == '7': # 下降
-            shared_state['watching_down'] = 1
-            shared_state['watching_up'] = 0
-        # 激光控制
-        elif action_type == '8': # 发射
-            shared_state['isfiring'] = 1
-            shared_state['nofiring'] = 0
-        elif action_type == '9': # 停止
-            shared_state['nofiring'] = 1
-            shared_state['isfiring'] = 0
-        elif action_type == '10': # 停止所有动作
-            shared_state['bottom_forward'] = 0
-            shared_state['bottom_backward'] = 0
-            shared_state['bottom_left'] = 0
-            shared_state['bottom_right'] = 0
+    # 在 input 槽位上做读-改-写，只与其他写按键状态的请求串行，不阻塞读取指令的线程
+    state.update('input', lambda user_input: apply_action(user_input, action_type))
 
     return '', 204
 
@@ -2,6 +2,14 @@
 
 # --- 视频流配置 ---
 VIDEO_STREAM_URL = "http://192.168.188.16:81/stream"
+STREAM_CHUNK_SIZE = 16384         # 每次从视频流读取的字节数
+MAX_JPEG_FRAME_SIZE = 512 * 1024  # 单帧JPEG的最大字节数，超出则丢弃缓冲区重新同步
+
+# 帧源：http(s) 地址为实时视频流；也可以填写 .mjpeg 录像文件或 JPEG 图片目录的路径，
+# 用于在没有摄像头的电脑上回放调试
+FRAME_SOURCE = VIDEO_STREAM_URL
+REPLAY_FPS = None    # 本地回放的帧率，None 表示以最快速度回放；带 .idx 索引的录像按录制时的时间戳回放
+REPLAY_LOOP = False  # 本地回放结束后是否从头循环
 
 # --- 蓝牙串口配置 ---
 SERIAL_PORT = "COM3"  # 请根据你的设备管理器修改
@@ -16,6 +24,12 @@ FRAME_HEIGHT = 320      # 视频帧高度
 LIGHT_CENTER = (155, 185)  # 近似激光中心点
 CENTER_TOLERANCE = 10  # 允许的中心误差范围（像素）
 
+# 白平衡增益在每隔 WHITE_BALANCE_SAMPLE_STEP 个像素抽样的图像上估计，
+# 每隔 WHITE_BALANCE_INTERVAL 帧或画面亮度变化超过 WHITE_BALANCE_BRIGHTNESS_SHIFT（相对值）时重新估计
+WHITE_BALANCE_INTERVAL = 10
+WHITE_BALANCE_SAMPLE_STEP = 4
+WHITE_BALANCE_BRIGHTNESS_SHIFT = 0.1
+
 
 # --- 舵机限位配置 ---
 
@@ -0,0 +1,63 @@
+"""Frame broadcast hub"""
+
+import threading
+
+
+class FrameHub:
+    """
+    单生产者、多消费者的最新帧广播站。
+
+    生产者每发布一帧，版本号加一并唤醒所有等待者；
+    每个消费者只需记住自己上次拿到的版本号，等待下一个版本即可。
+    消费者跟不上时会直接跳到最新帧，不会在内存里堆积旧帧。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._version = 0
+        self._viewers = 0
+        self._closed = False
+
+    @property
+    def viewer_count(self):
+        with self._cond:
+            return self._viewers
+
+    def add_viewer(self):
+        with self._cond:
+            self._viewers += 1
+
+    def remove_viewer(self):
+        with self._cond:
+            self._viewers -= 1
+
+    def publish(self, frame):
+        """发布一帧新数据并唤醒所有消费者。"""
+        with self._cond:
+            self._frame = frame
+            self._version += 1
+            self._cond.notify_all()
+
+    def wait_next(self, last_version, timeout=None):
+        """
+        阻塞等待比 last_version 更新的帧。
+        返回 (version, frame)；超时或广播站已关闭时 frame 为 None。
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._version != last_version or self._closed, timeout
+            )
+            if self._version == last_version:
+                return last_version, None
+            return self._version, self._frame
+
+    def close(self):
+        """关闭广播站，唤醒所有仍在等待的消费者。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
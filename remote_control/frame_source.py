@@ -0,0 +1,310 @@
+"""Frame source module"""
+
+import os
+import struct
+import sys
+import time
+import threading
+import http.server
+import requests
+from config import STREAM_CHUNK_SIZE, MAX_JPEG_FRAME_SIZE
+from mjpeg_parser import MjpegParser
+
+
+# 录像索引文件（recorder.MjpegRecorder 写入）中每一帧的记录格式：
+# 帧在数据文件中的偏移、长度、采集时间戳、是否检测到目标、目标坐标
+INDEX_RECORD = struct.Struct('<QIdBii')
+# 按录制时间戳回放时，相邻两帧之间最多等待的秒数；同一个文件中追加的多次录像之间可能相隔很久
+MAX_REPLAY_GAP = 2.0
+
+
+def index_path_for(path):
+    """录像数据文件对应的索引文件路径。"""
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def read_index_timestamps(path):
+    """读取录像索引中每一帧的采集时间戳；没有索引文件时返回 None。"""
+    try:
+        with open(index_path_for(path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # 录像中途退出时最后一条记录可能不完整，忽略它
+    usable = len(data) - len(data) % INDEX_RECORD.size
+    return [record[2] for record in INDEX_RECORD.iter_unpack(data[:usable])]
+
+
+class FrameSourceError(Exception):
+    """帧源无法打开时抛出。"""
+
+
+class FrameSource:
+    """
+    帧源接口。
+
+    open() 负责建立连接或打开文件，iter_frames() 依次产出完整的 JPEG 帧，
+    close() 释放资源。产出的帧可能是 memoryview，只在取下一帧之前有效。
+    iter_timed_frames() 同时产出每帧 SOI 和 EOI 的到达时刻（time.monotonic() 时钟）。
+    """
+
+    name = "frame source"
+
+    def open(self):
+        pass
+
+    def iter_frames(self):
+        raise NotImplementedError
+
+    def iter_timed_frames(self):
+        """
+        依次产出 (帧, SOI 到达时刻, EOI 到达时刻)。
+        本地回放没有传输过程，两个时刻都取这一帧被产出的时刻。
+        """
+        for jpg in self.iter_frames():
+            now = time.monotonic()
+            yield jpg, now, now
+
+    def close(self):
+        pass
+
+
+class _FramePacer:
+    """
+    按给定帧率控制产出节奏；fps 为 None 时不限速。
+    wait() 传入录制时的时间戳时，与上一帧的间隔按两帧时间戳之差计算（最多 MAX_REPLAY_GAP 秒），
+    录制时的抖动和中断因此原样重现；时间戳倒退（例如循环回放回到开头）时按帧率计算。
+    """
+
+    def __init__(self, fps):
+        self._interval = 1.0 / fps if fps else 0
+        self._next_time = None
+        self._last_timestamp = None
+
+    def wait(self, timestamp=None):
+        if not self._interval:
+            return
+        now = time.monotonic()
+        if self._next_time is None:
+            self._next_time = now
+        else:
+            interval = self._interval
+            if timestamp is not None and self._last_timestamp is not None and timestamp >= self._last_timestamp:
+                interval = min(timestamp - self._last_timestamp, MAX_REPLAY_GAP)
+            self._next_time += interval
+            if self._next_time > now:
+                time.sleep(self._next_time - now)
+        self._last_timestamp = timestamp
+
+
+class HttpMjpegSource(FrameSource):
+    """通过 HTTP 读取摄像头的实时 MJPEG 视频流。"""
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url
+        self._stream = None
+
+    def open(self):
+        try:
+            self._stream = requests.get(self.url, stream=True, timeout=10)
+        except requests.exceptions.RequestException as e:
+            raise FrameSourceError(f"连接视频流失败: {e}") from e
+        if self._stream.status_code != 200:
+            self._stream.close()
+            raise FrameSourceError(f"无法连接到视频流，状态码: {self._stream.status_code}")
+
+    def iter_frames(self):
+        for jpg, _, _ in self.iter_timed_frames():
+            yield jpg
+
+    def iter_timed_frames(self):
+        parser = MjpegParser(MAX_JPEG_FRAME_SIZE)
+        for chunk in self._iter_chunks():
+            for jpg in parser.feed(chunk, time.monotonic()):
+                yield jpg, parser.frame_soi_time, parser.frame_eoi_time
+
+    def _iter_chunks(self):
+        raw = self._stream.raw
+        # read1 直接读取底层连接，不经过 requests 按 Content-Encoding 的解压；
+        # 摄像头或代理压缩了码流（例如 gzip）时改用 iter_content，由 requests 负责解压
+        encoding = self._stream.headers.get('Content-Encoding', 'identity').strip().lower()
+        if not hasattr(raw, 'read1') or encoding not in ('', 'identity'):
+            yield from self._stream.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            return
+        # iter_content 要凑满一个数据块才返回，一帧的结尾会被压到下一帧的数据到达时才交出；
+        # read1 有多少数据就返回多少，帧的到达时刻也因此更准确
+        while True:
+            chunk = raw.read1(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+
+class MjpegFileSource(FrameSource):
+    """
+    回放录制好的 .mjpeg 文件。
+    fps 为 None 时以最快速度读取（用于测量吞吐量）。否则按原速回放：有 MjpegRecorder 写入的 .idx 索引时
+    按其中记录的采集时间戳之差控制每帧的间隔，重现录制时的抖动和中断；没有索引（或索引比录像短）时按 fps 回放。
+    """
+
+    def __init__(self, path, fps=None, loop=False):
+        self.path = path
+        self.name = path
+        self.fps = fps
+        self.loop = loop
+        self._file = None
+        self.timestamps = None  # 索引中每一帧的采集时间戳，没有索引时为 None
+
+    def open(self):
+        try:
+            self._file = open(self.path, 'rb')
+            self.timestamps = read_index_timestamps(self.path)
+        except OSError as e:
+            raise FrameSourceError(f"无法打开录像文件: {e}") from e
+
+    def iter_frames(self):
+        pacer = _FramePacer(self.fps)
+        timestamps = self.timestamps or ()
+        while True:
+            parser = MjpegParser(MAX_JPEG_FRAME_SIZE)
+            self._file.seek(0)
+            index = 0
+            while True:
+                chunk = self._file.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                for jpg in parser.feed(chunk):
+                    # 录像数据文件和索引按相同的顺序逐帧追加，第 index 帧对应第 index 条记录
+                    pacer.wait(timestamps[index] if index < len(timestamps) else None)
+                    index += 1
+                    yield jpg
+            if not self.loop:
+                return
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class JpegDirectorySource(FrameSource):
+    """按文件名顺序回放一个目录中的 JPEG 图片。"""
+
+    def __init__(self, directory, fps=None, loop=False):
+        self.directory = directory
+        self.name = directory
+        self.fps = fps
+        self.loop = loop
+        self._paths = []
+
+    def open(self):
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError as e:
+            raise FrameSourceError(f"无法读取图片目录: {e}") from e
+        self._paths = [
+            os.path.join(self.directory, name) for name in names
+            if name.lower().endswith(('.jpg', '.jpeg'))
+        ]
+        if not self._paths:
+            raise FrameSourceError(f"目录中没有 JPEG 图片: {self.directory}")
+
+    def iter_frames(self):
+        pacer = _FramePacer(self.fps)
+        while True:
+            for path in self._paths:
+                with open(path, 'rb') as f:
+                    jpg = f.read()
+                pacer.wait()
+                yield jpg
+            if not self.loop:
+                return
+
+
+def create_frame_source(spec, fps=None, loop=False):
+    """
+    根据描述创建帧源：
+    http(s):// 开头为实时视频流，目录为 JPEG 图片序列，其他视为 .mjpeg 录像文件。
+    fps 和 loop 只对本地回放生效。
+    """
+    if spec.startswith(('http://', 'https://')):
+        return HttpMjpegSource(spec)
+    if os.path.isdir(spec):
+        return JpegDirectorySource(spec, fps=fps, loop=loop)
+    return MjpegFileSource(spec, fps=fps, loop=loop)
+
+
+class MjpegReplayServer:
+    """
+    一个极简的本地 MJPEG HTTP 服务器，把录像文件按给定帧率循环推流，
+    行为与 ESP32 摄像头的 /stream 接口一致，可以在没有摄像头的电脑上跑通整套程序。
+    """
+
+    def __init__(self, path, fps=25, host='127.0.0.1', port=8081):
+        replay_path = path
+        replay_fps = fps
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                source = create_frame_source(replay_path, fps=replay_fps, loop=True)
+                try:
+                    source.open()
+                except FrameSourceError as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                try:
+                    for jpg in source.iter_frames():
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n'
+                                         b'Content-Length: %d\r\n\r\n' % len(jpg))
+                        self.wfile.write(jpg)
+                        self.wfile.write(b'\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    source.close()
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/stream"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    # 用法: python frame_source.py <录像文件或图片目录> [帧率] [端口]
+    if len(sys.argv) < 2:
+        print("用法: python frame_source.py <录像文件或图片目录> [帧率] [端口]")
+        sys.exit(1)
+    server = MjpegReplayServer(
+        sys.argv[1],
+        fps=float(sys.argv[2]) if len(sys.argv) > 2 else 25,
+        port=int(sys.argv[3]) if len(sys.argv) > 3 else 8081,
+    )
+    server.start()
+    print(f"[回放服务器] 正在推流: {server.url}，按 Ctrl+C 退出。")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -4,39 +4,23 @@ from bluetooth_communicator import run_bluetooth_communication
 from remote_control import run_remote_control
 # 导入修改后的模块中的新函数
 from Html_Processor import init_app, run_app
+from state import SharedState, Command
 
 if __name__ == "__main__":
-    # 创建用于线程间通信的共享状态字典和锁
-    shared_state = {
-        "running": True,  # 明确设置启动状态
-        "bottom_forward": 0,
-        "bottom_backward": 0,
-        "bottom_left": 0,
-        "bottom_right": 0,
-        "watching_up": 0,
-        "watching_down": 0,
-        "watching_left": 0,
-        "watching_right": 0,
-        "isfiring": 0,
-        "nofiring": 1, # 默认停止发射
-        "moving": (0, 0), # 舵机初始位置
-        "bottom": 0,
-        "firing": 0, # 初始为布尔值或整数都可以，但要统一
-        "ifturn": 0,
-        "random_move": 0
-    }
-    lock = threading.Lock()
+    # 创建用于线程间通信的共享状态：网页端发布按键状态，遥控线程发布指令，读者不需要加锁
+    # 按键默认全部松开、停止发射；舵机初始位置为 (0, 0)
+    state = SharedState(command=Command(moving=(0, 0), firing=0, ifturn=0, random_move=0))
 
     # --- 关键修改 ---
-    # 在启动Flask线程之前，初始化它，将共享状态和锁传递进去
-    init_app(shared_state, lock)
+    # 在启动Flask线程之前，初始化它，将共享状态传递进去
+    init_app(state)
 
     # 创建线程
     bluetooth_thread = threading.Thread(
-        target=run_bluetooth_communication, args=(shared_state, lock)
+        target=run_bluetooth_communication, args=(state,)
     )
     remote_control_thread = threading.Thread(
-        target=run_remote_control, args=(shared_state, lock)
+        target=run_remote_control, args=(state,)
     )
     # 线程目标修改为 run_app，而不是 gen_video_stream
     html_processor_thread = threading.Thread(
@@ -60,18 +44,16 @@ if __name__ == "__main__":
     print("[主程序] 在终端按 Ctrl+C 即可退出程序。")
 
     try:
-        while shared_state["running"]:
+        while state.running:
             if not bluetooth_thread.is_alive() or not remote_control_thread.is_alive():
                 print("[主程序] 检测到核心线程已退出，正在关闭程序...")
-                with lock:
-                    shared_state["running"] = False
+                state.stop()
                 break
             time.sleep(0.5)  # 短暂休眠以降低CPU占用
 
     except KeyboardInterrupt:
         print("\n[主程序] 检测到 Ctrl+C，正在通知所有线程关闭...")
-        with lock:
-            shared_state["running"] = False
+        state.stop()
 
     finally:
         print("[主程序] 等待子线程结束...")
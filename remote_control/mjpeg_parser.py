@@ -0,0 +1,127 @@
+"""MJPEG stream parser"""
+
+SOI_MARKER = b'\xff\xd8'
+EOI_MARKER = b'\xff\xd9'
+
+
+class MjpegParser:
+    """
+    增量式 MJPEG 帧解析器。
+
+    内部使用一块固定大小的 bytearray 作为缓冲区，并记住上一次扫描到的位置，
+    因此每个字节只被拷贝一次、扫描一次，不会再出现 `bytes_data += chunk`
+    带来的二次方拷贝和从头重复查找。
+
+    feed() 产出的帧是指向内部缓冲区的 memoryview，可以直接交给
+    np.frombuffer / cv2.imdecode 使用而无需切片拷贝。
+    注意：这些 memoryview 只在产出下一帧或下一次调用 feed() 之前有效，
+    如需长期保存请先用 bytes(frame) 拷贝一份。
+
+    一帧还没有 EOI 就出现了下一个 SOI 时，说明这一帧在传输中被截断，丢弃它并从新的 SOI 重新开始，
+    而不是把两段拼成一幅损坏的 JPEG。
+
+    feed() 时传入数据块的到达时刻，每产出一帧，frame_soi_time / frame_eoi_time
+    即为这一帧的 SOI / EOI 所在数据块的到达时刻。
+    """
+
+    def __init__(self, max_frame_size):
+        # 缓冲区大小即为单帧大小的硬上限
+        self._buf = bytearray(max_frame_size)
+        self._view = memoryview(self._buf)
+        self._capacity = max_frame_size
+        self._start = 0      # 尚未消费数据的起点
+        self._end = 0        # 已写入数据的终点
+        self._scan_pos = 0   # 下一次查找标记的起点
+        self._soi = -1       # 当前帧 SOI 的位置，-1 表示还未找到
+        self._chunk_time = None  # 正在处理的数据块的到达时刻
+        self._soi_time = None    # 当前帧 SOI 所在数据块的到达时刻
+        self.frame_soi_time = None  # 最近产出的一帧的 SOI 到达时刻
+        self.frame_eoi_time = None  # 最近产出的一帧的 EOI 到达时刻
+
+        self.frame_count = 0   # 成功切分出的帧数
+        self.resync_count = 0  # 因单帧超出上限而丢弃缓冲区的次数
+        self.truncated_count = 0  # 没有 EOI 就出现下一个 SOI 而被丢弃的残帧数
+
+    def reset(self):
+        """丢弃缓冲区中所有未完成的数据。"""
+        self._start = self._end = self._scan_pos = 0
+        self._soi = -1
+
+    def feed(self, chunk, timestamp=None):
+        """
+        写入一段新数据，并依次产出其中所有完整的 JPEG 帧。
+        timestamp 为这段数据的到达时刻。
+        """
+        self._chunk_time = timestamp
+        chunk_view = memoryview(chunk)
+        # 缓冲区放不下整个数据块时分段写入，每写入一段就切出其中完整的帧，
+        # 当前帧的 EOI 和下一帧的开头落在同一个数据块中时，当前帧不会因此被丢弃
+        offset = 0
+        while offset < len(chunk_view):
+            offset += self._append(chunk_view[offset:])
+            yield from self._extract_frames()
+
+    def _append(self, data):
+        """写入 data 中缓冲区放得下的部分，返回写入的字节数。"""
+        if self._end == self._capacity:
+            self._compact()
+        if self._end == self._capacity:
+            # 搬移后缓冲区中只剩当前帧自 SOI 起的数据，占满整个缓冲区仍没有 EOI，
+            # 说明单帧超出上限，码流很可能已经损坏：丢弃这一帧并从后续数据中重新寻找 SOI
+            self.resync_count += 1
+            self.reset()
+        size = min(len(data), self._capacity - self._end)
+        self._view[self._end:self._end + size] = data[:size]
+        self._end += size
+        return size
+
+    def _compact(self):
+        """把未消费的数据搬到缓冲区开头，只拷贝残留的半帧。"""
+        if self._start == 0:
+            return
+        remaining = self._end - self._start
+        self._view[:remaining] = self._buf[self._start:self._end]
+        self._scan_pos -= self._start
+        if self._soi >= 0:
+            self._soi -= self._start
+        self._start = 0
+        self._end = remaining
+
+    def _extract_frames(self):
+        buf = self._buf
+        while True:
+            if self._soi < 0:
+                soi = buf.find(SOI_MARKER, self._scan_pos, self._end)
+                if soi < 0:
+                    # 帧与帧之间的 multipart 头部可以直接丢弃，
+                    # 只保留最后一个字节，以防标记被拆在两个数据块之间
+                    self._start = max(self._start, self._end - 1)
+                    self._scan_pos = self._start
+                    return
+                self._soi = soi
+                self._soi_time = self._chunk_time
+                self._start = soi
+                self._scan_pos = soi + 2
+
+            eoi = buf.find(EOI_MARKER, self._scan_pos, self._end)
+            restart = buf.find(SOI_MARKER, self._scan_pos, self._end if eoi < 0 else eoi)
+            if restart >= 0:
+                # 当前帧被截断：丢弃已缓存的部分，从新的 SOI 开始
+                self.truncated_count += 1
+                self._soi = restart
+                self._soi_time = self._chunk_time
+                self._start = restart
+                self._scan_pos = restart + 2
+                continue
+            if eoi < 0:
+                self._scan_pos = max(self._soi + 2, self._end - 1)
+                return
+
+            frame_end = eoi + 2
+            frame = self._view[self._soi:frame_end]
+            self._soi = -1
+            self._start = self._scan_pos = frame_end
+            self.frame_count += 1
+            self.frame_soi_time = self._soi_time
+            self.frame_eoi_time = self._chunk_time
+            yield frame
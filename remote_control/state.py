@@ -0,0 +1,130 @@
+"""Shared state module"""
+
+import threading
+
+
+class Snapshot:
+    """
+    不可变的状态快照基类。子类在 __slots__ 中列出字段，在 _defaults 中给出各字段的默认值。
+
+    快照创建后不能修改，需要改变时用 replace() 生成一个新的快照，再整体替换 SharedState 中的引用，
+    读者拿到的引用因此总是一个完整、一致的状态。字段的值本身也应是不可变的（数字、元组、None）。
+    """
+
+    __slots__ = ()
+    _defaults = {}
+
+    def __init__(self, **fields):
+        defaults = self._defaults
+        if len(fields) > len(defaults) or not fields.keys() <= defaults.keys():
+            raise TypeError(f"{type(self).__name__} 没有字段: {', '.join(fields.keys() - defaults.keys())}")
+        set_field = object.__setattr__
+        for name, default in defaults.items():
+            set_field(self, name, fields.get(name, default))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} 是不可变的快照，请使用 replace() 生成新的快照")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} 是不可变的快照")
+
+    def replace(self, **changes):
+        """返回修改了指定字段的新快照，原快照不变。"""
+        if not changes.keys() <= self._defaults.keys():
+            raise TypeError(f"{type(self).__name__} 没有字段: {', '.join(changes.keys() - self._defaults.keys())}")
+        new = object.__new__(type(self))
+        set_field = object.__setattr__
+        for name in self.__slots__:
+            set_field(new, name, changes[name] if name in changes else getattr(self, name))
+        return new
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class Command(Snapshot):
+    """
+    中控线程（或遥控线程）发给蓝牙线程的云台指令：
+    舵机位置 moving、是否开火 firing、转向标志 ifturn、巡航/底盘标志 random_move。
+    中控线程还附带滤波器的位置估计 track_prediction（供视频线程缩小搜索范围）
+    和最近一次用于更新的测量的曝光时刻 measurement_time。
+    """
+
+    __slots__ = ('moving', 'firing', 'ifturn', 'random_move', 'track_prediction', 'measurement_time')
+    _defaults = {
+        'moving': (0, 0),
+        'firing': False,
+        'ifturn': 0,
+        'random_move': False,
+        'track_prediction': None,
+        'measurement_time': None,
+    }
+
+
+class Detection(Snapshot):
+    """视频线程每帧发布的检测结果：多目标模式下本帧匹配上检测的轨迹，以及这一帧的曝光时刻。"""
+
+    __slots__ = ('tracks', 'frame_time')
+    _defaults = {'tracks': (), 'frame_time': None}
+
+
+class Input(Snapshot):
+    """
+    网页遥控端的按键状态：底盘 (前进, 后退, 左转, 右转)、云台 (上升, 下降, 左转, 右转)
+    和激光 (发射, 停止)，每一位为 0 或 1。
+    """
+
+    __slots__ = ('bottom_move', 'watching_move', 'iffiring')
+    _defaults = {
+        'bottom_move': (0, 0, 0, 0),
+        'watching_move': (0, 0, 0, 0),
+        'iffiring': (0, 1),
+    }
+
+
+class SharedState:
+    """
+    线程间共享的状态。每个生产者一个槽位（command、detection、input），槽位中是不可变快照。
+
+    发布就是替换槽位中的引用，这在 CPython 中是原子操作：读者直接读取属性，从不阻塞，
+    也不会读到只更新了一半的指令。同一个槽位有多个写者（例如多个网页请求和消费按键的遥控线程）时
+    用 update() 做读-改-写：新快照在锁外生成，锁内只确认槽位没有被其他写者改过再替换引用，
+    写者之间按槽位串行且持锁时间极短，不影响读者和其他槽位。
+    running 为 False 时所有线程退出。
+    """
+
+    __slots__ = ('running', 'command', 'detection', 'input', '_write_locks')
+
+    def __init__(self, command=None, detection=None, user_input=None):
+        self.running = True
+        self.command = command if command is not None else Command()
+        self.detection = detection if detection is not None else Detection()
+        self.input = user_input if user_input is not None else Input()
+        self._write_locks = {name: threading.Lock() for name in ('command', 'detection', 'input')}
+
+    def update(self, name, func):
+        """
+        用 func(当前快照) 生成新快照并发布到槽位 name，返回 (旧快照, 新快照)。
+        生成期间槽位被其他写者替换时用最新的快照重新生成，因此 func 不应有副作用。
+        """
+        lock = self._write_locks[name]
+        while True:
+            old = getattr(self, name)
+            new = func(old)
+            with lock:
+                if getattr(self, name) is old:
+                    setattr(self, name, new)
+                    return old, new
+
+    def stop(self):
+        """通知所有线程退出。"""
+        self.running = False
@@ -0,0 +1,80 @@
+"""Grey-world white balance module"""
+
+import cv2
+import numpy as np
+
+_LEVELS = np.arange(256, dtype=np.float32).reshape(1, 256, 1)
+
+
+def grey_world_gains(img, step=1):
+    """
+    按“灰色世界”假设估计 B、G、R 三个通道的增益，step 大于 1 时只在每隔 step 行、step 列的像素上统计。
+    某个通道均值为 0 时无法校正，返回 None。
+    """
+    sample = img[::step, ::step] if step > 1 else img
+    means = np.array(cv2.mean(sample)[:3], np.float32)
+    if not means.all():
+        return None
+    return means.mean(dtype=np.float32) / means
+
+
+def gain_lut(gains):
+    """
+    由三个通道的增益生成 cv2.LUT 使用的 (1, 256, 3) 查找表。
+    与逐像素的 float32 乘法、截断到 [0, 255] 再取整的结果完全一致。
+    """
+    return np.clip(_LEVELS * np.asarray(gains, np.float32), 0, 255).astype(np.uint8)
+
+
+def _brightness(img, step):
+    return sum(cv2.mean(img[::step, ::step])[:3]) / 3
+
+
+class GreyWorldWhiteBalance:
+    """
+    带增益缓存的灰色世界白平衡。
+
+    增益在抽样后的图像上估计，每隔 interval 帧或画面整体亮度相对上次估计时
+    变化超过 brightness_shift 时才重新估计；校正通过每个通道一张 uint8 查找表一次完成，
+    不需要把整幅图像转换成浮点数。
+    interval=1、step=1 时与逐帧在整幅图像上计算的灰色世界白平衡逐像素一致。
+    """
+
+    def __init__(self, interval=10, step=4, brightness_shift=0.1):
+        self.interval = interval
+        self.step = step
+        self.brightness_shift = brightness_shift
+        self.gains = None
+        self._lut = None
+        self._brightness = None
+        self._frames_since_update = 0
+
+    def reset(self):
+        """丢弃缓存的增益，下一帧重新估计。"""
+        self.gains = None
+        self._lut = None
+        self._brightness = None
+        self._frames_since_update = 0
+
+    def _needs_update(self, img):
+        if self._brightness is None or self._frames_since_update >= self.interval:
+            return True
+        # 用比估计增益时更稀疏的抽样检查亮度，开销可以忽略
+        brightness = _brightness(img, self.step * 4)
+        return abs(brightness - self._brightness) > self.brightness_shift * max(self._brightness, 1.0)
+
+    def apply(self, img, out=None):
+        """对一幅 BGR 图像做白平衡，结果写入 out（省略时新分配）。无法估计增益时原样返回 img。"""
+        if self._needs_update(img):
+            gains = grey_world_gains(img, self.step)
+            self._brightness = _brightness(img, self.step * 4)
+            self._frames_since_update = 0
+            if gains is None:
+                self.gains = self._lut = None
+            elif self.gains is None or not np.array_equal(gains, self.gains):
+                self.gains = gains
+                self._lut = gain_lut(gains)
+        self._frames_since_update += 1
+        if self._lut is None:
+            return img
+        return cv2.LUT(img, self._lut, dst=out)